@@ -1,83 +1,263 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file, g
 import os
-import json
+import io
+import time
 import datetime
-import re
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.lib import colors
+from historico_log import ler_registros, migrar_historico_json
+from receita_pdf import gerar_pdf_receita, formatar_cep
+from cep import consultar_cep
+import fila_receitas
+import metricas
 
 app = Flask(__name__)
 
-# --- Insira aqui as funções auxiliares e a função de gerar_pdf_receita do seu código original ---
+HISTORICO_ARQUIVO = "historico_receitas.jsonl"
+HISTORICO_ARQUIVO_ANTIGO = "historico_receitas.json"
+
+# Perfil usado nas receitas da API. As imagens vêm da configuração do servidor;
+# nome, CRMV e SIPEAGRO podem ser enviados em cada requisição.
+PERFIL_API = {
+    "imagem_fundo": os.environ.get("RECEITA_IMAGEM_FUNDO") or None,
+    "imagem_assinatura": os.environ.get("RECEITA_IMAGEM_ASSINATURA") or None,
+    "nome_vet": os.environ.get("RECEITA_NOME_VET") or None,
+    "crmv": os.environ.get("RECEITA_CRMV") or None,
+    "sipeagro": os.environ.get("RECEITA_SIPEAGRO") or None,
+    "mostrar_sipeagro": bool(os.environ.get("RECEITA_SIPEAGRO")),
+}
+CAMPOS_PERFIL_REQUISICAO = ("nome_vet", "crmv", "sipeagro", "mostrar_sipeagro")
+
+FILA_ESPERA_MAXIMA = float(os.environ.get("FILA_ESPERA_MAXIMA", "25"))  # long-poll, abaixo do timeout do gunicorn
+FILA_RETRY_AFTER = int(os.environ.get("FILA_RETRY_AFTER", "5"))         # segundos sugeridos com a fila cheia
+PDF_MAX_AGE = int(os.environ.get("PDF_MAX_AGE", str(24 * 3600)))        # cache do PDF pronto no navegador
+
+
+def _dados_receita(data):
+    """Parâmetros de gerar_pdf_receita a partir do corpo JSON da requisição."""
+    dados_receita = dict(
+        tipo_farmacia="Farmácia Veterinária",
+        paciente=data.get("paciente", ""),
+        tutor=data.get("tutor", ""),
+        cpf=data.get("cpf", ""),
+        rg=data.get("rg", ""),
+        endereco_formatado=data.get("endereco_formatado", ""),
+        especie_raca=data.get("especie_raca", ""),
+        pelagem=data.get("pelagem", ""),
+        peso=data.get("peso", ""),
+        idade=data.get("idade", ""),
+        sexo=data.get("sexo", ""),
+        chip=data.get("chip", ""),
+        lista_medicamentos=data.get("lista_medicamentos", []),
+        instrucoes_uso=data.get("instrucoes_uso", ""),
+        data_receita=data.get("data_receita", datetime.datetime.now().strftime("%d/%m/%Y")),
+        **PERFIL_API
+    )
+    dados_receita.update({k: data[k] for k in CAMPOS_PERFIL_REQUISICAO if k in data})
+    return dados_receita
+
+
+def _preencher_endereco(dados_receita, data):
+    """
+    Sem endereco_formatado mas com "cep" (e "numero"/"complemento"), monta o
+    endereço como a tela do Streamlit, consultando o CEP (cep.py, com cache).
+    Retorna a resposta de erro, ou None se deu certo ou não havia CEP.
+    """
+    if dados_receita["endereco_formatado"] or not data.get("cep"):
+        return None
+    try:
+        endereco = consultar_cep(data["cep"])
+    except Exception as e:
+        return jsonify({"error": f"Consulta de CEP indisponível: {e}"}), 503
+    if not endereco:
+        return jsonify({"error": "CEP não encontrado."}), 422
+    texto = (f"{endereco.get('logradouro', '')}, {data.get('numero', '')}, "
+             f"{endereco.get('bairro', '')}, {endereco.get('localidade', '')}-{endereco.get('uf', '')}")
+    if data.get("complemento"):
+        texto += f" (Compl.: {data['complemento']})"
+    dados_receita["endereco_formatado"] = texto + f" - CEP: {formatar_cep(data['cep'])}"
+    return None
+
+
+# ----------------------------------------------
+# MÉTRICAS (ver metricas.py)
+# ----------------------------------------------
+
+@app.before_request
+def _iniciar_medicao():
+    metricas.iniciar()
+    g.inicio_requisicao = time.perf_counter()
+
+
+@app.after_request
+def _registrar_medicao(resposta):
+    inicio = g.pop("inicio_requisicao", None)
+    if inicio is not None:
+        # A rota é o padrão (ex.: /receitas/<job_id>), não a URL, para não criar uma série por pedido
+        rota = request.url_rule.rule if request.url_rule else "desconhecida"
+        metricas.registrar_requisicao(rota, request.method, resposta.status_code, time.perf_counter() - inicio)
+    return resposta
+
+
+@app.route('/metrics', methods=['GET'])
+def exibir_metricas():
+    """Métricas no formato de texto do Prometheus, somadas entre os workers."""
+    return app.response_class(
+        metricas.exposicao(historico=HISTORICO_ARQUIVO),
+        mimetype="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 
 @app.route('/criar_receita', methods=['POST'])
 def criar_receita():
     try:
         data = request.json
-        
-        # Extrair dados do corpo da requisição
-        paciente = data.get("paciente", "")
-        tutor = data.get("tutor", "")
-        cpf = data.get("cpf", "")
-        rg = data.get("rg", "")
-        endereco_formatado = data.get("endereco_formatado", "")
-        especie_raca = data.get("especie_raca", "")
-        pelagem = data.get("pelagem", "")
-        peso = data.get("peso", "")
-        idade = data.get("idade", "")
-        sexo = data.get("sexo", "")
-        chip = data.get("chip", "")
-        lista_medicamentos = data.get("lista_medicamentos", [])
-        instrucoes_uso = data.get("instrucoes_uso", "")
-        data_receita = data.get("data_receita", datetime.datetime.now().strftime("%d/%m/%Y"))
-        
-        nome_arquivo_pdf = f"{paciente} - {cpf}.pdf"
+        dados_receita = _dados_receita(data)
+        erro = _preencher_endereco(dados_receita, data)
+        if erro:
+            return erro
+
+        nome_arquivo_pdf = f"{dados_receita['paciente']} - {dados_receita['cpf']}.pdf"
+        # formato=pdf devolve o próprio PDF na resposta, gerado em memória (sem gravar em Receitas/)
+        em_memoria = request.args.get("formato", data.get("formato", "")) == "pdf"
+
+        if em_memoria:
+            pdf_bytes = gerar_pdf_receita(nome_pdf=nome_arquivo_pdf, em_memoria=True, usar_timbrado=True, **dados_receita)
+            return send_file(
+                io.BytesIO(pdf_bytes),
+                mimetype="application/pdf",
+                as_attachment=True,
+                download_name=nome_arquivo_pdf
+            ), 201
+
         caminho_pdf = os.path.join("Receitas", nome_arquivo_pdf)
-        
         os.makedirs("Receitas", exist_ok=True)
 
         # Gerar PDF
-        gerar_pdf_receita(
-            nome_pdf=caminho_pdf,
-            tipo_farmacia="Farmácia Veterinária",
-            paciente=paciente,
-            tutor=tutor,
-            cpf=cpf,
-            rg=rg,
-            endereco_formatado=endereco_formatado,
-            especie_raca=especie_raca,
-            pelagem=pelagem,
-            peso=peso,
-            idade=idade,
-            sexo=sexo,
-            chip=chip,
-            lista_medicamentos=lista_medicamentos,
-            instrucoes_uso=instrucoes_uso,
-            data_receita=data_receita
-        )
+        gerar_pdf_receita(nome_pdf=caminho_pdf, usar_timbrado=True, **dados_receita)
 
         return jsonify({"message": "Receita criada com sucesso!", "file_path": caminho_pdf}), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+# ----------------------------------------------
+# FILA: GERAÇÃO ASSÍNCRONA (ver fila_receitas.py)
+# ----------------------------------------------
+
+def _situacao_receita(job):
+    resposta = {
+        "id": job["id"],
+        "status": job["status"],
+        "criado": job["criado"],
+        "concluido": job["concluido"],
+    }
+    if job["status"] == fila_receitas.PENDENTE:
+        resposta["posicao"] = fila_receitas.posicao(job["id"])
+    if job["status"] == fila_receitas.CONCLUIDO:
+        resposta["tamanho"] = job["tamanho"]
+        resposta["pdf"] = f"/receitas/{job['id']}.pdf"
+    if job["status"] == fila_receitas.ERRO:
+        resposta["error"] = job["erro"]
+    return resposta
+
+
+@app.route('/receitas', methods=['POST'])
+def enfileirar_receita():
+    """Enfileira a receita e responde na hora (202) com o id para consulta."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Corpo JSON com os dados da receita é obrigatório."}), 400
+    dados_receita = _dados_receita(data)
+    erro = _preencher_endereco(dados_receita, data)
+    if erro:
+        return erro
+    nome_arquivo_pdf = f"{dados_receita['paciente']} - {dados_receita['cpf']}.pdf"
+    try:
+        job_id = fila_receitas.enfileirar(dados_receita, nome_arquivo=nome_arquivo_pdf)
+    except fila_receitas.FilaCheia as e:
+        resposta = jsonify({"error": str(e)})
+        resposta.headers["Retry-After"] = str(FILA_RETRY_AFTER)
+        return resposta, 503
+    resposta = jsonify({"id": job_id, "status": fila_receitas.PENDENTE, "url": f"/receitas/{job_id}"})
+    resposta.headers["Location"] = f"/receitas/{job_id}"
+    return resposta, 202
+
+
+def _enviar_pdf(job):
+    """
+    PDF pronto da fila direto do disco. Com conditional=True o Werkzeug responde
+    If-None-Match/If-Modified-Since com 304 e pedidos Range com 206 (retomar um
+    download interrompido). O arquivo vai por wsgi.file_wrapper, que o gunicorn
+    envia com sendfile(), sem copiar os bytes para o Python.
+    """
+    if not job["arquivo"] or not os.path.exists(job["arquivo"]):
+        return jsonify({"error": "O PDF desta receita não está mais disponível."}), 404
+    # Caminho absoluto: o Flask resolve caminhos relativos pela pasta do app, não pela pasta de trabalho.
+    resposta = send_file(
+        os.path.abspath(job["arquivo"]),
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name=job["nome_arquivo"] or f"{job['id']}.pdf",
+        conditional=True,
+        etag=True,
+        max_age=PDF_MAX_AGE
+    )
+    # O PDF de um pedido nunca muda depois de pronto; dados de paciente não vão para caches compartilhados.
+    resposta.cache_control.public = False
+    resposta.cache_control.private = True
+    resposta.cache_control.immutable = True
+    return resposta
+
+
+@app.route('/receitas/<job_id>', methods=['GET'])
+def consultar_receita(job_id):
+    """
+    Situação do pedido. ?esperar=N segura a resposta por até N segundos enquanto
+    a receita não termina (long-poll); ?formato=pdf devolve o PDF quando pronto.
+    """
+    try:
+        esperar = min(float(request.args.get("esperar", 0)), FILA_ESPERA_MAXIMA)
+    except ValueError:
+        return jsonify({"error": "Parâmetro 'esperar' inválido."}), 400
+    fila_receitas.iniciar()
+    job = fila_receitas.aguardar(job_id, esperar) if esperar > 0 else fila_receitas.obter(job_id)
+    if job is None:
+        return jsonify({"error": "Receita não encontrada."}), 404
+
+    if request.args.get("formato") == "pdf" and job["status"] == fila_receitas.CONCLUIDO:
+        return _enviar_pdf(job)
+    # 202 enquanto não terminou, para o cliente saber que deve consultar de novo
+    codigo = 200 if job["status"] in fila_receitas.FINAIS else 202
+    return jsonify(_situacao_receita(job)), codigo
+
+
+@app.route('/receitas/<job_id>.pdf', methods=['GET'])
+def baixar_receita(job_id):
+    """Download do PDF (ETag, 304 e Range). Enquanto não estiver pronto responde 202 com a situação."""
+    job = fila_receitas.obter(job_id)
+    if job is None:
+        return jsonify({"error": "Receita não encontrada."}), 404
+    if job["status"] == fila_receitas.CONCLUIDO:
+        return _enviar_pdf(job)
+    if job["status"] == fila_receitas.ERRO:
+        return jsonify(_situacao_receita(job)), 422
+    resposta = jsonify(_situacao_receita(job))
+    resposta.headers["Retry-After"] = "1"
+    return resposta, 202
+
+
 @app.route('/ver_historico', methods=['GET'])
 def ver_historico():
-    historico_arquivo = "historico_receitas.json"
-    if not os.path.exists(historico_arquivo):
+    migrar_historico_json(HISTORICO_ARQUIVO_ANTIGO, HISTORICO_ARQUIVO)
+    if not os.path.exists(HISTORICO_ARQUIVO):
         return jsonify({"message": "Nenhum histórico encontrado."}), 404
     try:
-        with open(historico_arquivo, "r", encoding="utf-8") as f:
-            historico = json.load(f)
+        historico = ler_registros(HISTORICO_ARQUIVO)
         return jsonify(historico), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    import os
-
 if __name__ == "__main__":
+    metricas.limpar()
     port = int(os.environ.get("PORT", 5000))  # Use a porta definida pela variável de ambiente ou 5000 como padrão
     app.run(host="0.0.0.0", port=port)
 
@@ -0,0 +1,131 @@
+import os
+import json
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# ----------------------------------------------
+# GRAVAÇÃO ATÔMICA E TRAVA DE ARQUIVOS
+# ----------------------------------------------
+# Base para os arquivos compartilhados entre sessões do Streamlit e entre
+# processos (users.json, logs de histórico, imagens do perfil):
+#   - gravar_atomico: escreve em um temporário na mesma pasta, faz fsync e
+#     renomeia por cima do destino. Quem lê vê o arquivo antigo ou o novo,
+#     nunca um arquivo pela metade, mesmo se o processo cair no meio;
+#   - trava_arquivo: trava exclusiva em "<arquivo>.lock" (fcntl.flock no
+#     Linux/macOS, msvcrt.locking no Windows) somada a uma trava de thread,
+#     para proteger cada leitura-alteração-gravação contra escritas simultâneas.
+
+_lock = threading.Lock()
+_travas_thread = {}  # caminho absoluto -> threading.Lock
+
+
+def _trava_thread(caminho):
+    with _lock:
+        trava = _travas_thread.get(caminho)
+        if trava is None:
+            trava = _travas_thread[caminho] = threading.Lock()
+        return trava
+
+
+def _garantir_pasta(caminho):
+    pasta = os.path.dirname(caminho)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta, exist_ok=True)
+    return pasta or "."
+
+
+@contextmanager
+def trava_arquivo(caminho):
+    """Trava exclusiva (entre threads e entre processos) associada ao arquivo."""
+    caminho = os.path.abspath(caminho)
+    _garantir_pasta(caminho)
+    with _trava_thread(caminho):
+        fd = os.open(caminho + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                # LK_LOCK tenta por ~10 s antes de desistir; repete até conseguir.
+                os.lseek(fd, 0, os.SEEK_SET)
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+
+def _fsync_pasta(pasta):
+    # Garante que o rename em si sobreviva a uma queda (não existe no Windows).
+    if os.name != "posix":
+        return
+    fd = os.open(pasta, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def gravar_atomico(caminho, escrever, modo="wb", encoding=None):
+    """
+    Grava o arquivo de forma atômica. escrever(f) recebe o arquivo temporário
+    aberto em `modo`; se levantar exceção, o destino fica intacto.
+    """
+    pasta = _garantir_pasta(caminho)
+    fd, temporario = tempfile.mkstemp(prefix="." + os.path.basename(caminho) + ".", suffix=".tmp", dir=pasta)
+    try:
+        with os.fdopen(fd, modo, encoding=encoding) as f:
+            escrever(f)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp cria com permissão 0600; mantém a do arquivo substituído.
+        try:
+            os.chmod(temporario, os.stat(caminho).st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(temporario, 0o644)
+        os.replace(temporario, caminho)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    _fsync_pasta(pasta)
+
+
+def gravar_bytes_atomico(caminho, dados):
+    gravar_atomico(caminho, lambda f: f.write(dados))
+
+
+def gravar_json_atomico(caminho, objeto, **opcoes):
+    opcoes.setdefault("ensure_ascii", False)
+    gravar_atomico(caminho, lambda f: json.dump(objeto, f, **opcoes), modo="w", encoding="utf-8")
+
+
+def ler_json(caminho, padrao=None):
+    """
+    Lê um JSON. Arquivo inexistente retorna `padrao`; conteúdo inválido
+    levanta ValueError (em vez de ser tratado como vazio e sobrescrito).
+    """
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return padrao
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Arquivo {caminho} corrompido: {e}") from e
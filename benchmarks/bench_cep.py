@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cep
+from viacep_stub import iniciar_servidor
+
+# ----------------------------------------------
+# BENCHMARK: CONSULTA DE CEP COM CACHE
+# ----------------------------------------------
+# Mede a consulta de CEP contra o servidor local (benchmarks/viacep_stub.py):
+# primeira consulta (rede), repetida (LRU em memória) e após reinício do
+# processo (simulado limpando só o LRU, lendo do SQLite).
+#
+# Uso:
+#   python benchmarks/bench_cep.py --ceps 200 --atraso 0.02
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark da consulta de CEP com cache.")
+    parser.add_argument("--ceps", type=int, default=200)
+    parser.add_argument("--atraso", type=float, default=0.02, help="Latência simulada do ViaCEP (s)")
+    parser.add_argument("--url", help="Usar este ViaCEP em vez do servidor local")
+    args = parser.parse_args(argv)
+
+    servidor = None
+    if args.url:
+        cep.VIACEP_URL = args.url.rstrip("/")
+    else:
+        servidor, cep.VIACEP_URL = iniciar_servidor(atraso=args.atraso)
+    pasta = tempfile.mkdtemp(prefix="bench_cep_")
+    cep.CEP_CACHE_ARQUIVO = os.path.join(pasta, "cep_cache.db")
+
+    ceps = [f"{80000000 + i * 37:08d}" for i in range(args.ceps)]
+    try:
+        medidas = {}
+        for etapa in ("rede", "memoria", "disco"):
+            if etapa == "disco":
+                with cep._lock:
+                    cep._cache.clear()
+            inicio = time.perf_counter()
+            for c in ceps:
+                cep.buscar_endereco_via_cep(c)
+            medidas[etapa] = (time.perf_counter() - inicio) / len(ceps)
+    finally:
+        if servidor is not None:
+            servidor.shutdown()
+
+    print(f"{len(ceps)} CEPs (latência simulada {args.atraso * 1000:.0f} ms)")
+    print(f"  primeira consulta (rede): {medidas['rede'] * 1e6:10.1f} us/CEP")
+    print(f"  cache em memória:         {medidas['memoria'] * 1e6:10.1f} us/CEP")
+    print(f"  cache em disco (SQLite):  {medidas['disco'] * 1e6:10.1f} us/CEP")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ----------------------------------------------
+# BENCHMARK: /criar_receita NO GUNICORN x NÚMERO DE WORKERS
+# ----------------------------------------------
+# Sobe o app com gunicorn.conf.py para cada número de workers pedido, dispara
+# requisições concorrentes em /criar_receita?formato=pdf (PDF na resposta, sem
+# gravar em disco) e imprime requisições/s, latências p50/p95 e erros.
+#
+# A vazão só escala até o número de núcleos da máquina (a geração do PDF usa
+# CPU); anote `nproc` junto com os resultados.
+#
+# Todas as requisições enviam a mesma receita, então o cache de PDFs
+# (cache_pdf.py) fica desligado: mede a renderização, não a leitura do cache.
+# Cada rodada roda em uma pasta temporária (fila, métricas e caches não ficam
+# na raiz do repositório).
+#
+# Uso:
+#   python benchmarks/bench_gunicorn.py --workers 1,2,4 --requisicoes 400 --concorrencia 16
+
+RECEITA = {
+    "paciente": "Rex",
+    "tutor": "Maria da Silva",
+    "cpf": "12345678901",
+    "especie_raca": "Canina - SRD",
+    "pelagem": "Caramelo",
+    "peso": "12 kg",
+    "idade": "5 anos",
+    "sexo": "Macho",
+    "lista_medicamentos": [
+        {"quantidade": "1 caixa", "nome": "Amoxicilina + Clavulanato", "concentracao": "250 mg"},
+        {"quantidade": "1 frasco", "nome": "Meloxicam", "concentracao": "0,2%"},
+    ],
+    "instrucoes_uso": "Administrar 1 comprimido a cada 12 horas durante 7 dias.\n"
+                      "Meloxicam: 0,1 ml/kg uma vez ao dia durante 3 dias, após alimentação.",
+    "data_receita": "01/01/2025",
+}
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _esperar_servidor(url, processo, limite=60):
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        if processo.poll() is not None:
+            raise RuntimeError("O gunicorn terminou antes de aceitar conexões.")
+        try:
+            requests.get(url + "/ver_historico", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError("O gunicorn não respondeu a tempo.")
+
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def medir(url, requisicoes, concorrencia):
+    local = threading.local()
+
+    def enviar(_):
+        sessao = getattr(local, "sessao", None)
+        if sessao is None:
+            sessao = local.sessao = requests.Session()
+        inicio = time.perf_counter()
+        try:
+            r = sessao.post(url + "/criar_receita?formato=pdf", json=RECEITA, timeout=60)
+            ok = r.status_code == 201 and r.content.startswith(b"%PDF")
+        except requests.RequestException:
+            ok = False
+        return ok, time.perf_counter() - inicio
+
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        list(executor.map(enviar, range(concorrencia)))  # aquecimento
+        inicio = time.perf_counter()
+        resultados = list(executor.map(enviar, range(requisicoes)))
+        duracao = time.perf_counter() - inicio
+
+    latencias = [t for ok, t in resultados if ok]
+    return {
+        "requisicoes": requisicoes,
+        "erros": sum(1 for ok, _ in resultados if not ok),
+        "segundos": round(duracao, 3),
+        "requisicoes_por_s": round(len(latencias) / duracao, 1) if duracao else 0,
+        "p50_ms": round(_percentil(latencias, 50) * 1000, 1) if latencias else None,
+        "p95_ms": round(_percentil(latencias, 95) * 1000, 1) if latencias else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vazão de /criar_receita no gunicorn por número de workers.")
+    parser.add_argument("--workers", default="1,2,4", help="Lista de números de workers (ex.: 1,2,4)")
+    parser.add_argument("--threads", type=int, default=1, help="GUNICORN_THREADS de cada worker")
+    parser.add_argument("--requisicoes", type=int, default=400)
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--sem-preload", action="store_true", help="Roda com GUNICORN_PRELOAD=false")
+    parser.add_argument("--com-cache-pdf", action="store_true",
+                        help="Mantém o cache de PDFs ligado (a partir da 2ª requisição mede só o cache)")
+    args = parser.parse_args(argv)
+
+    print(json.dumps({"nucleos": os.cpu_count(), "threads": args.threads,
+                      "preload": not args.sem_preload}, ensure_ascii=False))
+    for n in [int(x) for x in args.workers.split(",") if x.strip()]:
+        porta = _porta_livre()
+        ambiente = dict(
+            os.environ,
+            PORT=str(porta),
+            GUNICORN_WORKERS=str(n),
+            GUNICORN_THREADS=str(args.threads),
+            GUNICORN_PRELOAD="false" if args.sem_preload else "true",
+            GUNICORN_ACCESSLOG="",
+            GUNICORN_LOGLEVEL="warning",
+            PYTHONPATH=RAIZ,
+        )
+        if not args.com_cache_pdf:
+            ambiente["CACHE_PDF_LIMITE_MB"] = "0"
+        pasta = tempfile.mkdtemp(prefix="bench_gunicorn_")
+        processo = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", os.path.join(RAIZ, "gunicorn.conf.py"), "app:app"],
+            cwd=pasta, env=ambiente
+        )
+        try:
+            url = f"http://127.0.0.1:{porta}"
+            _esperar_servidor(url, processo)
+            resultado = medir(url, args.requisicoes, args.concorrencia)
+        finally:
+            processo.terminate()
+            processo.wait(timeout=30)
+            shutil.rmtree(pasta, ignore_errors=True)
+        resultado["workers"] = n
+        print(json.dumps(resultado, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reportlab.pdfbase import pdfmetrics
+
+from texto import quebrar_texto, largura_em_unidades
+
+# ----------------------------------------------
+# BENCHMARK: QUEBRA DE LINHAS DAS INSTRUÇÕES
+# ----------------------------------------------
+# Compara a quebra antiga (mede a linha inteira a cada palavra) com a de
+# texto.py, em instruções de uso longas, e confere que as linhas são idênticas.
+#
+# Uso:
+#   python benchmarks/bench_quebra_texto.py --textos 200 --palavras 400 --repeticoes 5
+
+PALAVRAS = (
+    "ADMINISTRAR", "COMPRIMIDO", "VIA", "ORAL", "A", "CADA", "12", "HORAS", "DURANTE", "7",
+    "DIAS", "APÓS", "ALIMENTAÇÃO", "NÃO", "INTERROMPER", "O", "TRATAMENTO", "SEM", "ORIENTAÇÃO",
+    "VETERINÁRIA", "APLICAR", "POMADA", "NA", "LESÃO", "2X", "AO", "DIA", "MANTER", "COLAR",
+    "ELIZABETANO", "ATÉ", "RETORNO", "(MEIO)", "ML/KG", "0,5", "SUSPENSÃO", "AGITAR", "ANTES", "DE", "USAR",
+)
+
+
+def quebra_antiga(texto, fonte, tamanho, largura):
+    linhas = []
+    atual = ""
+    for palavra in texto.split():
+        teste = palavra if atual == "" else atual + " " + palavra
+        if pdfmetrics.stringWidth(teste, fonte, tamanho) <= largura:
+            atual = teste
+        else:
+            if atual:
+                linhas.append(atual)
+            atual = palavra
+    if atual:
+        linhas.append(atual)
+    return linhas
+
+
+def gerar_textos(quantidade, palavras, semente):
+    aleatorio = random.Random(semente)
+    return [" ".join(aleatorio.choice(PALAVRAS) for _ in range(palavras)) for _ in range(quantidade)]
+
+
+def medir(funcao, textos, fonte, tamanho, largura, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        for texto in textos:
+            funcao(texto, fonte, tamanho, largura)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark da quebra de linhas.")
+    parser.add_argument("--textos", type=int, default=200)
+    parser.add_argument("--palavras", type=int, default=400)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    fonte, tamanho, largura = "Helvetica", 9, 17 * 28.346456692913385
+    textos = gerar_textos(args.textos, args.palavras, args.semente)
+
+    for texto in textos:
+        if tuple(quebra_antiga(texto, fonte, tamanho, largura)) != quebrar_texto(texto, fonte, tamanho, largura):
+            print("ERRO: quebras diferentes para o texto:", texto[:80], "...")
+            return 1
+
+    antiga = medir(quebra_antiga, textos, fonte, tamanho, largura, args.repeticoes)
+
+    quebrar_texto.cache_clear()
+    largura_em_unidades.cache_clear()
+    inicio = time.perf_counter()
+    for texto in textos:
+        quebrar_texto.__wrapped__(texto, fonte, tamanho, largura)
+    fria = time.perf_counter() - inicio
+    sem_memo = medir(quebrar_texto.__wrapped__, textos, fonte, tamanho, largura, args.repeticoes)
+    com_memo = medir(quebrar_texto, textos, fonte, tamanho, largura, args.repeticoes)
+
+    print(f"{args.textos} textos x {args.palavras} palavras ({fonte} {tamanho}pt, largura {largura:.1f}pt)")
+    print(f"  quebra antiga:                {antiga * 1000:9.2f} ms")
+    print(f"  larguras em cache (1a vez):   {fria * 1000:9.2f} ms")
+    print(f"  larguras em cache:            {sem_memo * 1000:9.2f} ms  ({antiga / sem_memo:.1f}x)")
+    print(f"  larguras + quebra em cache:   {com_memo * 1000:9.2f} ms  ({antiga / com_memo:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
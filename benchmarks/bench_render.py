@@ -0,0 +1,243 @@
+import os
+import sys
+import gc
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import itertools
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import etapas_pdf
+from receita_pdf import gerar_pdf_receita
+
+# ----------------------------------------------
+# BENCHMARK: RENDERIZAÇÃO DA RECEITA (gerar_pdf_receita)
+# ----------------------------------------------
+# Gera receitas sintéticas variando:
+#   - número de medicamentos (1 a 50);
+#   - tamanho das instruções de uso (em palavras);
+#   - receita comum x controlada (com RG e endereço longo, que quebra linha);
+#   - com ou sem imagens de fundo e assinatura (PNGs gerados na hora).
+# Para cada cenário imprime latência p50/p95, receitas/s, tamanho do PDF e
+# pico de memória alocada (tracemalloc) durante uma renderização. O pico de RSS
+# (ru_maxrss) é do processo inteiro desde a subida e só cresce, então aparece
+# uma vez só, em "maquina": é o maior consumo da execução, não de um cenário.
+# O cache de PDFs fica desligado (usar_cache=False): mede sempre o desenho.
+# Com --etapas, cada cenário traz também a média em ms de cada etapa (etapas_pdf.py).
+#
+# O resultado é JSON. Para acompanhar regressões:
+#   python benchmarks/bench_render.py --salvar base.json
+#   ... alterações ...
+#   python benchmarks/bench_render.py --comparar base.json --tolerancia 15
+# A comparação sai com código 1 se algum cenário ficou mais lento que a tolerância.
+
+PALAVRAS = (
+    "ADMINISTRAR", "COMPRIMIDO", "VIA", "ORAL", "A", "CADA", "12", "HORAS", "DURANTE", "7",
+    "DIAS", "APÓS", "ALIMENTAÇÃO", "NÃO", "INTERROMPER", "O", "TRATAMENTO", "SEM", "ORIENTAÇÃO",
+    "VETERINÁRIA", "APLICAR", "POMADA", "NA", "LESÃO", "2X", "AO", "DIA", "MANTER", "COLAR",
+)
+MEDICAMENTOS = ("AMOXICILINA + CLAVULANATO", "MELOXICAM", "DIPIRONA", "PREDNISOLONA", "TRAMADOL", "OMEPRAZOL")
+ENDERECO_LONGO = ("RUA DOUTOR MANOEL PEDRO DE ALMEIDA CAMARGO, 1234, APTO 56 BLOCO B, "
+                  "JARDIM DAS AMÉRICAS, CURITIBA - PR - CEP: 81530-000")
+
+
+def criar_imagens(pasta):
+    from PIL import Image, ImageDraw
+    fundo = os.path.join(pasta, "fundo.png")
+    assinatura = os.path.join(pasta, "assinatura.png")
+    # Fundo em página A4 a 150 dpi, com faixas e texto como um timbrado real
+    imagem = Image.new("RGB", (1240, 1754), "white")
+    desenho = ImageDraw.Draw(imagem)
+    for y in range(0, 220, 4):
+        desenho.line([(0, y), (1240, y)], fill=(20, 80 + y // 4, 140))
+    desenho.rectangle([60, 1650, 1180, 1700], outline=(20, 80, 140), width=4)
+    imagem.save(fundo)
+    # Assinatura com transparência (usa a máscara alfa, como as enviadas pelo perfil)
+    imagem = Image.new("RGBA", (600, 220), (0, 0, 0, 0))
+    desenho = ImageDraw.Draw(imagem)
+    aleatorio = random.Random(1)
+    pontos = [(x, 110 + int(60 * aleatorio.uniform(-1, 1))) for x in range(20, 580, 15)]
+    desenho.line(pontos, fill=(10, 10, 80, 255), width=5)
+    imagem.save(assinatura)
+    return fundo, assinatura
+
+
+def montar_receita(medicamentos, palavras, controlada, imagens, semente=0):
+    aleatorio = random.Random(semente)
+    receita = {
+        "tipo_farmacia": "FARMÁCIA VETERINÁRIA",
+        "paciente": "REX",
+        "tutor": "MARIA DA SILVA",
+        "cpf": "12345678901",
+        "especie_raca": "CANINA - SRD",
+        "pelagem": "CARAMELO",
+        "peso": "12 KG",
+        "idade": "5 ANOS",
+        "sexo": "MACHO",
+        "chip": "",
+        "lista_medicamentos": [
+            {"quantidade": f"{i % 3 + 1} CAIXA(S)", "nome": MEDICAMENTOS[i % len(MEDICAMENTOS)],
+             "concentracao": f"{(i + 1) * 25} MG" if i % 2 == 0 else ""}
+            for i in range(medicamentos)
+        ],
+        "instrucoes_uso": " ".join(aleatorio.choice(PALAVRAS) for _ in range(palavras)),
+        "data_receita": "01/01/2025",
+        "nome_vet": "ISABELA ZAMBONI",
+        "crmv": "22845",
+    }
+    if controlada:
+        receita.update(tipo_farmacia="FARMÁCIA HUMANA", rg="12.345.678-9", endereco_formatado=ENDERECO_LONGO)
+    if imagens:
+        receita.update(imagem_fundo=imagens[0], imagem_assinatura=imagens[1])
+    return receita
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def _pico_rss_kb():
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico // 1024 if sys.platform == "darwin" else pico  # macOS informa em bytes
+
+
+def medir_cenario(receita, iteracoes, aquecimento, usar_timbrado, etapas=False):
+    def renderizar():
+        return gerar_pdf_receita(em_memoria=True, usar_cache=False, usar_timbrado=usar_timbrado,
+                                 avisar=lambda aviso: None, **receita)
+
+    for _ in range(aquecimento):
+        renderizar()
+    gc.collect()
+    contadores = etapas_pdf.registrar(etapas_pdf.Contadores()) if etapas else None
+    latencias = []
+    inicio = time.perf_counter()
+    try:
+        for _ in range(iteracoes):
+            t = time.perf_counter()
+            pdf = renderizar()
+            latencias.append(time.perf_counter() - t)
+    finally:
+        if contadores:
+            etapas_pdf.remover(contadores)
+    duracao = time.perf_counter() - inicio
+
+    # Pico de memória alocada em uma renderização (fora da medição de tempo: o tracemalloc a deixa mais lenta)
+    tracemalloc.start()
+    renderizar()
+    _, pico_alocado = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    medida = {
+        "p50_ms": round(_percentil(latencias, 50) * 1000, 3),
+        "p95_ms": round(_percentil(latencias, 95) * 1000, 3),
+        "receitas_por_s": round(iteracoes / duracao, 1),
+        "tamanho_bytes": len(pdf),
+        "pico_alocado_kb": pico_alocado // 1024,
+    }
+    if contadores:
+        medicoes = contadores.metricas()
+        medida["etapas_ms"] = {etapa: round(segundos / medicoes["renderizacoes"] * 1000, 3)
+                               for etapa, segundos in medicoes["segundos_etapa"].items()}
+    return medida
+
+
+def comparar(resultado, base, tolerancia):
+    """Diferença percentual de p50/p95/vazão por cenário. Retorna (linhas, houve_regressao)."""
+    anteriores = {c["cenario"]: c for c in base.get("cenarios", [])}
+    linhas = []
+    regressao = False
+    for atual in resultado["cenarios"]:
+        antes = anteriores.get(atual["cenario"])
+        if antes is None:
+            continue
+        linha = {"cenario": atual["cenario"]}
+        for campo in ("p50_ms", "p95_ms", "receitas_por_s", "tamanho_bytes"):
+            if antes.get(campo):
+                linha[campo + "_variacao_pct"] = round((atual[campo] - antes[campo]) / antes[campo] * 100, 1)
+        # Mais lento = p50 maior; vazão menor já aparece no p50, não conta duas vezes
+        linha["regressao"] = linha.get("p50_ms_variacao_pct", 0) > tolerancia
+        regressao = regressao or linha["regressao"]
+        linhas.append(linha)
+    return linhas, regressao
+
+
+def _lista(texto):
+    return [int(x) for x in texto.split(",") if x.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark da renderização de gerar_pdf_receita.")
+    parser.add_argument("--medicamentos", default="1,5,20,50", help="Quantidades de medicamentos (ex.: 1,5,20,50)")
+    parser.add_argument("--palavras", default="20,400", help="Tamanhos das instruções de uso, em palavras")
+    parser.add_argument("--iteracoes", type=int, default=20, help="Renderizações medidas por cenário")
+    parser.add_argument("--aquecimento", type=int, default=2, help="Renderizações descartadas antes de medir")
+    parser.add_argument("--sem-timbrado", action="store_true",
+                        help="Desenha fundo e assinatura em cada página (usar_timbrado=False)")
+    parser.add_argument("--etapas", action="store_true",
+                        help="Inclui o tempo médio de cada etapa da renderização (etapas_pdf.py)")
+    parser.add_argument("--salvar", help="Grava o resultado neste arquivo JSON (para usar como base)")
+    parser.add_argument("--comparar", help="Arquivo JSON de uma execução anterior para comparar")
+    parser.add_argument("--tolerancia", type=float, default=15.0, help="Aumento de p50 (%%) aceito na comparação")
+    args = parser.parse_args(argv)
+
+    pasta = tempfile.mkdtemp(prefix="bench_render_")
+    try:
+        imagens = criar_imagens(pasta)
+        cenarios = []
+        for medicamentos, palavras, controlada, com_imagens in itertools.product(
+            _lista(args.medicamentos), _lista(args.palavras), (False, True), (False, True)
+        ):
+            nome = (f"med={medicamentos},palavras={palavras},"
+                    f"{'controlada' if controlada else 'comum'},{'imagens' if com_imagens else 'sem_imagens'}")
+            receita = montar_receita(medicamentos, palavras, controlada, imagens if com_imagens else None)
+            medida = medir_cenario(receita, args.iteracoes, args.aquecimento, not args.sem_timbrado, args.etapas)
+            cenario = {"cenario": nome, "medicamentos": medicamentos, "palavras": palavras,
+                       "controlada": controlada, "imagens": com_imagens}
+            cenario.update(medida)
+            cenarios.append(cenario)
+            print(json.dumps(cenario, ensure_ascii=False), file=sys.stderr)
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    resultado = {
+        "maquina": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "processador": platform.processor() or platform.machine(),
+            "nucleos": os.cpu_count(),
+            "pico_rss_kb": _pico_rss_kb(),
+        },
+        "parametros": {"iteracoes": args.iteracoes, "aquecimento": args.aquecimento,
+                       "usar_timbrado": not args.sem_timbrado},
+        "cenarios": cenarios,
+    }
+    codigo = 0
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        resultado["comparacao"], regressao = comparar(resultado, base, args.tolerancia)
+        codigo = 1 if regressao else 0
+    if args.salvar:
+        with open(args.salvar, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import viacep_stub
+from viacep_stub import iniciar_servidor
+from bench_gunicorn import RAIZ, _porta_livre, _esperar_servidor, _percentil
+
+# ----------------------------------------------
+# TESTE DE CARGA DA API FLASK (app.py)
+# ----------------------------------------------
+# Sobe o app no gunicorn (uma pasta de trabalho temporária por rodada, com
+# histórico semeado e caches vazios) e um ViaCEP local (viacep_stub.py), e
+# repete uma mistura realista de requisições com N clientes simultâneos:
+#   - criar: receitas com 1 a 20 medicamentos, instruções curtas e longas;
+#     as controladas mandam "cep" e a API consulta o endereço no ViaCEP local;
+#     uma fração repete exatamente uma receita anterior (reemissão);
+#   - historico: GET /ver_historico sobre um log com --historico registros.
+# As receitas são criadas em um dos modos de armazenamento da saída:
+#   memoria  POST /criar_receita?formato=pdf (PDF na resposta, nada em disco)
+#   disco    POST /criar_receita             (grava em Receitas/)
+#   fila     POST /receitas + GET /receitas/<id>?esperar= + GET /receitas/<id>.pdf
+# O histórico não varia: a API só tem o log JSONL global (historico_receitas.jsonl);
+# o backend SQLite (historico_db.py) é por veterinário e só existe no Streamlit.
+#
+# Cada rodada (workers x modo) imprime uma linha JSON com vazão, erros por
+# código e, por operação, p50/p95/p99 e histograma de latência. No final sai
+# uma tabela comparando as rodadas (também gravada com --relatorio).
+#
+# Uso:
+#   python benchmarks/carga_api.py --workers 1,2,4 --modos memoria,disco,fila \
+#       --requisicoes 500 --concorrencia 16 --relatorio carga.md
+
+BALDES_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+MODOS = ("memoria", "disco", "fila")
+
+MEDICAMENTOS = ("AMOXICILINA + CLAVULANATO", "MELOXICAM", "DIPIRONA", "PREDNISOLONA", "TRAMADOL",
+                "OMEPRAZOL", "CEFALEXINA", "GABAPENTINA", "METRONIDAZOL", "FUROSEMIDA")
+PALAVRAS = ("ADMINISTRAR", "COMPRIMIDO", "VIA", "ORAL", "A", "CADA", "12", "HORAS", "DURANTE", "7",
+            "DIAS", "APÓS", "ALIMENTAÇÃO", "NÃO", "INTERROMPER", "O", "TRATAMENTO", "MANTER", "JEJUM")
+# Quantidade de medicamentos por receita: a maioria tem poucos itens
+PESOS_MEDICAMENTOS = ((1, 35), (2, 30), (3, 20), (5, 10), (10, 4), (20, 1))
+
+
+class GeradorReceitas:
+    """Receitas sintéticas, com CEPs de um conjunto fixo (repetem, como na clínica)."""
+
+    def __init__(self, semente, ceps=300, repetidas=0.1, controladas=0.25):
+        self.aleatorio = random.Random(semente)
+        self.ceps = [f"8{i:06d}1" for i in range(ceps)]
+        self.repetidas = repetidas
+        self.controladas = controladas
+        self.anteriores = []
+        self._lock = threading.Lock()
+
+    def proxima(self):
+        with self._lock:
+            a = self.aleatorio
+            if self.anteriores and a.random() < self.repetidas:
+                return a.choice(self.anteriores)
+            quantidades, pesos = zip(*PESOS_MEDICAMENTOS)
+            medicamentos = a.choices(quantidades, pesos)[0]
+            palavras = a.randint(300, 400) if a.random() < 0.05 else a.randint(10, 80)
+            n = len(self.anteriores)
+            receita = {
+                "paciente": f"PACIENTE {n}",
+                "tutor": f"TUTOR {n}",
+                "cpf": f"{a.randrange(10 ** 11):011d}",
+                "especie_raca": a.choice(("CANINA - SRD", "FELINA - SIAMÊS", "CANINA - POODLE")),
+                "pelagem": "CARAMELO",
+                "peso": f"{a.randint(2, 40)} KG",
+                "idade": f"{a.randint(1, 15)} ANOS",
+                "sexo": a.choice(("MACHO", "FÊMEA")),
+                "lista_medicamentos": [
+                    {"quantidade": f"{a.randint(1, 3)} CAIXA(S)", "nome": a.choice(MEDICAMENTOS),
+                     "concentracao": f"{a.choice((25, 50, 100, 250))} MG"}
+                    for _ in range(medicamentos)
+                ],
+                "instrucoes_uso": " ".join(a.choice(PALAVRAS) for _ in range(palavras)),
+                "data_receita": "01/01/2025",
+            }
+            if a.random() < self.controladas:
+                receita.update(rg=f"{a.randrange(10 ** 9):09d}", cep=a.choice(self.ceps),
+                               numero=str(a.randint(1, 3000)))
+            self.anteriores.append(receita)
+            return receita
+
+
+def semear_historico(pasta, quantidade):
+    with open(os.path.join(pasta, "historico_receitas.jsonl"), "w", encoding="utf-8") as f:
+        for i in range(quantidade):
+            f.write(json.dumps({
+                "paciente": f"PACIENTE {i}",
+                "cpf": f"{i:011d}",
+                "tutor": f"TUTOR {i}",
+                "data_criacao": "01/01/2025 10:00",
+            }, ensure_ascii=False) + "\n")
+
+
+def _criar(sessao, url, modo, receita):
+    if modo == "memoria":
+        r = sessao.post(url + "/criar_receita?formato=pdf", json=receita, timeout=60)
+        return r.status_code, r.status_code == 201 and r.content.startswith(b"%PDF")
+    if modo == "disco":
+        r = sessao.post(url + "/criar_receita", json=receita, timeout=60)
+        return r.status_code, r.status_code == 201
+    r = sessao.post(url + "/receitas", json=receita, timeout=60)
+    if r.status_code != 202:
+        return r.status_code, False
+    situacao = r.json()
+    while True:
+        r = sessao.get(url + situacao["url"] + "?esperar=20", timeout=60)
+        if r.status_code != 202:
+            break
+    if r.status_code != 200 or r.json().get("status") != "concluido":
+        return r.status_code, False
+    r = sessao.get(url + r.json()["pdf"], timeout=60)
+    return r.status_code, r.status_code == 200 and r.content.startswith(b"%PDF")
+
+
+def _historico(sessao, url):
+    r = sessao.get(url + "/ver_historico", timeout=60)
+    return r.status_code, r.status_code == 200
+
+
+def medir(url, modo, gerador, requisicoes, concorrencia, fracao_historico, semente):
+    local = threading.local()
+    sorteio = random.Random(semente)
+    operacoes = ["historico" if sorteio.random() < fracao_historico else "criar" for _ in range(requisicoes)]
+
+    def enviar(operacao):
+        sessao = getattr(local, "sessao", None)
+        if sessao is None:
+            sessao = local.sessao = requests.Session()
+        inicio = time.perf_counter()
+        try:
+            if operacao == "criar":
+                codigo, ok = _criar(sessao, url, modo, gerador.proxima())
+            else:
+                codigo, ok = _historico(sessao, url)
+        except requests.RequestException as e:
+            codigo, ok = type(e).__name__, False
+        return operacao, codigo, ok, time.perf_counter() - inicio
+
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        list(executor.map(enviar, ["criar"] * concorrencia))  # aquecimento
+        inicio = time.perf_counter()
+        resultados = list(executor.map(enviar, operacoes))
+        duracao = time.perf_counter() - inicio
+    return resultados, duracao
+
+
+def _histograma(latencias_ms):
+    contagem = [0] * (len(BALDES_MS) + 1)
+    for t in latencias_ms:
+        for i, limite in enumerate(BALDES_MS):
+            if t <= limite:
+                contagem[i] += 1
+                break
+        else:
+            contagem[-1] += 1
+    rotulos = [f"<={b}ms" for b in BALDES_MS] + [f">{BALDES_MS[-1]}ms"]
+    return dict(zip(rotulos, contagem))
+
+
+def resumir(resultados, duracao):
+    resumo = {
+        "requisicoes": len(resultados),
+        "segundos": round(duracao, 3),
+        "requisicoes_por_s": round(len(resultados) / duracao, 1) if duracao else 0,
+        "erros": sum(1 for _, _, ok, _ in resultados if not ok),
+        "codigos": dict(Counter(str(codigo) for _, codigo, _, _ in resultados)),
+        "operacoes": {},
+    }
+    resumo["taxa_erros"] = round(resumo["erros"] / len(resultados), 4) if resultados else 0
+    for operacao in sorted({r[0] for r in resultados}):
+        itens = [r for r in resultados if r[0] == operacao]
+        latencias = [t * 1000 for _, _, ok, t in itens if ok]
+        resumo["operacoes"][operacao] = {
+            "quantidade": len(itens),
+            "erros": sum(1 for _, _, ok, _ in itens if not ok),
+            "p50_ms": round(_percentil(latencias, 50), 1) if latencias else None,
+            "p95_ms": round(_percentil(latencias, 95), 1) if latencias else None,
+            "p99_ms": round(_percentil(latencias, 99), 1) if latencias else None,
+            "histograma": _histograma(latencias),
+        }
+    return resumo
+
+
+def rodada(args, workers, modo, url_viacep):
+    pasta = tempfile.mkdtemp(prefix="carga_api_")
+    try:
+        semear_historico(pasta, args.historico)
+        porta = _porta_livre()
+        ambiente = dict(
+            os.environ,
+            PYTHONPATH=RAIZ + os.pathsep + os.environ.get("PYTHONPATH", ""),
+            PORT=str(porta),
+            GUNICORN_WORKERS=str(workers),
+            GUNICORN_THREADS=str(args.threads),
+            GUNICORN_ACCESSLOG="",
+            GUNICORN_LOGLEVEL="warning",
+            VIACEP_URL=url_viacep,
+        )
+        if args.sem_cache_pdf:
+            ambiente["CACHE_PDF_LIMITE_MB"] = "0"
+        processo = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", os.path.join(RAIZ, "gunicorn.conf.py"), "app:app"],
+            cwd=pasta, env=ambiente
+        )
+        try:
+            url = f"http://127.0.0.1:{porta}"
+            _esperar_servidor(url, processo)
+            consultas_antes = viacep_stub._Handler.contador
+            gerador = GeradorReceitas(args.semente, repetidas=args.repetidas, controladas=args.controladas)
+            resultados, duracao = medir(url, modo, gerador, args.requisicoes, args.concorrencia,
+                                        args.historico_fracao, args.semente)
+        finally:
+            processo.terminate()
+            processo.wait(timeout=30)
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+    resumo = resumir(resultados, duracao)
+    resumo.update(workers=workers, modo=modo, consultas_viacep=viacep_stub._Handler.contador - consultas_antes)
+    return resumo
+
+
+def tabela(resumos):
+    linhas = [
+        "| workers | modo | req/s | erros | criar p50 | criar p95 | histórico p50 | histórico p95 | ViaCEP |",
+        "| --- | --- | --- | --- | --- | --- | --- | --- | --- |",
+    ]
+    for r in resumos:
+        criar = r["operacoes"].get("criar", {})
+        historico = r["operacoes"].get("historico", {})
+        linhas.append(
+            f"| {r['workers']} | {r['modo']} | {r['requisicoes_por_s']} | {r['taxa_erros']:.1%} | "
+            f"{criar.get('p50_ms')} | {criar.get('p95_ms')} | {historico.get('p50_ms')} | "
+            f"{historico.get('p95_ms')} | {r['consultas_viacep']} |"
+        )
+    return "\n".join(linhas)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga da API Flask com ViaCEP local.")
+    parser.add_argument("--workers", default="1,2,4", help="Números de workers do gunicorn (ex.: 1,2,4)")
+    parser.add_argument("--modos", default="memoria,disco,fila", help=f"Modos de saída: {', '.join(MODOS)}")
+    parser.add_argument("--threads", type=int, default=1, help="GUNICORN_THREADS de cada worker")
+    parser.add_argument("--requisicoes", type=int, default=400)
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--historico", type=int, default=2000, help="Registros semeados no log de histórico")
+    parser.add_argument("--historico-fracao", type=float, default=0.2, help="Fração das requisições em /ver_historico")
+    parser.add_argument("--repetidas", type=float, default=0.1, help="Fração de receitas reemitidas sem alteração")
+    parser.add_argument("--controladas", type=float, default=0.25, help="Fração de receitas controladas (com CEP)")
+    parser.add_argument("--viacep-atraso", type=float, default=0.05, help="Segundos de resposta do ViaCEP local")
+    parser.add_argument("--sem-cache-pdf", action="store_true", help="Roda com CACHE_PDF_LIMITE_MB=0")
+    parser.add_argument("--semente", type=int, default=1)
+    parser.add_argument("--relatorio", help="Grava a tabela comparativa (Markdown) neste arquivo")
+    args = parser.parse_args(argv)
+
+    modos = [m.strip() for m in args.modos.split(",") if m.strip()]
+    invalidos = set(modos) - set(MODOS)
+    if invalidos:
+        parser.error(f"Modo(s) desconhecido(s): {', '.join(sorted(invalidos))}")
+
+    servidor, url_viacep = iniciar_servidor(atraso=args.viacep_atraso)
+    print(json.dumps({"nucleos": os.cpu_count(), "threads": args.threads, "concorrencia": args.concorrencia,
+                      "cache_pdf": not args.sem_cache_pdf}, ensure_ascii=False))
+    resumos = []
+    try:
+        for workers in [int(x) for x in args.workers.split(",") if x.strip()]:
+            for modo in modos:
+                resumo = rodada(args, workers, modo, url_viacep)
+                print(json.dumps(resumo, ensure_ascii=False))
+                resumos.append(resumo)
+    finally:
+        servidor.shutdown()
+
+    relatorio = tabela(resumos)
+    print(relatorio, file=sys.stderr)
+    if args.relatorio:
+        with open(args.relatorio, "w", encoding="utf-8") as f:
+            f.write(relatorio + "\n")
+    return 0 if all(r["erros"] == 0 for r in resumos) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
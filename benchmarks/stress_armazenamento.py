@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ----------------------------------------------
+# TESTE DE CARGA: ESCRITAS CONCORRENTES
+# ----------------------------------------------
+# Vários processos, cada um com várias threads, fazem ao mesmo tempo:
+#   - leitura-alteração-gravação no users.json (usuarios.atualizar), cada
+#     escritor incrementando o próprio contador;
+#   - anexos ao log de histórico (historico_log.anexar_registro).
+# No final confere a integridade: users.json é um JSON válido, nenhum
+# incremento se perdeu e o log tem exatamente uma linha válida por anexo.
+#
+# Uso:
+#   python benchmarks/stress_armazenamento.py --processos 4 --threads 4 --operacoes 200
+
+
+def _escritor(pasta, processo, threads, operacoes):
+    import usuarios
+    from historico_log import anexar_registro, sincronizar
+
+    caminho_usuarios = os.path.join(pasta, "users.json")
+    caminho_log = os.path.join(pasta, "historico.jsonl")
+
+    def trabalhar(thread):
+        campo = f"contador_{processo}_{thread}"
+
+        def incrementar(dados):
+            dados["vet"][campo] = dados["vet"].get(campo, 0) + 1
+
+        for i in range(operacoes):
+            usuarios.atualizar(caminho_usuarios, incrementar)
+            anexar_registro(caminho_log, {"processo": processo, "thread": thread, "i": i})
+
+    lista = [threading.Thread(target=trabalhar, args=(t,)) for t in range(threads)]
+    for t in lista:
+        t.start()
+    for t in lista:
+        t.join()
+    sincronizar()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga das escritas concorrentes.")
+    parser.add_argument("--processos", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--operacoes", type=int, default=200, help="Operações por thread")
+    parser.add_argument("--pasta", help="Pasta de trabalho (padrão: temporária, apagada no final)")
+    args = parser.parse_args(argv)
+
+    pasta = args.pasta or tempfile.mkdtemp(prefix="stress_armazenamento_")
+    os.makedirs(pasta, exist_ok=True)
+    caminho_usuarios = os.path.join(pasta, "users.json")
+    caminho_log = os.path.join(pasta, "historico.jsonl")
+    with open(caminho_usuarios, "w", encoding="utf-8") as f:
+        json.dump({"vet": {"password": "x"}}, f)
+    if os.path.exists(caminho_log):
+        os.remove(caminho_log)
+
+    inicio = time.perf_counter()
+    processos = [
+        multiprocessing.Process(target=_escritor, args=(pasta, p, args.threads, args.operacoes))
+        for p in range(args.processos)
+    ]
+    for p in processos:
+        p.start()
+    for p in processos:
+        p.join()
+    duracao = time.perf_counter() - inicio
+
+    escritores = args.processos * args.threads
+    esperado = escritores * args.operacoes
+    erros = []
+    if any(p.exitcode != 0 for p in processos):
+        erros.append("algum processo terminou com erro")
+
+    with open(caminho_usuarios, "r", encoding="utf-8") as f:
+        dados = json.load(f)  # levanta se o arquivo estiver corrompido
+    contadores = {k: v for k, v in dados["vet"].items() if k.startswith("contador_")}
+    perdidos = escritores * args.operacoes - sum(contadores.values())
+    if len(contadores) != escritores or perdidos:
+        erros.append(f"users.json: {len(contadores)} contadores, {perdidos} incrementos perdidos")
+
+    linhas = 0
+    invalidas = 0
+    vistos = set()
+    with open(caminho_log, "r", encoding="utf-8") as f:
+        for linha in f:
+            linhas += 1
+            try:
+                r = json.loads(linha)
+                vistos.add((r["processo"], r["thread"], r["i"]))
+            except (ValueError, KeyError):
+                invalidas += 1
+    if linhas != esperado or invalidas or len(vistos) != esperado:
+        erros.append(f"log: {linhas} linhas, {invalidas} inválidas, {len(vistos)} registros distintos (esperado {esperado})")
+
+    resultado = {
+        "processos": args.processos,
+        "threads_por_processo": args.threads,
+        "operacoes_por_thread": args.operacoes,
+        "segundos": round(duracao, 3),
+        # cada operação = uma atualização do users.json + um anexo ao log
+        "operacoes_por_s": round(esperado / duracao, 1),
+        "integro": not erros,
+        "erros": erros,
+    }
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    if not args.pasta:
+        shutil.rmtree(pasta, ignore_errors=True)
+    return 0 if not erros else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
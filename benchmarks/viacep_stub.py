@@ -0,0 +1,91 @@
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ----------------------------------------------
+# SERVIDOR LOCAL NO LUGAR DO VIACEP
+# ----------------------------------------------
+# Responde /ws/<cep>/json/ como o ViaCEP, com endereços fictícios e
+# determinísticos, para testes e benchmarks sem depender da rede.
+# CEPs terminados em "000" respondem {"erro": true} (CEP inexistente).
+# Com --falhas, uma fração das respostas é 503, para exercitar retentativas
+# e o disjuntor do cliente (cep.py).
+#
+# Uso:
+#   python benchmarks/viacep_stub.py --porta 8765 --atraso 0.05
+#   VIACEP_URL=http://127.0.0.1:8765/ws streamlit run vetrxx.py
+
+
+class _Handler(BaseHTTPRequestHandler):
+    atraso = 0.0
+    taxa_falhas = 0.0
+    contador = 0
+    _lock = threading.Lock()
+
+    def do_GET(self):
+        with _Handler._lock:
+            _Handler.contador += 1
+        partes = [p for p in self.path.split("/") if p]
+        if len(partes) != 3 or partes[0] != "ws" or partes[2] != "json" or not partes[1].isdigit() or len(partes[1]) != 8:
+            self._responder(400, {"erro": "formato inválido"})
+            return
+        if self.atraso:
+            time.sleep(self.atraso)
+        if self.taxa_falhas and random.random() < self.taxa_falhas:
+            self._responder(503, {"erro": "indisponível"})
+            return
+        cep = partes[1]
+        if cep.endswith("000"):
+            self._responder(200, {"erro": True})
+            return
+        self._responder(200, {
+            "cep": f"{cep[:5]}-{cep[5:]}",
+            "logradouro": f"Rua Teste {int(cep[5:])}",
+            "complemento": "",
+            "bairro": f"Bairro {cep[2:5]}",
+            "localidade": "Curitiba",
+            "uf": "PR",
+        })
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, formato, *args):
+        pass
+
+
+def iniciar_servidor(porta=0, atraso=0.0, taxa_falhas=0.0):
+    """Sobe o servidor em uma thread. Retorna (servidor, url_base); use servidor.shutdown() para parar."""
+    handler = type("Handler", (_Handler,), {"atraso": atraso, "taxa_falhas": taxa_falhas})
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}/ws"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local que imita o ViaCEP.")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--atraso", type=float, default=0.0, help="Segundos de espera em cada resposta")
+    parser.add_argument("--falhas", type=float, default=0.0, help="Fração das respostas que devolvem 503")
+    args = parser.parse_args(argv)
+    handler = type("Handler", (_Handler,), {"atraso": args.atraso, "taxa_falhas": args.falhas})
+    servidor = ThreadingHTTPServer(("127.0.0.1", args.porta), handler)
+    print(f"ViaCEP local em http://127.0.0.1:{args.porta}/ws")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import os
+import threading
+from collections import OrderedDict
+
+from reportlab.lib.utils import ImageReader
+
+# ----------------------------------------------
+# CACHE DE IMAGENS (FUNDO E ASSINATURA)
+# ----------------------------------------------
+# Mantém no processo os ImageReader já decodificados das imagens de fundo e de
+# assinatura, indexados pelo caminho e pelo mtime do arquivo. Assim o ReportLab
+# não precisa reabrir e decodificar o mesmo PNG a cada receita emitida.
+
+LIMITE_IMAGENS = int(os.environ.get("CACHE_IMAGENS_LIMITE", "32"))  # entradas no LRU
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # caminho absoluto -> (mtime_ns, tamanho, leitor, trava ou None)
+
+
+def _carregar(caminho):
+    leitor = ImageReader(caminho)
+    # Decodifica já na entrada do cache; o ImageReader guarda os pixels (e a
+    # máscara alfa) e as próximas chamadas de drawImage só reaproveitam.
+    leitor.getRGBData()
+    # JPEGs são copiados direto do arquivo pelo ReportLab (seek + read no mesmo
+    # buffer), então o uso concorrente do mesmo leitor precisa ser serializado.
+    trava = threading.Lock() if leitor.jpeg_fh() is not None else None
+    return leitor, trava
+
+
+def _obter_entrada(caminho):
+    caminho = os.path.abspath(caminho)
+    info = os.stat(caminho)
+    with _lock:
+        entrada = _cache.get(caminho)
+        if entrada and entrada[0] == info.st_mtime_ns and entrada[1] == info.st_size:
+            _cache.move_to_end(caminho)
+            return entrada
+    leitor, trava = _carregar(caminho)
+    entrada = (info.st_mtime_ns, info.st_size, leitor, trava)
+    with _lock:
+        _cache[caminho] = entrada
+        _cache.move_to_end(caminho)
+        while len(_cache) > LIMITE_IMAGENS:
+            _cache.popitem(last=False)
+    return entrada
+
+
+def obter_imagem(caminho):
+    """Retorna o ImageReader (já decodificado) da imagem, usando o cache."""
+    return _obter_entrada(caminho)[2]
+
+
+def desenhar_imagem(c, caminho, x, y, **kwargs):
+    """Equivalente a c.drawImage(caminho, ...) usando o ImageReader em cache."""
+    _, _, leitor, trava = _obter_entrada(caminho)
+    if trava is None:
+        return c.drawImage(leitor, x, y, **kwargs)
+    with trava:
+        return c.drawImage(leitor, x, y, **kwargs)
+
+
+def invalidar_imagem(caminho=None):
+    """Remove uma imagem do cache (ou todas, se caminho for None)."""
+    with _lock:
+        if caminho is None:
+            _cache.clear()
+        else:
+            _cache.pop(os.path.abspath(caminho), None)
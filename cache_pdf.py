@@ -0,0 +1,173 @@
+import os
+import json
+import hashlib
+import threading
+
+from armazenamento import gravar_bytes_atomico
+
+# ----------------------------------------------
+# CACHE DE PDFs POR CONTEÚDO
+# ----------------------------------------------
+# Receitas reemitidas com exatamente os mesmos dados (ex.: download perdido)
+# não precisam ser desenhadas de novo. A chave é o SHA-256 de um JSON canônico
+# com todos os parâmetros da renderização, o perfil do(a) veterinário(a) e o
+# SHA-256 do conteúdo das imagens de fundo e assinatura; trocar a imagem ou
+# qualquer campo gera outra chave.
+#
+# Os PDFs ficam em CACHE_PDF_PASTA/<2 primeiros>/<chave>.pdf, compartilhados
+# entre processos. Cada acerto atualiza o mtime do arquivo, e a limpeza remove
+# os menos usados (mtime mais antigo) quando a pasta passa de
+# CACHE_PDF_LIMITE_MB ou de CACHE_PDF_LIMITE_ARQUIVOS. CACHE_PDF_LIMITE_MB=0
+# desativa o cache.
+
+CACHE_PDF_PASTA = os.environ.get("CACHE_PDF_PASTA", "cache_pdf")
+LIMITE_BYTES = int(float(os.environ.get("CACHE_PDF_LIMITE_MB", "256")) * 1024 * 1024)
+LIMITE_ARQUIVOS = int(os.environ.get("CACHE_PDF_LIMITE_ARQUIVOS", "20000"))
+
+_lock = threading.Lock()
+_digests = {}             # caminho absoluto -> (mtime_ns, tamanho, sha256)
+_uso = {"bytes": None, "arquivos": None}  # estimativa deste processo; None = ainda não varreu a pasta
+_metricas = {"acertos": 0, "faltas": 0, "gravados": 0, "removidos": 0, "erros_gravacao": 0}
+
+
+def ativo():
+    return LIMITE_BYTES > 0 and LIMITE_ARQUIVOS > 0
+
+
+def digest_arquivo(caminho):
+    """SHA-256 do conteúdo do arquivo (em cache pelo mtime/tamanho). None se não existir."""
+    if not caminho:
+        return None
+    caminho = os.path.abspath(caminho)
+    try:
+        info = os.stat(caminho)
+    except OSError:
+        return None
+    with _lock:
+        entrada = _digests.get(caminho)
+    if entrada and entrada[0] == info.st_mtime_ns and entrada[1] == info.st_size:
+        return entrada[2]
+    h = hashlib.sha256()
+    try:
+        with open(caminho, "rb") as f:
+            for bloco in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloco)
+    except OSError:
+        return None  # sem permissão de leitura: a renderização avisa ao tentar desenhar a imagem
+    digest = h.hexdigest()
+    with _lock:
+        _digests[caminho] = (info.st_mtime_ns, info.st_size, digest)
+    return digest
+
+
+def chave(parametros, imagens=()):
+    """
+    Chave de conteúdo: parametros (dict serializável em JSON) e os caminhos das
+    imagens usadas, que entram pelo digest do conteúdo e não pelo caminho.
+    """
+    canonico = json.dumps(
+        {"parametros": parametros, "imagens": [digest_arquivo(c) for c in imagens]},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()
+
+
+def _caminho(chave_pdf):
+    return os.path.join(CACHE_PDF_PASTA, chave_pdf[:2], chave_pdf + ".pdf")
+
+
+def obter(chave_pdf):
+    """Bytes do PDF guardado, ou None (inclusive se a pasta não puder ser lida: a receita é renderizada)."""
+    caminho = _caminho(chave_pdf)
+    try:
+        with open(caminho, "rb") as f:
+            dados = f.read()
+    except OSError:  # inexistente, removido pela limpeza de outro processo, sem permissão...
+        with _lock:
+            _metricas["faltas"] += 1
+        return None
+    try:
+        os.utime(caminho)  # marca como usado agora (LRU)
+    except OSError:
+        pass  # pasta somente leitura: o PDF serve do mesmo jeito, só não sobe na ordem da limpeza
+    with _lock:
+        _metricas["acertos"] += 1
+    return dados
+
+
+def guardar(chave_pdf, dados):
+    """Guarda o PDF. Falha de gravação (disco cheio, sem permissão) só deixa de guardar."""
+    try:
+        gravar_bytes_atomico(_caminho(chave_pdf), dados)
+    except OSError as e:
+        with _lock:
+            _metricas["erros_gravacao"] += 1
+        print(f"[Aviso] Não foi possível guardar o PDF no cache: {e}")
+        return
+    with _lock:
+        _metricas["gravados"] += 1
+        if _uso["bytes"] is not None:
+            _uso["bytes"] += len(dados)
+            _uso["arquivos"] += 1
+        excedeu = _uso["bytes"] is None or _uso["bytes"] > LIMITE_BYTES or _uso["arquivos"] > LIMITE_ARQUIVOS
+    if excedeu:
+        limpar()
+
+
+def _listar():
+    arquivos = []
+    try:
+        pastas = list(os.scandir(CACHE_PDF_PASTA))
+    except FileNotFoundError:
+        return arquivos
+    for pasta in pastas:
+        if not pasta.is_dir():
+            continue
+        for entrada in os.scandir(pasta.path):
+            if entrada.name.endswith(".pdf"):
+                try:
+                    info = entrada.stat()
+                except FileNotFoundError:
+                    continue
+                arquivos.append((info.st_mtime, info.st_size, entrada.path))
+    return arquivos
+
+
+def limpar(limite_bytes=None, limite_arquivos=None):
+    """
+    Remove os PDFs usados há mais tempo até a pasta ficar abaixo de 90% dos
+    limites (a folga evita varrer a pasta a cada gravação). Retorna quantos removeu.
+    """
+    limite_bytes = LIMITE_BYTES if limite_bytes is None else limite_bytes
+    limite_arquivos = LIMITE_ARQUIVOS if limite_arquivos is None else limite_arquivos
+    arquivos = _listar()
+    total = sum(tamanho for _, tamanho, _ in arquivos)
+    quantidade = len(arquivos)
+    removidos = 0
+    if total > limite_bytes or quantidade > limite_arquivos:
+        alvo_bytes = limite_bytes * 0.9
+        alvo_arquivos = limite_arquivos * 0.9
+        arquivos.sort()
+        for _, tamanho, caminho in arquivos:
+            if total <= alvo_bytes and quantidade <= alvo_arquivos:
+                break
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+            total -= tamanho
+            quantidade -= 1
+            removidos += 1
+    with _lock:
+        _uso["bytes"] = total
+        _uso["arquivos"] = quantidade
+        _metricas["removidos"] += removidos
+    return removidos
+
+
+def metricas_cache_pdf():
+    with _lock:
+        resultado = dict(_metricas)
+        resultado["bytes"] = _uso["bytes"]
+        resultado["arquivos"] = _uso["arquivos"]
+    return resultado
@@ -0,0 +1,402 @@
+import os
+import re
+import json
+import time
+import random
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import cep_base
+
+# ----------------------------------------------
+# CONSULTA DE CEP (VIACEP) COM CACHE
+# ----------------------------------------------
+# Ordem da consulta:
+#   1. LRU em memória no processo (consultas repetidas em microssegundos);
+#   2. base de CEPs offline, se importada (ver cep_base.py);
+#   3. cache em SQLite em disco, com validade (TTL), compartilhado entre
+#      processos e preservado entre reinícios;
+#   4. ViaCEP, só como último recurso.
+# CEPs inexistentes ("erro" na resposta) também ficam em cache, com validade
+# menor. Falhas de rede não entram no cache.
+#
+# Para testes, VIACEP_URL pode apontar para o servidor local de
+# benchmarks/viacep_stub.py (ex.: http://127.0.0.1:8765/ws).
+
+VIACEP_URL = os.environ.get("VIACEP_URL", "https://viacep.com.br/ws").rstrip("/")
+VIACEP_TIMEOUT_CONEXAO = float(os.environ.get("VIACEP_TIMEOUT_CONEXAO", "3"))  # segundos
+VIACEP_TIMEOUT = float(os.environ.get("VIACEP_TIMEOUT", "10"))                  # leitura, segundos
+VIACEP_TENTATIVAS = int(os.environ.get("VIACEP_TENTATIVAS", "3"))               # incluindo a primeira
+VIACEP_ESPERA_BASE = float(os.environ.get("VIACEP_ESPERA_BASE", "0.2"))         # backoff, segundos
+VIACEP_CONEXOES = int(os.environ.get("VIACEP_CONEXOES", "10"))                  # conexões mantidas abertas
+CIRCUITO_FALHAS = int(os.environ.get("VIACEP_CIRCUITO_FALHAS", "5"))            # falhas seguidas para abrir
+CIRCUITO_PAUSA = float(os.environ.get("VIACEP_CIRCUITO_PAUSA", "30"))           # segundos com o circuito aberto
+CEP_CACHE_ARQUIVO = os.environ.get("CEP_CACHE_ARQUIVO", "cep_cache.db")
+CEP_TTL = int(os.environ.get("CEP_TTL", str(30 * 24 * 3600)))             # CEP encontrado: 30 dias
+CEP_TTL_NEGATIVO = int(os.environ.get("CEP_TTL_NEGATIVO", str(24 * 3600)))  # CEP inexistente: 1 dia
+LIMITE_CEPS = int(os.environ.get("CACHE_CEPS_LIMITE", "2048"))               # entradas no LRU
+CEP_WORKERS = int(os.environ.get("CEP_WORKERS", "4"))                         # threads das buscas em segundo plano
+
+CAMPOS_ENDERECO = ("logradouro", "bairro", "localidade", "uf")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cep_cache (
+    cep TEXT PRIMARY KEY,
+    dados TEXT NOT NULL,
+    expira REAL NOT NULL
+);
+"""
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # cep -> (expira, dados)
+_local = threading.local()
+
+
+def limpar_cep(cep):
+    return re.sub(r'\D', '', cep or "")
+
+
+def _conectar():
+    # Uma conexão por thread e por arquivo (o arquivo pode mudar em testes).
+    conexoes = getattr(_local, "conexoes", None)
+    if conexoes is None:
+        conexoes = _local.conexoes = {}
+    conn = conexoes.get(CEP_CACHE_ARQUIVO)
+    if conn is None:
+        pasta = os.path.dirname(CEP_CACHE_ARQUIVO)
+        if pasta and not os.path.exists(pasta):
+            os.makedirs(pasta, exist_ok=True)
+        conn = sqlite3.connect(CEP_CACHE_ARQUIVO, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        conexoes[CEP_CACHE_ARQUIVO] = conn
+    return conn
+
+
+def _guardar_memoria(cep, expira, dados):
+    with _lock:
+        _cache[cep] = (expira, dados)
+        _cache.move_to_end(cep)
+        while len(_cache) > LIMITE_CEPS:
+            _cache.popitem(last=False)
+
+
+def _ler_memoria(cep, agora):
+    with _lock:
+        entrada = _cache.get(cep)
+        if entrada is not None:
+            if entrada[0] > agora:
+                _cache.move_to_end(cep)
+                return entrada[1]
+            del _cache[cep]
+    return None
+
+
+def _ler_disco(cep, agora):
+    try:
+        linha = _conectar().execute(
+            "SELECT dados, expira FROM cep_cache WHERE cep = ?", (cep,)
+        ).fetchone()
+    except sqlite3.Error:
+        return None
+    if linha is None or linha[1] <= agora:
+        return None
+    dados = json.loads(linha[0])
+    _guardar_memoria(cep, linha[1], dados)
+    return dados
+
+
+def _gravar_cache(cep, dados, agora):
+    expira = agora + (CEP_TTL if dados else CEP_TTL_NEGATIVO)
+    _guardar_memoria(cep, expira, dados)
+    try:
+        conn = _conectar()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cep_cache (cep, dados, expira) VALUES (?, ?, ?)",
+                (cep, json.dumps(dados, ensure_ascii=False), expira)
+            )
+    except sqlite3.Error:
+        # Sem disco o cache em memória continua valendo.
+        pass
+
+
+# ----------------------------------------------
+# CLIENTE HTTP DO VIACEP (SESSÃO, RETENTATIVAS, DISJUNTOR, MÉTRICAS)
+# ----------------------------------------------
+# Uma única requests.Session por processo mantém as conexões (TCP + TLS)
+# abertas entre consultas. Falhas de rede, timeouts e respostas 5xx/429 são
+# tentadas de novo com backoff exponencial e jitter. Depois de
+# CIRCUITO_FALHAS consultas seguidas com falha o circuito abre e, por
+# CIRCUITO_PAUSA segundos, as consultas falham na hora (CircuitoAberto) em vez
+# de esperar o timeout; passada a pausa, uma consulta de teste decide se fecha.
+
+class CircuitoAberto(Exception):
+    """ViaCEP indisponível: consultas suspensas temporariamente."""
+
+
+class _ErroTemporario(Exception):
+    pass
+
+
+# Limites (em segundos) dos baldes do histograma de latência da rede
+BALDES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock_http = threading.Lock()
+_sessao = None
+_falhas_seguidas = 0
+_aberto_ate = 0.0
+_metricas = {
+    "consultas": 0,            # chamadas a consultar_cep com CEP válido
+    "acertos_memoria": 0,
+    "acertos_base": 0,
+    "acertos_disco": 0,
+    "consultas_rede": 0,       # consultas que chegaram ao ViaCEP
+    "tentativas_rede": 0,      # requisições HTTP feitas (inclui retentativas)
+    "timeouts": 0,
+    "erros_rede": 0,           # consultas de rede que falharam no final
+    "rejeitadas_circuito": 0,
+    "aberturas_circuito": 0,
+    "latencia_soma": 0.0,      # segundos, consultas de rede (com retentativas)
+    "latencia_baldes": [0] * (len(BALDES_LATENCIA) + 1),
+}
+
+
+def _contar(nome, valor=1):
+    with _lock_http:
+        _metricas[nome] += valor
+
+
+def _obter_sessao():
+    global _sessao
+    with _lock_http:
+        if _sessao is None:
+            sessao = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=VIACEP_CONEXOES)
+            sessao.mount("https://", adaptador)
+            sessao.mount("http://", adaptador)
+            _sessao = sessao
+        return _sessao
+
+
+def _verificar_circuito():
+    global _aberto_ate
+    with _lock_http:
+        if _falhas_seguidas < CIRCUITO_FALHAS:
+            return
+        agora = time.monotonic()
+        if agora < _aberto_ate:
+            _metricas["rejeitadas_circuito"] += 1
+            raise CircuitoAberto("ViaCEP indisponível; nova tentativa em instantes.")
+        # Pausa encerrada: esta consulta é o teste; as demais seguem rejeitadas até o resultado.
+        _aberto_ate = agora + CIRCUITO_PAUSA
+
+
+def _registrar_resultado(sucesso, latencia):
+    global _falhas_seguidas, _aberto_ate
+    with _lock_http:
+        _metricas["latencia_soma"] += latencia
+        balde = len(BALDES_LATENCIA)
+        for i, limite in enumerate(BALDES_LATENCIA):
+            if latencia <= limite:
+                balde = i
+                break
+        _metricas["latencia_baldes"][balde] += 1
+        if sucesso:
+            _falhas_seguidas = 0
+            return
+        _metricas["erros_rede"] += 1
+        _falhas_seguidas += 1
+        if _falhas_seguidas >= CIRCUITO_FALHAS:
+            if _falhas_seguidas == CIRCUITO_FALHAS:
+                _metricas["aberturas_circuito"] += 1
+            _aberto_ate = time.monotonic() + CIRCUITO_PAUSA
+
+
+def _requisitar(url):
+    sessao = _obter_sessao()
+    for tentativa in range(max(1, VIACEP_TENTATIVAS)):
+        if tentativa:
+            # Backoff exponencial com jitter total, para as sessões não tentarem juntas
+            time.sleep(random.uniform(0, VIACEP_ESPERA_BASE * (2 ** (tentativa - 1))))
+        _contar("tentativas_rede")
+        try:
+            r = sessao.get(url, timeout=(VIACEP_TIMEOUT_CONEXAO, VIACEP_TIMEOUT))
+        except requests.Timeout as e:
+            _contar("timeouts")
+            erro = e
+            continue
+        except requests.ConnectionError as e:
+            erro = e
+            continue
+        if r.status_code >= 500 or r.status_code == 429:
+            erro = _ErroTemporario(f"ViaCEP respondeu {r.status_code}")
+            continue
+        r.raise_for_status()
+        return r.json()
+    raise erro
+
+
+def _consultar_viacep(cep_limpo):
+    """Consulta o ViaCEP. Retorna o endereço, {} para CEP inexistente, ou levanta exceção em falha de rede."""
+    _verificar_circuito()
+    _contar("consultas_rede")
+    inicio = time.perf_counter()
+    try:
+        dados = _requisitar(f"{VIACEP_URL}/{cep_limpo}/json/")
+    except (requests.RequestException, _ErroTemporario, ValueError):
+        _registrar_resultado(False, time.perf_counter() - inicio)
+        raise
+    _registrar_resultado(True, time.perf_counter() - inicio)
+    if "erro" in dados:
+        return {}
+    return {campo: dados.get(campo, "") for campo in CAMPOS_ENDERECO}
+
+
+def metricas_cep():
+    """Cópia das métricas da consulta de CEP (contadores e histograma de latência da rede)."""
+    with _lock_http:
+        metricas = dict(_metricas)
+        metricas["latencia_baldes"] = list(_metricas["latencia_baldes"])
+        metricas["circuito_aberto"] = _falhas_seguidas >= CIRCUITO_FALHAS and time.monotonic() < _aberto_ate
+    metricas["baldes_latencia"] = BALDES_LATENCIA
+    return metricas
+
+
+def _consultar_local(cep_limpo, agora):
+    """Memória, base offline e cache em disco, sem rede. Retorna None se o CEP não está em nenhum."""
+    _contar("consultas")
+    dados = _ler_memoria(cep_limpo, agora)
+    if dados is not None:
+        _contar("acertos_memoria")
+        return dados
+    # A base offline vem antes do cache em disco: um CEP importado depois de
+    # ter sido cacheado como inexistente passa a ser encontrado.
+    try:
+        dados = cep_base.buscar(cep_limpo)
+    except sqlite3.Error:
+        dados = None
+    if dados is not None:
+        _contar("acertos_base")
+        _guardar_memoria(cep_limpo, agora + CEP_TTL, dados)
+        return dados
+    dados = _ler_disco(cep_limpo, agora)
+    if dados is not None:
+        _contar("acertos_disco")
+    return dados
+
+
+def consultar_cep(cep):
+    """
+    Busca o endereço do CEP passando pelo cache. Retorna {} para CEP inválido
+    ou inexistente; falhas de rede levantam a exceção (e não são cacheadas).
+    """
+    cep_limpo = limpar_cep(cep)
+    if len(cep_limpo) != 8:
+        return {}
+    agora = time.time()
+    dados = _consultar_local(cep_limpo, agora)
+    if dados is not None:
+        return dict(dados)
+    dados = _consultar_viacep(cep_limpo)
+    _gravar_cache(cep_limpo, dados, agora)
+    return dict(dados)
+
+
+def buscar_endereco_via_cep(cep: str) -> dict:
+    """Tenta buscar o endereço via CEP. Se não achar (ou a consulta falhar), retorna dicionário vazio."""
+    try:
+        return consultar_cep(cep)
+    except Exception:
+        return {}
+
+
+def invalidar_cep(cep=None):
+    """Remove um CEP dos dois níveis de cache (ou tudo, se cep for None)."""
+    with _lock:
+        if cep is None:
+            _cache.clear()
+        else:
+            _cache.pop(limpar_cep(cep), None)
+    try:
+        conn = _conectar()
+        with conn:
+            if cep is None:
+                conn.execute("DELETE FROM cep_cache")
+            else:
+                conn.execute("DELETE FROM cep_cache WHERE cep = ?", (limpar_cep(cep),))
+    except sqlite3.Error:
+        pass
+
+
+# ----------------------------------------------
+# BUSCA EM SEGUNDO PLANO
+# ----------------------------------------------
+# Para o formulário não congelar esperando o ViaCEP: a busca de rede roda em
+# um pool de threads do processo e a tela guarda o Future, conferindo o
+# resultado nas próximas execuções do script. Buscas simultâneas do mesmo CEP
+# (inclusive de sessões diferentes) compartilham um único Future.
+
+_lock_busca = threading.Lock()
+_executor = None
+_em_andamento = {}  # cep -> Future
+
+
+def _obter_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=CEP_WORKERS, thread_name_prefix="cep")
+    return _executor
+
+
+def _buscar_na_rede(cep_limpo):
+    """
+    Parte de rede da busca em segundo plano (a local já foi feita e contada em
+    iniciar_busca_cep): ViaCEP e cache, com o {} de buscar_endereco_via_cep em falha.
+    """
+    agora = time.time()
+    try:
+        dados = _consultar_viacep(cep_limpo)
+        _gravar_cache(cep_limpo, dados, agora)
+    except Exception:
+        return {}
+    return dict(dados)
+
+
+def _concluir_busca(cep_limpo, futuro):
+    with _lock_busca:
+        if _em_andamento.get(cep_limpo) is futuro:
+            del _em_andamento[cep_limpo]
+
+
+def iniciar_busca_cep(cep):
+    """
+    Inicia a busca do CEP em segundo plano e retorna um Future com o mesmo
+    resultado de buscar_endereco_via_cep. CEPs já conhecidos (memória, base
+    offline, cache em disco) voltam com o Future já concluído.
+    """
+    cep_limpo = limpar_cep(cep)
+    if len(cep_limpo) != 8:
+        futuro = Future()
+        futuro.set_result({})
+        return futuro
+    dados = _consultar_local(cep_limpo, time.time())
+    if dados is not None:
+        futuro = Future()
+        futuro.set_result(dict(dados))
+        return futuro
+    with _lock_busca:
+        futuro = _em_andamento.get(cep_limpo)
+        if futuro is not None:
+            return futuro
+        futuro = _obter_executor().submit(_buscar_na_rede, cep_limpo)
+        _em_andamento[cep_limpo] = futuro
+    # Fora da trava: se a busca já terminou, o callback roda aqui mesmo.
+    futuro.add_done_callback(lambda f, c=cep_limpo: _concluir_busca(c, f))
+    return futuro
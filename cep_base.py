@@ -0,0 +1,221 @@
+import os
+import re
+import csv
+import sys
+import sqlite3
+import argparse
+import threading
+
+# ----------------------------------------------
+# BASE DE CEPS OFFLINE
+# ----------------------------------------------
+# Índice local (SQLite, chave = CEP de 8 dígitos) importado em lote de um CSV
+# de CEPs. Responde às consultas de buscar_endereco_via_cep sem rede, e
+# permite consultas por faixa e pelo prefixo de 5 dígitos (região/setor).
+# O ViaCEP passa a ser usado só para CEPs que não estão na base.
+#
+# Uso:
+#   python cep_base.py importar ceps.csv [--base ceps.db]
+#   python cep_base.py buscar 80010-000
+#   python cep_base.py prefixo 80010
+
+CEP_BASE_ARQUIVO = os.environ.get("CEP_BASE_ARQUIVO", "ceps.db")
+
+CAMPOS_ENDERECO = ("logradouro", "bairro", "localidade", "uf")
+
+# Nomes de coluna aceitos no CSV para cada campo (comparação sem caixa)
+_ALIASES = {
+    "cep": ("cep", "codigo", "código"),
+    "logradouro": ("logradouro", "endereco", "endereço", "rua"),
+    "bairro": ("bairro",),
+    "localidade": ("localidade", "cidade", "municipio", "município"),
+    "uf": ("uf", "estado"),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ceps (
+    cep TEXT PRIMARY KEY,
+    logradouro TEXT NOT NULL,
+    bairro TEXT NOT NULL,
+    localidade TEXT NOT NULL,
+    uf TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+_TAMANHO_BLOCO = 10000
+
+_local = threading.local()
+
+
+def _somente_digitos(texto):
+    return re.sub(r'\D', '', texto or "")
+
+
+def _mapear_colunas(cabecalho):
+    normalizado = {(nome or "").strip().lower(): nome for nome in cabecalho}
+    colunas = {}
+    for campo, nomes in _ALIASES.items():
+        for nome in nomes:
+            if nome in normalizado:
+                colunas[campo] = normalizado[nome]
+                break
+    if "cep" not in colunas:
+        raise ValueError("O CSV precisa de uma coluna 'cep'.")
+    return colunas
+
+
+def _linhas_csv(caminho_csv, delimitador=None):
+    with open(caminho_csv, "r", encoding="utf-8-sig", newline="") as f:
+        if delimitador is None:
+            amostra = f.read(4096)
+            f.seek(0)
+            delimitador = csv.Sniffer().sniff(amostra, delimiters=",;\t|").delimiter
+        leitor = csv.DictReader(f, delimiter=delimitador)
+        colunas = _mapear_colunas(leitor.fieldnames or [])
+        for linha in leitor:
+            cep = _somente_digitos(linha.get(colunas["cep"]))
+            if len(cep) != 8:
+                continue
+            yield (cep,) + tuple(
+                (linha.get(colunas[campo]) or "").strip() if campo in colunas else ""
+                for campo in CAMPOS_ENDERECO
+            )
+
+
+def importar_csv(caminho_csv, caminho_base=None, delimitador=None):
+    """
+    Importa o CSV para a base. A base é montada em um arquivo temporário e
+    renomeada no final, então consultas em andamento nunca veem uma base pela
+    metade. Retorna o número de CEPs importados.
+    """
+    caminho_base = caminho_base or CEP_BASE_ARQUIVO
+    pasta = os.path.dirname(caminho_base)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta, exist_ok=True)
+    temporario = caminho_base + ".tmp"
+    if os.path.exists(temporario):
+        os.remove(temporario)
+    conn = sqlite3.connect(temporario)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.executescript(_SCHEMA)
+        bloco = []
+        with conn:
+            for linha in _linhas_csv(caminho_csv, delimitador):
+                bloco.append(linha)
+                if len(bloco) >= _TAMANHO_BLOCO:
+                    conn.executemany("INSERT OR REPLACE INTO ceps VALUES (?, ?, ?, ?, ?)", bloco)
+                    bloco = []
+            if bloco:
+                conn.executemany("INSERT OR REPLACE INTO ceps VALUES (?, ?, ?, ?, ?)", bloco)
+        total = conn.execute("SELECT COUNT(*) FROM ceps").fetchone()[0]
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(temporario, caminho_base)
+    fechar()
+    return total
+
+
+def _conectar(caminho_base=None):
+    """Conexão somente leitura por thread. Retorna None se a base não existe."""
+    caminho_base = caminho_base or CEP_BASE_ARQUIVO
+    conexoes = getattr(_local, "conexoes", None)
+    if conexoes is None:
+        conexoes = _local.conexoes = {}
+    entrada = conexoes.get(caminho_base)
+    try:
+        info = os.stat(caminho_base)
+    except OSError:
+        return None
+    # Base reimportada (outro arquivo no mesmo caminho): reabre a conexão.
+    if entrada is not None and entrada[0] == (info.st_ino, info.st_mtime_ns):
+        return entrada[1]
+    if entrada is not None:
+        entrada[1].close()
+    conn = sqlite3.connect(f"file:{os.path.abspath(caminho_base)}?mode=ro", uri=True)
+    conexoes[caminho_base] = ((info.st_ino, info.st_mtime_ns), conn)
+    return conn
+
+
+def fechar():
+    conexoes = getattr(_local, "conexoes", {})
+    for _, conn in conexoes.values():
+        conn.close()
+    conexoes.clear()
+
+
+def _como_endereco(linha):
+    return dict(zip(CAMPOS_ENDERECO, linha))
+
+
+def buscar(cep, caminho_base=None):
+    """Endereço do CEP na base local, no formato de buscar_endereco_via_cep. None se não está na base."""
+    cep = _somente_digitos(cep)
+    if len(cep) != 8:
+        return None
+    conn = _conectar(caminho_base)
+    if conn is None:
+        return None
+    linha = conn.execute(
+        "SELECT logradouro, bairro, localidade, uf FROM ceps WHERE cep = ?", (cep,)
+    ).fetchone()
+    return _como_endereco(linha) if linha else None
+
+
+def buscar_faixa(cep_inicio, cep_fim, limite=100, caminho_base=None):
+    """CEPs entre cep_inicio e cep_fim (inclusivos). Retorna lista de (cep, endereço)."""
+    conn = _conectar(caminho_base)
+    if conn is None:
+        return []
+    inicio = _somente_digitos(cep_inicio).ljust(8, "0")
+    fim = _somente_digitos(cep_fim).ljust(8, "9")
+    linhas = conn.execute(
+        "SELECT cep, logradouro, bairro, localidade, uf FROM ceps "
+        "WHERE cep >= ? AND cep <= ? ORDER BY cep LIMIT ?",
+        (inicio, fim, int(limite))
+    ).fetchall()
+    return [(linha[0], _como_endereco(linha[1:])) for linha in linhas]
+
+
+def buscar_prefixo(prefixo, limite=100, caminho_base=None):
+    """CEPs que começam com o prefixo (normalmente os 5 primeiros dígitos)."""
+    prefixo = _somente_digitos(prefixo)[:8]
+    if not prefixo:
+        return []
+    return buscar_faixa(prefixo, prefixo, limite, caminho_base)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Base de CEPs offline.")
+    parser.add_argument("--base", default=None, help=f"Arquivo da base (padrão: {CEP_BASE_ARQUIVO})")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_importar = sub.add_parser("importar", help="Importa um CSV de CEPs")
+    p_importar.add_argument("csv")
+    p_importar.add_argument("--delimitador", default=None)
+    p_buscar = sub.add_parser("buscar", help="Busca um CEP")
+    p_buscar.add_argument("cep")
+    p_prefixo = sub.add_parser("prefixo", help="Lista os CEPs de um prefixo")
+    p_prefixo.add_argument("prefixo")
+    p_prefixo.add_argument("--limite", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    if args.comando == "importar":
+        total = importar_csv(args.csv, args.base, args.delimitador)
+        print(f"{total} CEPs importados em {args.base or CEP_BASE_ARQUIVO}.")
+    elif args.comando == "buscar":
+        endereco = buscar(args.cep, args.base)
+        if endereco is None:
+            print("CEP não encontrado na base.")
+            return 1
+        print(endereco)
+    else:
+        for cep, endereco in buscar_prefixo(args.prefixo, args.limite, args.base):
+            print(f"{cep[:5]}-{cep[5:]}  {endereco['logradouro']}, {endereco['bairro']}, "
+                  f"{endereco['localidade']}-{endereco['uf']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
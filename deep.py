@@ -1,13 +1,11 @@
 import os
-import json
 import datetime
 import re
-import requests
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.lib import colors
 import streamlit as st
+from cep import iniciar_busca_cep
+from receita_pdf import formatar_cpf, formatar_cep, gerar_pdf_receita
+import usuarios as usuarios_dir
+from armazenamento import gravar_bytes_atomico
 
 # ----------------------------------------------
 # CONSTANTES E CONFIGURAÇÕES
@@ -24,19 +22,12 @@ ADMIN_SENHA = "31415962Isa@"
 # ----------------------------------------------
 
 def carregar_usuarios():
-    """Carrega o dicionário de usuários a partir de um arquivo JSON."""
-    if not os.path.exists(USERS_FILE):
-        return {}
-    with open(USERS_FILE, "r", encoding="utf-8") as f:
-        try:
-            return json.load(f)
-        except:
-            return {}
+    """Carrega o dicionário de usuários (do cache em memória, relido se o arquivo mudar)."""
+    return usuarios_dir.carregar(USERS_FILE)
 
 def salvar_usuarios(usuarios):
-    """Salva o dicionário de usuários em um arquivo JSON."""
-    with open(USERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(usuarios, f, indent=4, ensure_ascii=False)
+    """Salva o dicionário de usuários em um arquivo JSON (gravação atômica)."""
+    usuarios_dir.salvar(USERS_FILE, usuarios)
 
 def verificar_login(login, senha):
     """
@@ -54,10 +45,9 @@ def verificar_login(login, senha):
             "crmv": None
         }
 
-    # Caso contrário, verifica no arquivo de usuários:
-    usuarios = carregar_usuarios()
-    user_data = usuarios.get(login)
-    if user_data and user_data.get("password") == senha:
+    # Caso contrário, verifica no diretório de usuários (senha com hash):
+    user_data = usuarios_dir.autenticar(USERS_FILE, login, senha)
+    if user_data:
         return {
             "login": login,
             "is_admin": user_data.get("is_admin", False),
@@ -70,28 +60,19 @@ def verificar_login(login, senha):
     return None
 
 def cadastrar_usuario(novo_login, nova_senha, nome_vet=None, crmv=None, is_admin=False):
-    """Cadastra um novo usuário (ou atualiza se já existir)."""
-    usuarios = carregar_usuarios()
-    if novo_login not in usuarios:
-        usuarios[novo_login] = {}
-    usuarios[novo_login]["password"] = nova_senha
-    usuarios[novo_login]["is_admin"] = is_admin
-    usuarios[novo_login]["nome_vet"] = nome_vet
-    usuarios[novo_login]["crmv"] = crmv
-    # Se ainda não existir, define None para imagens
-    if "background_image" not in usuarios[novo_login]:
-        usuarios[novo_login]["background_image"] = None
-    if "signature_image" not in usuarios[novo_login]:
-        usuarios[novo_login]["signature_image"] = None
-
-    salvar_usuarios(usuarios)
+    """Cadastra um novo usuário (ou atualiza se já existir). A senha é guardada como hash."""
+    usuarios_dir.cadastrar(
+        USERS_FILE,
+        novo_login,
+        nova_senha,
+        is_admin=is_admin,
+        nome_vet=nome_vet,
+        crmv=crmv
+    )
 
 def remover_usuario(login):
     """Remove um usuário do arquivo JSON."""
-    usuarios = carregar_usuarios()
-    if login in usuarios:
-        del usuarios[login]
-        salvar_usuarios(usuarios)
+    if usuarios_dir.remover(USERS_FILE, login):
         # Opcional: remover pasta local de arquivos do usuário
         user_folder = os.path.join(USER_FILES_DIR, login)
         if os.path.exists(user_folder):
@@ -103,318 +84,10 @@ def atualizar_imagem_usuario(login, image_path, tipo="fundo"):
     Atualiza o path de imagem de fundo ou assinatura do usuário no JSON.
     tipo='fundo' ou tipo='assinatura'.
     """
-    usuarios = carregar_usuarios()
-    if login not in usuarios:
-        return
-
     if tipo == "fundo":
-        usuarios[login]["background_image"] = image_path
+        usuarios_dir.alterar(USERS_FILE, login, background_image=image_path)
     else:
-        usuarios[login]["signature_image"] = image_path
-
-    salvar_usuarios(usuarios)
-
-# ----------------------------------------------
-# FUNÇÕES DE APOIO GERAIS
-# ----------------------------------------------
-
-def formatar_cpf(cpf_str: str) -> str:
-    digits = re.sub(r'\D', '', cpf_str)
-    if len(digits) == 11:
-        return f"{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}"
-    return cpf_str
-
-def formatar_cep(cep_str: str) -> str:
-    """Formata o CEP no padrão 12345-678."""
-    digits = re.sub(r'\D', '', cep_str)
-    if len(digits) == 8:
-        return f"{digits[:5]}-{digits[5:]}"
-    return cep_str
-
-def buscar_endereco_via_cep(cep: str) -> dict:
-    """Tenta buscar o endereço via CEP. Se não achar, retorna dicionário vazio."""
-    cep_limpo = re.sub(r'\D', '', cep)
-    if not cep_limpo:
-        return {}
-    try:
-        url = f"https://viacep.com.br/ws/{cep_limpo}/json/"
-        r = requests.get(url, timeout=10)
-        r.raise_for_status()
-        dados = r.json()
-        # Se "erro" em dados, retorna vazio
-        if "erro" in dados:
-            return {}
-        return {
-            "logradouro": dados.get("logradouro", ""),
-            "bairro": dados.get("bairro", ""),
-            "localidade": dados.get("localidade", ""),
-            "uf": dados.get("uf", "")
-        }
-    except:
-        return {}
-
-def wrap_text(text, font_name, font_size, available_width, c):
-    """
-    Quebra o texto em múltiplas linhas para que não ultrapasse a largura disponível.
-    """
-    words = text.split()
-    lines = []
-    current_line = ""
-    c.setFont(font_name, font_size)
-    for word in words:
-        test_line = word if current_line == "" else current_line + " " + word
-        if c.stringWidth(test_line, font_name, font_size) <= available_width:
-            current_line = test_line
-        else:
-            if current_line:
-                lines.append(current_line)
-            current_line = word
-    if current_line:
-        lines.append(current_line)
-    return lines
-
-# ----------------------------------------------
-# FUNÇÃO PRINCIPAL PARA GERAR O PDF
-# ----------------------------------------------
-
-def gerar_pdf_receita(
-    nome_pdf="receita_veterinaria.pdf",
-    tipo_farmacia="FARMÁCIA VETERINÁRIA",
-    paciente="",
-    tutor="",
-    cpf="",
-    rg="",
-    endereco_formatado="",
-    especie_raca="",
-    pelagem="",
-    peso="",
-    idade="",
-    sexo="",
-    chip="",
-    lista_medicamentos=None,
-    instrucoes_uso="",
-    data_receita=None,
-    # Imagens de fundo/assinatura
-    imagem_fundo=None,
-    imagem_assinatura=None,
-    # Nome e CRMV do(a) veterinário(a)
-    nome_vet=None,
-    crmv=None
-):
-    """
-    Gera o PDF da receita, incluindo:
-      - Configurações de posição para assinatura e campos.
-      - Quebra de linha para endereço.
-      - Outras formatações necessárias.
-    """
-    if lista_medicamentos is None:
-        lista_medicamentos = []
-    if not data_receita:
-        data_receita = datetime.datetime.now().strftime("%d/%m/%Y")
-
-    # Padroniza se faltar algo
-    if not nome_vet:
-        nome_vet = "NOME NÃO DEFINIDO"
-    if not crmv:
-        crmv = "00000"
-    nome_vet_up = nome_vet.upper()
-
-    largura, altura = A4
-    c = canvas.Canvas(nome_pdf, pagesize=A4)
-
-    # ----- Configurações de Fonte -----
-    font_label = "Helvetica-Bold"
-    font_value = "Helvetica"
-    font_label_size = 9
-    font_value_size = 9
-    font_title_size = 13
-    font_med_title = 10
-    font_footer = 10
-
-    # ----- Configurações de Margens -----
-    margem_esquerda = 2 * cm
-    margem_direita = 2 * cm
-    largura_util = largura - margem_esquerda - margem_direita
-
-    # ----- Configurações de Posição -----
-    config_posicoes = {
-        "assinatura_x": (largura / 2) - 4 * cm,  # 4 cm à esquerda do centro
-        "assinatura_y": 6.3 * cm,                 # 8 cm do fundo
-        "assinatura_width": 4 * cm,
-        "assinatura_height": 1.5 * cm,
-        "data_y": 5.8 * cm,  # Aproximadamente logo abaixo da assinatura
-        "mv_y": 5.3 * cm,
-        "crmv_y": 4.8 * cm
-    }
-
-    # ----- Inserção da Imagem de Fundo -----
-    if imagem_fundo and os.path.exists(imagem_fundo):
-        try:
-            c.drawImage(
-                imagem_fundo,
-                0, 0,
-                width=largura,
-                height=altura,
-                preserveAspectRatio=True,
-                mask='auto'
-            )
-        except Exception as e:
-            st.warning(f"[Aviso] Não foi possível inserir a imagem de fundo: {e}")
-
-    # ----- Título: Tipo de Farmácia -----
-    c.setFont(font_label, font_title_size)
-    c.drawCentredString(largura / 2, altura - 4 * cm, tipo_farmacia.upper())
-
-    # ----- Dados em Duas Colunas Simétricas -----
-    col_width = largura_util / 2
-    col_left_x = margem_esquerda
-    col_right_x = margem_esquerda + col_width
-    y_left = altura - 5 * cm
-    y_right = altura - 5 * cm
-    esp_line = 0.7 * cm
-
-    # Coluna Esquerda: Dados do Animal
-    left_fields = [
-        ("PACIENTE: ", paciente),
-        ("ESPÉCIE - RAÇA: ", especie_raca),
-        ("PELAGEM: ", pelagem),
-        ("SEXO: ", sexo),
-        ("IDADE: ", idade),
-        ("PESO: ", peso),
-        ("CHIP: ", chip)
-    ]
-
-    c.setFont(font_label, font_label_size)
-    for label, valor in left_fields:
-        c.drawString(col_left_x, y_left, label)
-        offset = c.stringWidth(label, font_label, font_label_size)
-        c.setFont(font_value, font_value_size)
-        c.drawString(col_left_x + offset, y_left, valor)
-        c.setFont(font_label, font_label_size)
-        y_left -= esp_line
-
-    # Coluna Direita: Dados do Tutor e Documentos
-    right_fields = [
-        ("TUTOR(A): ", tutor),
-        ("CPF: ", formatar_cpf(cpf))
-    ]
-    if rg:
-        right_fields.append(("RG: ", rg))
-    if endereco_formatado:
-        # Formatar o CEP dentro do endereço
-        cep_match = re.search(r'CEP:\s*(\d{5}-\d{3})', endereco_formatado)
-        if cep_match:
-            cep_raw = cep_match.group(1)
-            cep_formatado = formatar_cep(cep_raw)
-            endereco_formatado = re.sub(r'CEP:\s*\d{5}-\d{3}', f'CEP: {cep_formatado}', endereco_formatado)
-        right_fields.append(("ENDEREÇO: ", endereco_formatado))
-
-    c.setFont(font_label, font_label_size)
-    for label, valor in right_fields:
-        c.drawString(col_right_x, y_right, label)
-        offset = c.stringWidth(label, font_label, font_label_size)
-        c.setFont(font_value, font_value_size)
-        if label.strip(": ") == "ENDEREÇO":
-            available_width = col_width - offset
-            if c.stringWidth(valor, font_value, font_value_size) <= available_width:
-                c.drawString(col_right_x + offset, y_right, valor)
-            else:
-                lines = wrap_text(valor, font_value, font_value_size, available_width, c)
-                if lines:
-                    c.drawString(col_right_x + offset, y_right, lines[0])
-                    for linha in lines[1:]:
-                        y_right -= esp_line
-                        c.drawString(col_right_x, y_right, linha)
-        else:
-            c.drawString(col_right_x + offset, y_right, valor)
-        c.setFont(font_label, font_label_size)
-        y_right -= esp_line
-
-    y_campos = min(y_left, y_right) - 0.5 * cm
-
-    # ----- Lista de Medicamentos -----
-    y_inicial = y_campos - 1.2 * cm
-    c.setFont("Helvetica-Bold", font_med_title)
-    esp_med = 1.6 * cm
-    y_atual = y_inicial
-    for i, med in enumerate(lista_medicamentos, start=1):
-        qtd = med.get("quantidade", "").upper()
-        nome_med = med.get("nome", "").upper()
-        conc = med.get("concentracao", "")
-        texto_med = f"{i}) QTD: {qtd} - MEDICAMENTO: {nome_med}"
-        c.drawString(margem_esquerda, y_atual, texto_med)
-        y_atual -= 0.6 * cm
-
-        if conc:
-            texto_conc = f"   CONCENTRAÇÃO: {conc}"
-            c.setFont(font_value, font_value_size)
-            c.drawString(margem_esquerda, y_atual, texto_conc)
-            c.setFont("Helvetica-Bold", font_med_title)
-            y_atual -= 0.6 * cm
-
-        # Desenha a linha contínua separadora
-        c.setLineWidth(0.5)
-        c.setStrokeColor(colors.black)
-        c.line(margem_esquerda, y_atual + 0.3 * cm, largura - margem_direita, y_atual + 0.3 * cm)
-        y_atual -= 0.4 * cm  # Espaço após a linha
-
-    # ----- Instruções de Uso -----
-    y_inst = y_atual - 1.5 * cm
-    c.setFont("Helvetica-Bold", font_med_title)
-    c.drawString(margem_esquerda, y_inst, "INSTRUÇÕES DE USO: ")
-    y_texto = y_inst - 1 * cm
-    c.setFont("Helvetica", font_value_size)
-    for linha in instrucoes_uso.split("\n"):
-        lines = wrap_text(linha.upper(), "Helvetica", font_value_size, largura_util, c)
-        for l in lines:
-            c.drawString(margem_esquerda, y_texto, l)
-            y_texto -= 0.6 * cm
-
-    # ----- Linha Curva -----
-    y_curva_inicial = y_texto - 1.5 * cm
-    if y_curva_inicial < 0:
-        y_curva_inicial = 0
-    y_curva_final = 8 * cm
-    c.setLineWidth(2)
-    c.setStrokeColor(colors.grey)
-    c.bezier(margem_esquerda, y_curva_inicial,
-             largura / 2, y_curva_inicial + 2 * cm,
-             largura / 2, y_curva_final - 2 * cm,
-             largura - margem_direita, y_curva_final)
-    c.setStrokeColor(colors.black)
-
-    # ----- Rodapé: Assinatura, Data, Nome, CRMV -----
-    # Utiliza as configurações definidas anteriormente
-    x_assinatura = config_posicoes["assinatura_x"]
-    y_assinatura = config_posicoes["assinatura_y"]
-    assinatura_width = config_posicoes["assinatura_width"]
-    assinatura_height = config_posicoes["assinatura_height"]
-
-    if imagem_assinatura and os.path.exists(imagem_assinatura):
-        try:
-            c.drawImage(
-                imagem_assinatura,
-                x_assinatura - (assinatura_width / 2),
-                y_assinatura,
-                width=assinatura_width,
-                height=assinatura_height,
-                preserveAspectRatio=True,
-                mask='auto'
-            )
-            # Aproxima a assinatura dos campos
-            y_assinatura -= assinatura_height + 0.2 * cm  # Espaçamento reduzido para aproximar dos campos
-        except Exception as e:
-            st.warning(f"[Aviso] Não foi possível inserir a assinatura: {e}")
-
-    # ----- Campos "Data", "M. V." e "CRMV" -----
-    c.setFont("Helvetica", font_footer)
-    c.drawCentredString(x_assinatura, config_posicoes["data_y"], f"CURITIBA, PR, {data_receita}")
-    c.drawCentredString(x_assinatura, config_posicoes["mv_y"], f"M. V. {nome_vet_up}")
-    c.drawCentredString(x_assinatura, config_posicoes["crmv_y"], f"CRMV-PR: {crmv}")
-
-    c.showPage()
-    c.save()
-    return nome_pdf
+        usuarios_dir.alterar(USERS_FILE, login, signature_image=image_path)
 
 # ----------------------------------------------
 # FUNÇÕES DE TELA
@@ -475,8 +148,7 @@ def tela_perfil():
     fundo_file = st.file_uploader("Upload da Imagem de Fundo (opcional)", type=["png", "jpg", "jpeg"], key="fundo_file")
     if fundo_file is not None:
         fundo_path = os.path.join(user_folder, "fundo_" + fundo_file.name)
-        with open(fundo_path, "wb") as f:
-            f.write(fundo_file.getvalue())
+        gravar_bytes_atomico(fundo_path, fundo_file.getvalue())
         atualizar_imagem_usuario(st.session_state.usuario_logado["login"], fundo_path, tipo="fundo")
         st.success("Imagem de fundo atualizada com sucesso!")
         st.session_state.usuario_logado["fundo"] = fundo_path
@@ -485,8 +157,7 @@ def tela_perfil():
     assinatura_file = st.file_uploader("Upload da Assinatura (opcional)", type=["png", "jpg", "jpeg"], key="assinatura_file")
     if assinatura_file is not None:
         assinatura_path = os.path.join(user_folder, "assinatura_" + assinatura_file.name)
-        with open(assinatura_path, "wb") as f:
-            f.write(assinatura_file.getvalue())
+        gravar_bytes_atomico(assinatura_path, assinatura_file.getvalue())
         atualizar_imagem_usuario(st.session_state.usuario_logado["login"], assinatura_path, tipo="assinatura")
         st.success("Assinatura atualizada com sucesso!")
         st.session_state.usuario_logado["assinatura"] = assinatura_path
@@ -497,6 +168,15 @@ def tela_perfil():
     st.write("**Nome Vet:**", st.session_state.usuario_logado.get("nome_vet") or "Não definido")
     st.write("**CRMV:**", st.session_state.usuario_logado.get("crmv") or "Não definido")
 
+@st.fragment(run_every=0.5)
+def _aguardar_busca_cep():
+    # Reexecuta só este trecho a cada meio segundo enquanto a busca do CEP roda
+    # em segundo plano; quando termina, reexecuta a página para usar o endereço.
+    futuro = st.session_state.get("cep_futuro")
+    if futuro is None or futuro.done():
+        st.rerun()
+    st.info("Buscando o endereço do CEP... Você pode continuar preenchendo a receita.")
+
 def tela_receita():
     st.subheader("Criar Receituário")
 
@@ -546,15 +226,25 @@ def tela_receita():
             # Se o CEP mudou, tentamos buscar novamente
             if cep_digitado != st.session_state.cep_tutor:
                 st.session_state.cep_tutor = cep_digitado
+                st.session_state.cep_futuro = None
                 if re.fullmatch(r'\d{8}', cep_digitado):
-                    dados_end = buscar_endereco_via_cep(cep_digitado)
+                    # A busca roda em segundo plano; o resultado é conferido abaixo a cada execução
+                    st.session_state.end_busca = {}
+                    st.session_state.cep_futuro = iniciar_busca_cep(cep_digitado)
+                elif cep_digitado.strip():
+                    st.warning("CEP inválido. Deve conter exatamente 8 dígitos.")
+            futuro_cep = st.session_state.get("cep_futuro")
+            if futuro_cep is not None:
+                if futuro_cep.done():
+                    st.session_state.cep_futuro = None
+                    dados_end = futuro_cep.result()
                     st.session_state.end_busca = dados_end
                     if dados_end:
                         st.success(f"Endereço encontrado: {dados_end.get('logradouro')}, {dados_end.get('bairro')}, {dados_end.get('localidade')}-{dados_end.get('uf')}")
                     else:
                         st.warning("CEP não encontrado. Por favor, preencha o endereço manualmente ou verifique o CEP.")
-                elif cep_digitado.strip():
-                    st.warning("CEP inválido. Deve conter exatamente 8 dígitos.")
+                else:
+                    _aguardar_busca_cep()
 
             dados_cep = st.session_state.end_busca if st.session_state.end_busca else {}
             if dados_cep:
@@ -706,7 +396,9 @@ def tela_receita():
             imagem_assinatura=imagem_assinatura,
             nome_vet=nome_vet,
             crmv=crmv,
-            data_receita=datetime.datetime.now().strftime("%d/%m/%Y")
+            data_receita=datetime.datetime.now().strftime("%d/%m/%Y"),
+            usar_timbrado=True,
+            avisar=st.warning
         )
         with open(nome_pdf, "rb") as f:
             st.download_button(
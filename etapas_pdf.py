@@ -0,0 +1,166 @@
+import os
+import sys
+import time
+import threading
+
+# ----------------------------------------------
+# TEMPO POR ETAPA DA RENDERIZAÇÃO (OPCIONAL)
+# ----------------------------------------------
+# Quando uma receita demora, mostra onde o tempo foi: cada renderização de
+# gerar_pdf_receita (receita_pdf.py) é dividida nas etapas abaixo e cada
+# instante conta para exatamente uma delas, então a soma das etapas é o total.
+#
+#   preparacao   - canvas, distribuição dos blocos nas páginas
+#   fundo        - imagem de fundo (no modo timbrado: obter o timbrado do perfil)
+#   cabecalho    - título e as duas colunas de dados
+#   medicamentos - lista de medicamentos
+#   instrucoes   - quebra de linhas (wrap_text) e desenho das instruções de uso
+#   rodape       - assinatura, M. V./CRMV/SIPEAGRO, curva, data e numeração
+#   serializacao - showPage/save (compressão) e, no modo timbrado, o carimbo
+#
+# Desligado por padrão: sem coletores registrados a renderização não mede nada
+# (só confere se a lista está vazia). Coletores são funções que recebem um dict
+# {"etapas": {etapa: segundos}, "total", "paginas", "bytes", "timbrado"}:
+#   - coletor_log(): uma linha por receita (stderr por padrão);
+#   - contadores: contadores no estilo Prometheus (soma por etapa, histograma do total);
+#   - qualquer função registrada com registrar().
+# RECEITA_ETAPAS=log,contadores liga os coletores prontos na importação.
+# Receitas que saem do cache de PDFs (cache_pdf.py) não são renderizadas e não geram registro.
+
+ETAPAS = ("preparacao", "fundo", "cabecalho", "medicamentos", "instrucoes", "rodape", "serializacao")
+
+# Limites (em segundos) dos baldes do histograma da duração total
+BALDES_DURACAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_coletores = []
+
+
+def registrar(coletor):
+    """Passa a enviar os registros de cada renderização para coletor(registro)."""
+    if coletor not in _coletores:
+        _coletores.append(coletor)
+    return coletor
+
+
+def remover(coletor):
+    if coletor in _coletores:
+        _coletores.remove(coletor)
+
+
+def iniciar():
+    """Medição de uma renderização, ou None se não há coletores (medição desligada)."""
+    if not _coletores:
+        return None
+    return Medicao()
+
+
+class Medicao:
+    """Tempo acumulado por etapa de uma renderização. Começa na etapa preparacao."""
+
+    __slots__ = ("etapas", "_etapa", "_desde", "_inicio")
+
+    def __init__(self):
+        self.etapas = dict.fromkeys(ETAPAS, 0.0)
+        self._etapa = "preparacao"
+        self._inicio = self._desde = time.perf_counter()
+
+    def trocar(self, etapa):
+        """Encerra a etapa atual e passa a contar o tempo para etapa."""
+        agora = time.perf_counter()
+        self.etapas[self._etapa] += agora - self._desde
+        self._etapa = etapa
+        self._desde = agora
+
+    def encerrar(self, **extras):
+        """Fecha a etapa atual e envia o registro para os coletores."""
+        agora = time.perf_counter()
+        self.etapas[self._etapa] += agora - self._desde
+        registro = {"etapas": self.etapas, "total": agora - self._inicio}
+        registro.update(extras)
+        for coletor in list(_coletores):
+            try:
+                coletor(registro)
+            except Exception as e:
+                # Um coletor com defeito não pode impedir a entrega da receita
+                print(f"[Aviso] Coletor de etapas falhou: {e}", file=sys.stderr)
+        return registro
+
+
+# ----------------------------------------------
+# COLETORES PRONTOS
+# ----------------------------------------------
+
+def linha_log(registro):
+    """Registro em uma linha: total, páginas, bytes e milissegundos por etapa."""
+    partes = [f"receita_pdf total={registro['total'] * 1000:.1f}ms"]
+    for campo in ("paginas", "bytes", "timbrado"):
+        if registro.get(campo) is not None:
+            partes.append(f"{campo}={int(registro[campo])}")
+    partes.extend(f"{etapa}={segundos * 1000:.1f}ms" for etapa, segundos in registro["etapas"].items())
+    return " ".join(partes)
+
+
+def _escrever_stderr(linha):
+    print(linha, file=sys.stderr, flush=True)
+
+
+def coletor_log(escrever=_escrever_stderr):
+    """Coletor que escreve linha_log(registro) com escrever (ex.: logger.info)."""
+    def coletor(registro):
+        escrever(linha_log(registro))
+    return coletor
+
+
+class Contadores:
+    """
+    Coletor com contadores acumulados no estilo Prometheus: renderizações,
+    segundos por etapa, segundos/páginas/bytes totais e histograma da duração total.
+    """
+
+    def __init__(self, baldes=BALDES_DURACAO):
+        self.baldes = tuple(baldes)
+        self._lock = threading.Lock()
+        self._metricas = {
+            "renderizacoes": 0,
+            "segundos": 0.0,
+            "paginas": 0,
+            "bytes": 0,
+            "segundos_etapa": dict.fromkeys(ETAPAS, 0.0),
+            "duracao_baldes": [0] * (len(self.baldes) + 1),  # último balde: acima do maior limite
+        }
+
+    def __call__(self, registro):
+        total = registro["total"]
+        balde = len(self.baldes)
+        for i, limite in enumerate(self.baldes):
+            if total <= limite:
+                balde = i
+                break
+        with self._lock:
+            m = self._metricas
+            m["renderizacoes"] += 1
+            m["segundos"] += total
+            m["paginas"] += registro.get("paginas") or 0
+            m["bytes"] += registro.get("bytes") or 0
+            for etapa, segundos in registro["etapas"].items():
+                m["segundos_etapa"][etapa] = m["segundos_etapa"].get(etapa, 0.0) + segundos
+            m["duracao_baldes"][balde] += 1
+
+    def metricas(self):
+        """Cópia dos contadores (com os limites dos baldes em baldes_duracao)."""
+        with self._lock:
+            metricas = dict(self._metricas)
+            metricas["segundos_etapa"] = dict(self._metricas["segundos_etapa"])
+            metricas["duracao_baldes"] = list(self._metricas["duracao_baldes"])
+        metricas["baldes_duracao"] = self.baldes
+        return metricas
+
+
+contadores = Contadores()
+
+for _nome in os.environ.get("RECEITA_ETAPAS", "").split(","):
+    _nome = _nome.strip().lower()
+    if _nome == "log":
+        registrar(coletor_log())
+    elif _nome == "contadores":
+        registrar(contadores)
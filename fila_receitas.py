@@ -0,0 +1,333 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+from armazenamento import gravar_bytes_atomico
+
+# ----------------------------------------------
+# FILA DE RECEITAS (GERAÇÃO ASSÍNCRONA NA API)
+# ----------------------------------------------
+# POST /receitas só grava o pedido aqui e devolve o id; threads de trabalho
+# geram o PDF em segundo plano e o cliente consulta GET /receitas/<id>
+# (com ?esperar=N para long-poll).
+#
+# A fila é uma tabela SQLite (WAL), então:
+#   - os pedidos sobrevivem a reinícios: ao subir, os workers retomam o que
+#     ficou pendente;
+#   - vários processos (workers do gunicorn) dividem a mesma fila. Cada pedido
+#     é reservado dentro de uma transação BEGIN IMMEDIATE e recebe um prazo;
+#     se o processo morrer no meio, o prazo vence e outro worker o retoma;
+#   - o tamanho é limitado: com FILA_LIMITE pedidos em aberto, enfileirar()
+#     levanta FilaCheia e a API responde 503 com Retry-After.
+# Os PDFs prontos ficam em FILA_PASTA/<id>.pdf.
+
+FILA_ARQUIVO = os.environ.get("FILA_ARQUIVO", "fila_receitas.db")
+FILA_PASTA = os.environ.get("FILA_PASTA", os.path.join("Receitas", "fila"))
+FILA_LIMITE = int(os.environ.get("FILA_LIMITE", "200"))              # pedidos pendentes + em processamento
+FILA_WORKERS = int(os.environ.get("FILA_WORKERS", "2"))              # threads de geração por processo
+FILA_PRAZO = float(os.environ.get("FILA_PRAZO", "120"))              # segundos até um pedido reservado ser retomado
+FILA_TENTATIVAS = int(os.environ.get("FILA_TENTATIVAS", "3"))        # reservas antes de desistir do pedido
+FILA_RETENCAO = float(os.environ.get("FILA_RETENCAO", str(7 * 24 * 3600)))  # pedidos concluídos: 7 dias
+FILA_INTERVALO = float(os.environ.get("FILA_INTERVALO", "0.5"))      # consulta à fila quando ociosa, segundos
+
+PENDENTE = "pendente"
+PROCESSANDO = "processando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+FINAIS = (CONCLUIDO, ERRO)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS receitas (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    dados TEXT NOT NULL,
+    criado REAL NOT NULL,
+    iniciado REAL,
+    concluido REAL,
+    prazo REAL,
+    reserva TEXT,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    nome_arquivo TEXT,
+    arquivo TEXT,
+    tamanho INTEGER,
+    erro TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_receitas_status ON receitas (status, criado);
+"""
+
+
+class FilaCheia(Exception):
+    """A fila atingiu FILA_LIMITE pedidos em aberto; tente de novo mais tarde."""
+
+
+_local = threading.local()
+_lock = threading.Lock()
+_condicao = threading.Condition()  # acorda workers (pedido novo) e long-polls (pedido concluído)
+_threads = []
+_pid = None
+_parar = threading.Event()
+
+
+def _conectar():
+    # Uma conexão por thread e por arquivo; transações explícitas (isolation_level=None).
+    conexoes = getattr(_local, "conexoes", None)
+    if conexoes is None:
+        conexoes = _local.conexoes = {}
+    conn = conexoes.get(FILA_ARQUIVO)
+    if conn is None:
+        pasta = os.path.dirname(FILA_ARQUIVO)
+        if pasta and not os.path.exists(pasta):
+            os.makedirs(pasta, exist_ok=True)
+        conn = sqlite3.connect(FILA_ARQUIVO, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        conexoes[FILA_ARQUIVO] = conn
+    return conn
+
+
+def _notificar():
+    with _condicao:
+        _condicao.notify_all()
+
+
+def _como_dict(linha):
+    id_, status, criado, iniciado, concluido, tentativas, nome_arquivo, arquivo, tamanho, erro = linha
+    return {
+        "id": id_,
+        "status": status,
+        "nome_arquivo": nome_arquivo,
+        "criado": criado,
+        "iniciado": iniciado,
+        "concluido": concluido,
+        "tentativas": tentativas,
+        "arquivo": arquivo,
+        "tamanho": tamanho,
+        "erro": erro,
+    }
+
+
+# ----------------------------------------------
+# OPERAÇÕES DA API
+# ----------------------------------------------
+
+def enfileirar(dados, nome_arquivo=None):
+    """
+    Grava o pedido (parâmetros de gerar_pdf_receita, serializáveis em JSON) e
+    retorna o id. nome_arquivo é o nome sugerido no download.
+    Levanta FilaCheia se já houver FILA_LIMITE pedidos em aberto.
+    """
+    iniciar()
+    job_id = uuid.uuid4().hex
+    texto = json.dumps(dados, ensure_ascii=False)
+    conn = _conectar()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        abertos = conn.execute(
+            "SELECT COUNT(*) FROM receitas WHERE status IN (?, ?)", (PENDENTE, PROCESSANDO)
+        ).fetchone()[0]
+        if abertos >= FILA_LIMITE:
+            raise FilaCheia(f"Fila cheia ({abertos} receitas aguardando).")
+        conn.execute(
+            "INSERT INTO receitas (id, status, dados, criado, nome_arquivo) VALUES (?, ?, ?, ?, ?)",
+            (job_id, PENDENTE, texto, time.time(), nome_arquivo)
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    _notificar()
+    return job_id
+
+
+def obter(job_id):
+    """Situação do pedido (dict) ou None se o id não existir."""
+    linha = _conectar().execute(
+        "SELECT id, status, criado, iniciado, concluido, tentativas, nome_arquivo, arquivo, tamanho, erro "
+        "FROM receitas WHERE id = ?", (job_id,)
+    ).fetchone()
+    return _como_dict(linha) if linha else None
+
+
+def aguardar(job_id, limite):
+    """
+    Long-poll: espera até `limite` segundos o pedido terminar (concluído ou erro)
+    e retorna a situação. Pedidos terminados em outro processo são percebidos
+    em até FILA_INTERVALO segundos.
+    """
+    fim = time.monotonic() + max(0.0, limite)
+    while True:
+        job = obter(job_id)
+        restante = fim - time.monotonic()
+        if job is None or job["status"] in FINAIS or restante <= 0:
+            return job
+        with _condicao:
+            _condicao.wait(min(FILA_INTERVALO, restante))
+
+
+def posicao(job_id):
+    """Quantos pedidos pendentes estão à frente deste na fila (0 = o próximo)."""
+    linha = _conectar().execute("SELECT criado FROM receitas WHERE id = ?", (job_id,)).fetchone()
+    if linha is None:
+        return None
+    return _conectar().execute(
+        "SELECT COUNT(*) FROM receitas WHERE status = ? AND criado < ?", (PENDENTE, linha[0])
+    ).fetchone()[0]
+
+
+def estatisticas():
+    """Quantidade de pedidos por situação."""
+    contagem = dict.fromkeys((PENDENTE, PROCESSANDO, CONCLUIDO, ERRO), 0)
+    for status, total in _conectar().execute("SELECT status, COUNT(*) FROM receitas GROUP BY status"):
+        contagem[status] = total
+    contagem["limite"] = FILA_LIMITE
+    return contagem
+
+
+# ----------------------------------------------
+# WORKERS
+# ----------------------------------------------
+
+def _reservar():
+    """Reserva o pedido pendente mais antigo (ou um cujo prazo venceu). Retorna (id, dados, reserva) ou None."""
+    agora = time.time()
+    conn = _conectar()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        linha = conn.execute(
+            "SELECT id, dados, tentativas FROM receitas "
+            "WHERE status = ? OR (status = ? AND prazo < ?) ORDER BY criado LIMIT 1",
+            (PENDENTE, PROCESSANDO, agora)
+        ).fetchone()
+        if linha is None:
+            conn.execute("COMMIT")
+            return None
+        job_id, dados, tentativas = linha
+        if tentativas >= FILA_TENTATIVAS:
+            # Já foi reservado e abandonado várias vezes (processo caindo no meio): desiste.
+            conn.execute(
+                "UPDATE receitas SET status = ?, concluido = ?, erro = ? WHERE id = ?",
+                (ERRO, agora, f"Abandonado após {tentativas} tentativas.", job_id)
+            )
+            conn.execute("COMMIT")
+            _notificar()
+            return _reservar()
+        reserva = uuid.uuid4().hex
+        conn.execute(
+            "UPDATE receitas SET status = ?, iniciado = ?, prazo = ?, reserva = ?, tentativas = tentativas + 1 "
+            "WHERE id = ?",
+            (PROCESSANDO, agora, agora + FILA_PRAZO, reserva, job_id)
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    try:
+        return job_id, json.loads(dados), reserva
+    except ValueError as e:
+        # Linha corrompida: encerra o pedido com erro em vez de tentar de novo a cada prazo
+        _finalizar(job_id, reserva, ERRO, erro=f"Dados do pedido ilegíveis: {e}")
+        return _reservar()
+
+
+def _finalizar(job_id, reserva, status, arquivo=None, tamanho=None, erro=None):
+    # Só grava se a reserva ainda for desta thread (o prazo pode ter vencido e outro worker assumido).
+    _conectar().execute(
+        "UPDATE receitas SET status = ?, concluido = ?, arquivo = ?, tamanho = ?, erro = ?, prazo = NULL "
+        "WHERE id = ? AND reserva = ?",
+        (status, time.time(), arquivo, tamanho, erro, job_id, reserva)
+    )
+    _notificar()
+
+
+def caminho_pdf(job_id):
+    return os.path.join(FILA_PASTA, f"{job_id}.pdf")
+
+
+def _processar(job_id, dados, reserva):
+    from receita_pdf import gerar_pdf_receita
+    try:
+        avisos = []
+        pdf = gerar_pdf_receita(em_memoria=True, usar_timbrado=True, avisar=avisos.append, **dados)
+        arquivo = caminho_pdf(job_id)
+        gravar_bytes_atomico(arquivo, pdf)
+        for aviso in avisos:
+            print(aviso)
+        _finalizar(job_id, reserva, CONCLUIDO, arquivo=arquivo, tamanho=len(pdf))
+    except Exception as e:
+        _finalizar(job_id, reserva, ERRO, erro=f"{type(e).__name__}: {e}")
+
+
+def limpar_antigos(retencao=None):
+    """Remove pedidos terminados há mais de `retencao` segundos, com seus PDFs. Retorna quantos."""
+    limite = time.time() - (FILA_RETENCAO if retencao is None else retencao)
+    conn = _conectar()
+    antigos = conn.execute(
+        "SELECT id, arquivo FROM receitas WHERE status IN (?, ?) AND concluido < ?", (CONCLUIDO, ERRO, limite)
+    ).fetchall()
+    for job_id, arquivo in antigos:
+        if arquivo and os.path.exists(arquivo):
+            os.remove(arquivo)
+        conn.execute("DELETE FROM receitas WHERE id = ?", (job_id,))
+    return len(antigos)
+
+
+def _trabalhar():
+    proxima_limpeza = 0.0
+    while not _parar.is_set():
+        # Nenhuma falha pode encerrar a thread: iniciar() não a sobe de novo neste
+        # processo, e a API continuaria aceitando pedidos que ninguém gera.
+        try:
+            job = _reservar()
+            if job is not None:
+                _processar(*job)
+                continue
+            if time.monotonic() >= proxima_limpeza:
+                proxima_limpeza = time.monotonic() + 3600
+                try:
+                    limpar_antigos()
+                except (sqlite3.Error, OSError) as e:
+                    print(f"[Aviso] Falha ao limpar a fila de receitas: {e}")
+        except Exception as e:
+            # Ex.: banco travado além do timeout ou disco cheio ao finalizar um pedido.
+            # Um pedido que ficou reservado é retomado quando o prazo vencer.
+            print(f"[Aviso] Fila de receitas indisponível: {type(e).__name__}: {e}")
+            _parar.wait(FILA_INTERVALO)
+            continue
+        with _condicao:
+            _condicao.wait(FILA_INTERVALO)
+
+
+def iniciar(workers=None):
+    """
+    Sobe as threads de geração deste processo (uma vez por processo; depois de
+    um fork, o filho sobe as suas). Chamado pela API e pelo post_fork do gunicorn.
+    """
+    global _pid
+    if _pid == os.getpid():
+        return
+    with _lock:
+        if _pid == os.getpid():
+            return
+        _parar.clear()
+        _threads.clear()
+        for i in range(FILA_WORKERS if workers is None else workers):
+            t = threading.Thread(target=_trabalhar, name=f"fila-receitas-{i}", daemon=True)
+            t.start()
+            _threads.append(t)
+        _pid = os.getpid()
+
+
+def parar(limite=None):
+    """Pede para as threads pararem depois do pedido atual e espera por elas."""
+    global _pid
+    with _lock:
+        _parar.set()
+        _notificar()
+        for t in _threads:
+            t.join(limite)
+        _threads.clear()
+        _pid = None
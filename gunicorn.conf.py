@@ -0,0 +1,91 @@
+import os
+import gc
+
+# ----------------------------------------------
+# CONFIGURAÇÃO DO GUNICORN (API FLASK EM PRODUÇÃO)
+# ----------------------------------------------
+# Uso:  gunicorn -c gunicorn.conf.py app:app
+# Todos os valores podem ser ajustados por variável de ambiente, sem editar
+# este arquivo (ex.: GUNICORN_WORKERS=4 GUNICORN_KEEPALIVE=10).
+#
+# A geração do PDF é CPU-bound, então o padrão é um worker (processo) por
+# núcleo. Com GUNICORN_THREADS > 1 os workers passam a ser "gthread", o que
+# ajuda quando parte do tempo é espera de disco/rede (ex.: gravar em Receitas/).
+
+
+def _inteiro(nome, padrao):
+    return int(os.environ.get(nome, padrao))
+
+
+def _booleano(nome, padrao):
+    return os.environ.get(nome, padrao).strip().lower() in ("1", "s", "sim", "true", "yes")
+
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+workers = _inteiro("GUNICORN_WORKERS", os.environ.get("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+threads = _inteiro("GUNICORN_THREADS", "1")
+worker_class = "gthread" if threads > 1 else "sync"
+keepalive = _inteiro("GUNICORN_KEEPALIVE", "5")            # segundos com a conexão ociosa aberta
+timeout = _inteiro("GUNICORN_TIMEOUT", "60")               # worker travado é reiniciado após isso
+graceful_timeout = _inteiro("GUNICORN_GRACEFUL_TIMEOUT", "30")
+backlog = _inteiro("GUNICORN_BACKLOG", "2048")
+# Reciclar workers de tempos em tempos limita o crescimento de memória;
+# o jitter evita que todos reiniciem juntos. 0 desativa.
+max_requests = _inteiro("GUNICORN_MAX_REQUESTS", "2000")
+max_requests_jitter = _inteiro("GUNICORN_MAX_REQUESTS_JITTER", "200")
+
+# Carrega o app (e com ele ReportLab, pypdf e as fontes) no processo mestre,
+# antes do fork: os workers já nascem com tudo importado e compartilham essas
+# páginas de memória (copy-on-write) em vez de cada um importar de novo.
+preload_app = _booleano("GUNICORN_PRELOAD", "true")
+
+accesslog = os.environ.get("GUNICORN_ACCESSLOG", "-") or None  # vazio desativa
+errorlog = os.environ.get("GUNICORN_ERRORLOG", "-")
+loglevel = os.environ.get("GUNICORN_LOGLEVEL", "info")
+
+
+def _aquecer():
+    # Fontes, imagens e timbrado do perfil da API já carregados, e uma receita
+    # renderizada em memória (ver receita_pdf.aquecer).
+    import receita_pdf
+    from app import PERFIL_API
+    for aviso in receita_pdf.aquecer([PERFIL_API]):
+        print(aviso)
+
+
+def on_starting(server):
+    # Métricas de uma execução anterior não entram na soma do /metrics (ver metricas.py)
+    import metricas
+    metricas.limpar()
+    if preload_app:
+        _aquecer()
+
+
+def when_ready(server):
+    # Tudo que foi carregado até aqui vai para a geração permanente do GC:
+    # a coleta nos workers não toca nesses objetos e as páginas continuam compartilhadas.
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        _aquecer()
+    # Cada worker sobe as próprias threads da fila de receitas (POST /receitas)
+    # e já retoma os pedidos que ficaram pendentes antes de um reinício.
+    import fila_receitas
+    fila_receitas.iniciar()
+    import metricas
+    metricas.iniciar()
+
+
+def worker_exit(server, worker):
+    # Última foto das métricas do worker, com o que ainda não tinha sido gravado
+    import metricas
+    metricas.gravar()
+
+
+def child_exit(server, worker):
+    # No processo mestre: os contadores do worker que saiu passam para o total dos encerrados
+    import metricas
+    metricas.recolher(worker.pid)
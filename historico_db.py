@@ -0,0 +1,239 @@
+import os
+import json
+import sqlite3
+import datetime
+import threading
+import unicodedata
+
+from armazenamento import trava_arquivo
+from historico_log import ler_registros, reescrever_log
+
+# ----------------------------------------------
+# HISTÓRICO EM SQLITE (COM ÍNDICES)
+# ----------------------------------------------
+# Cada registro do histórico continua sendo o mesmo dicionário usado pelas telas
+# (guardado em JSON na coluna "registro"); as colunas extras existem apenas para
+# busca por prefixo de paciente/tutor, CPF e intervalo de datas via índices.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS historico (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    paciente_chave TEXT NOT NULL,
+    tutor_chave TEXT NOT NULL,
+    cpf_digitos TEXT NOT NULL,
+    controlado INTEGER NOT NULL,
+    data_emitida TEXT NOT NULL,
+    registro TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_historico_paciente ON historico (paciente_chave);
+CREATE INDEX IF NOT EXISTS idx_historico_tutor ON historico (tutor_chave);
+CREATE INDEX IF NOT EXISTS idx_historico_cpf ON historico (cpf_digitos);
+CREATE INDEX IF NOT EXISTS idx_historico_data ON historico (data_emitida);
+"""
+
+# Maior caractere possível: "prefixo + _FIM" delimita a faixa de um prefixo no índice.
+_FIM = "\U0010ffff"
+
+_local = threading.local()
+
+
+def normalizar_chave(texto):
+    """Minúsculas e sem acentos, para a busca por prefixo ignorar caixa e acentuação."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(ch for ch in texto if not unicodedata.combining(ch))
+    return texto.casefold().strip()
+
+
+def _somente_digitos(texto):
+    return "".join(ch for ch in (texto or "") if ch.isdigit())
+
+
+def data_iso(data_br):
+    """Converte 'dd/mm/aaaa' em 'aaaa-mm-dd' (formato ordenável). Retorna '' se inválida."""
+    if isinstance(data_br, (datetime.date, datetime.datetime)):
+        return data_br.strftime("%Y-%m-%d")
+    try:
+        return datetime.datetime.strptime((data_br or "").strip(), "%d/%m/%Y").strftime("%Y-%m-%d")
+    except ValueError:
+        return ""
+
+
+def _criar_tabelas(conn):
+    conn.executescript(_SCHEMA)
+
+
+def conectar(caminho):
+    """Conexão SQLite reaproveitada por thread (o Streamlit atende cada sessão em uma thread)."""
+    conexoes = getattr(_local, "conexoes", None)
+    if conexoes is None:
+        conexoes = _local.conexoes = {}
+    conn = conexoes.get(caminho)
+    if conn is None:
+        pasta = os.path.dirname(caminho)
+        if pasta and not os.path.exists(pasta):
+            os.makedirs(pasta, exist_ok=True)
+        conn = sqlite3.connect(caminho, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _criar_tabelas(conn)
+        conexoes[caminho] = conn
+    return conn
+
+
+def fechar(caminho):
+    conexoes = getattr(_local, "conexoes", {})
+    conn = conexoes.pop(caminho, None)
+    if conn is not None:
+        conn.close()
+
+
+def _linha(registro):
+    return (
+        normalizar_chave(registro.get("Nome do Paciente", "")),
+        normalizar_chave(registro.get("Nome do Tutor", "")),
+        _somente_digitos(registro.get("CPF do Tutor", "")),
+        1 if registro.get("Medicamento Controlado", "Não") == "Sim" else 0,
+        data_iso(registro.get("Data Emitida", "")),
+        json.dumps(registro, ensure_ascii=False),
+    )
+
+
+_INSERT = (
+    "INSERT INTO historico (paciente_chave, tutor_chave, cpf_digitos, controlado, data_emitida, registro) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+
+def inserir_registro(caminho, registro):
+    conn = conectar(caminho)
+    with conn:
+        cur = conn.execute(_INSERT, _linha(registro))
+    return cur.lastrowid
+
+
+def carregar_todos(caminho):
+    conn = conectar(caminho)
+    return [json.loads(r[0]) for r in conn.execute("SELECT registro FROM historico ORDER BY id")]
+
+
+def substituir_todos(caminho, registros):
+    """Substitui o histórico inteiro (equivalente ao antigo salvar_historico)."""
+    conn = conectar(caminho)
+    with conn:
+        conn.execute("DELETE FROM historico")
+        conn.executemany(_INSERT, (_linha(r) for r in registros))
+
+
+def consultar(
+    caminho,
+    paciente=None,
+    tutor=None,
+    cpf=None,
+    controlado=None,
+    data_inicio=None,
+    data_fim=None,
+    pagina=1,
+    tamanho_pagina=20,
+    mais_recentes_primeiro=True
+):
+    """
+    Consulta paginada do histórico.
+
+    :param paciente: prefixo do nome do paciente (ignora caixa e acentos)
+    :param tutor: prefixo do nome do tutor
+    :param cpf: prefixo dos dígitos do CPF do tutor
+    :param controlado: True/False para filtrar por medicamento controlado, None para todos
+    :param data_inicio: 'dd/mm/aaaa' ou date, inclusivo
+    :param data_fim: 'dd/mm/aaaa' ou date, inclusivo
+    :return: (lista de (id, registro) da página, total de registros do filtro)
+    """
+    condicoes = []
+    params = []
+    for coluna, valor in (
+        ("paciente_chave", normalizar_chave(paciente)),
+        ("tutor_chave", normalizar_chave(tutor)),
+        ("cpf_digitos", _somente_digitos(cpf)),
+    ):
+        if valor:
+            condicoes.append(f"{coluna} >= ? AND {coluna} < ?")
+            params.extend([valor, valor + _FIM])
+    if controlado is not None:
+        condicoes.append("controlado = ?")
+        params.append(1 if controlado else 0)
+    if data_inicio:
+        condicoes.append("data_emitida >= ?")
+        params.append(data_iso(data_inicio))
+    if data_fim:
+        condicoes.append("data_emitida <= ?")
+        params.append(data_iso(data_fim))
+
+    where = f" WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    ordem = "DESC" if mais_recentes_primeiro else "ASC"
+    pagina = max(1, int(pagina))
+    tamanho_pagina = max(1, int(tamanho_pagina))
+
+    conn = conectar(caminho)
+    total = conn.execute(f"SELECT COUNT(*) FROM historico{where}", params).fetchone()[0]
+    linhas = conn.execute(
+        f"SELECT id, registro FROM historico{where} "
+        f"ORDER BY data_emitida {ordem}, id {ordem} LIMIT ? OFFSET ?",
+        params + [tamanho_pagina, (pagina - 1) * tamanho_pagina]
+    ).fetchall()
+    return [(id_, json.loads(registro)) for id_, registro in linhas], total
+
+
+def obter_registro(caminho, id_registro):
+    conn = conectar(caminho)
+    linha = conn.execute("SELECT registro FROM historico WHERE id = ?", (id_registro,)).fetchone()
+    return json.loads(linha[0]) if linha else None
+
+
+def importar_log(caminho_db, caminho_log):
+    """
+    Migração do log JSON Lines para o banco. O banco é montado em um arquivo
+    temporário e renomeado no final. O log fica onde está, mas deixa de receber
+    registros enquanto o banco for o histórico em uso (ver exportar_log).
+    """
+    if os.path.exists(caminho_db) or not os.path.exists(caminho_log):
+        return False
+    with trava_arquivo(caminho_db):
+        # Outro processo pode ter feito a migração enquanto esperávamos a trava
+        if os.path.exists(caminho_db) or not os.path.exists(caminho_log):
+            return False
+        temporario = caminho_db + ".tmp"
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        conn = sqlite3.connect(temporario)
+        try:
+            _criar_tabelas(conn)
+            with conn:
+                conn.executemany(_INSERT, (_linha(r) for r in ler_registros(caminho_log)))
+        finally:
+            conn.close()
+        os.replace(temporario, caminho_db)
+    return True
+
+
+def exportar_log(caminho_db, caminho_log):
+    """
+    Volta do banco para o log (ao trocar o histórico de sqlite para jsonl): o log
+    é reescrito com todos os registros do banco e o banco é guardado como
+    '<nome>.exportado'. Se o sqlite voltar a ser usado, importar_log monta um
+    banco novo a partir do log, então nenhum registro fica só em um dos dois.
+    """
+    if not os.path.exists(caminho_db):
+        return False
+    with trava_arquivo(caminho_db):
+        if not os.path.exists(caminho_db):
+            return False
+        fechar(caminho_db)
+        conn = sqlite3.connect(caminho_db, timeout=30)
+        try:
+            _criar_tabelas(conn)
+            registros = [json.loads(r[0]) for r in conn.execute("SELECT registro FROM historico ORDER BY id")]
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+        reescrever_log(caminho_log, registros)
+        os.replace(caminho_db, caminho_db + ".exportado")
+    return True
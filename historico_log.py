@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import atexit
+import threading
+
+from armazenamento import trava_arquivo, gravar_atomico
+
+# ----------------------------------------------
+# HISTÓRICO EM LOG APPEND-ONLY (JSON LINES)
+# ----------------------------------------------
+# Cada prescrição vira uma linha JSON no final do arquivo. Emitir uma receita
+# custa O(1) (não é preciso ler nem reescrever o histórico inteiro) e uma queda
+# no meio da escrita corrompe no máximo a última linha, que é ignorada na leitura.
+
+FSYNC_A_CADA = int(os.environ.get("HISTORICO_FSYNC_A_CADA", "8"))            # registros por fsync
+FSYNC_INTERVALO = float(os.environ.get("HISTORICO_FSYNC_INTERVALO", "2.0"))  # segundos entre fsyncs
+
+_lock = threading.Lock()
+_pendentes = {}  # caminho -> [registros ainda sem fsync, instante do último fsync]
+
+
+def _fsync_caminho(caminho):
+    fd = os.open(caminho, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def anexar_registro(caminho, registro):
+    """Acrescenta um registro ao final do log, com fsync em lote."""
+    pasta = os.path.dirname(caminho)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta, exist_ok=True)
+    linha = json.dumps(registro, ensure_ascii=False, separators=(",", ":")) + "\n"
+    # A trava de arquivo serializa threads e processos (ex.: workers do gunicorn)
+    # que escrevem neste log; _lock protege só a contagem de fsync, para o log de
+    # um(a) veterinário(a) não esperar pela trava do log de outro(a).
+    with trava_arquivo(caminho):
+        with open(caminho, "ab+") as f:
+            # Se a última linha ficou incompleta (queda no meio da escrita),
+            # fecha a linha antes de anexar para não colar os dois registros.
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            f.write(linha.encode("utf-8"))
+            f.flush()
+            agora = time.monotonic()
+            with _lock:
+                estado = _pendentes.setdefault(caminho, [0, agora])
+                estado[0] += 1
+                sincronizar_agora = estado[0] >= FSYNC_A_CADA or agora - estado[1] >= FSYNC_INTERVALO
+                if sincronizar_agora:
+                    estado[0] = 0
+                    estado[1] = agora
+            if sincronizar_agora:
+                os.fsync(f.fileno())
+
+
+def sincronizar():
+    """Força o fsync de todos os logs com registros pendentes."""
+    with _lock:
+        caminhos = [caminho for caminho, estado in _pendentes.items() if estado[0]]
+        for estado in _pendentes.values():
+            estado[0] = 0
+            estado[1] = time.monotonic()
+    for caminho in caminhos:
+        if os.path.exists(caminho):
+            _fsync_caminho(caminho)
+
+
+atexit.register(sincronizar)
+
+
+def ler_registros(caminho):
+    """Lê todos os registros do log. Linhas corrompidas são ignoradas."""
+    if not os.path.exists(caminho):
+        return []
+    registros = []
+    with open(caminho, "r", encoding="utf-8") as f:
+        for linha in f:
+            linha = linha.strip()
+            if not linha:
+                continue
+            try:
+                registros.append(json.loads(linha))
+            except json.JSONDecodeError:
+                continue
+    return registros
+
+
+_contagens = {}  # caminho -> (inode, bytes já contados, linhas)
+
+
+def contar_registros(caminho):
+    """
+    Quantidade de registros (linhas) do log sem decodificar o JSON. Como o log só
+    cresce no final, cada chamada lê apenas o que foi anexado desde a anterior;
+    um log reescrito (outro inode ou menor) é contado de novo desde o início.
+    """
+    try:
+        info = os.stat(caminho)
+    except FileNotFoundError:
+        return 0
+    with _lock:
+        inode, lidos, linhas = _contagens.get(caminho, (None, 0, 0))
+    if inode != info.st_ino or info.st_size < lidos:
+        lidos, linhas = 0, 0
+    with open(caminho, "rb") as f:
+        f.seek(lidos)
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            linhas += bloco.count(b"\n")
+            lidos += len(bloco)
+    with _lock:
+        _contagens[caminho] = (info.st_ino, lidos, linhas)
+    return linhas
+
+
+def reescrever_log(caminho, registros):
+    """Substitui o log inteiro pelos registros informados (escrita atômica)."""
+    def escrever(f):
+        for registro in registros:
+            f.write(json.dumps(registro, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    with trava_arquivo(caminho):
+        gravar_atomico(caminho, escrever, modo="w", encoding="utf-8")
+        with _lock:
+            _pendentes.pop(caminho, None)
+
+
+def migrar_historico_json(caminho_json, caminho_log):
+    """
+    Migração única do histórico antigo (array JSON) para o log JSON Lines.
+    O arquivo antigo é mantido como '<nome>.migrado' para conferência.
+    """
+    if not os.path.exists(caminho_json):
+        return False
+    with trava_arquivo(caminho_json):
+        # Outro processo pode ter migrado enquanto esperávamos a trava
+        if not os.path.exists(caminho_json):
+            return False
+        _migrar_historico_json(caminho_json, caminho_log)
+    return True
+
+
+def _migrar_historico_json(caminho_json, caminho_log):
+    # A migração sempre roda antes do primeiro append; se o log já existe, uma
+    # migração anterior foi interrompida depois de gravá-lo e falta só renomear.
+    if not os.path.exists(caminho_log):
+        registros = []
+        with open(caminho_json, "r", encoding="utf-8") as f:
+            try:
+                dados = json.load(f)
+                if isinstance(dados, list):
+                    registros = dados
+            except json.JSONDecodeError:
+                registros = []
+        reescrever_log(caminho_log, registros)
+    os.replace(caminho_json, caminho_json + ".migrado")
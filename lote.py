@@ -0,0 +1,246 @@
+import os
+import re
+import csv
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# ----------------------------------------------
+# EMISSÃO DE RECEITAS EM LOTE
+# ----------------------------------------------
+# Renderiza uma lista de receitas (CSV, JSON Lines ou array JSON) em paralelo,
+# um processo por núcleo, usando o mesmo gerar_pdf_receita (receita_pdf.py) do
+# Streamlit e da API.
+# Cada item tem seu próprio resultado (ok/erro), e um item com problema não
+# interrompe o restante do lote.
+#
+# Uso:
+#   python lote.py receitas.jsonl --saida Receitas/lote --login vet01 --workers 4
+#   python lote.py receitas.jsonl --pdf-unico Receitas/balcao.pdf --login vet01
+
+# Campos aceitos em cada receita (mesmos nomes dos parâmetros de gerar_pdf_receita)
+CAMPOS_RECEITA = (
+    "tipo_farmacia", "paciente", "tutor", "cpf", "rg", "endereco_formatado",
+    "especie_raca", "pelagem", "peso", "idade", "sexo", "chip",
+    "lista_medicamentos", "instrucoes_uso", "data_receita",
+    "imagem_fundo", "imagem_assinatura", "nome_vet", "crmv", "sipeagro",
+    "mostrar_sipeagro"
+)
+
+# Campos desenhados como texto: números são aceitos e convertidos
+CAMPOS_TEXTO = tuple(c for c in CAMPOS_RECEITA if c not in ("lista_medicamentos", "mostrar_sipeagro"))
+CAMPOS_MEDICAMENTO = ("quantidade", "nome", "concentracao")
+
+USERS_FILE = "users.json"  # mesmo arquivo de usuários do Streamlit
+
+_gerar_pdf_receita = None
+
+
+def _inicializar_worker():
+    # Importa o renderizador uma vez por processo (e não a cada item).
+    global _gerar_pdf_receita
+    from receita_pdf import gerar_pdf_receita
+    _gerar_pdf_receita = gerar_pdf_receita
+
+
+def carregar_receitas(caminho):
+    """Lê as receitas de um arquivo .csv, .jsonl ou .json (array)."""
+    extensao = os.path.splitext(caminho)[1].lower()
+    with open(caminho, "r", encoding="utf-8-sig", newline="") as f:
+        if extensao == ".csv":
+            receitas = []
+            for linha in csv.DictReader(f):
+                receita = {k: v for k, v in linha.items() if k}
+                # No CSV a lista de medicamentos vem como texto JSON na coluna
+                if receita.get("lista_medicamentos"):
+                    receita["lista_medicamentos"] = json.loads(receita["lista_medicamentos"])
+                if "mostrar_sipeagro" in receita:
+                    receita["mostrar_sipeagro"] = receita["mostrar_sipeagro"].strip().lower() in ("1", "s", "sim", "true")
+                receitas.append(receita)
+            return receitas
+        if extensao == ".jsonl":
+            return [json.loads(linha) for linha in f if linha.strip()]
+        dados = json.load(f)
+        if not isinstance(dados, list):
+            raise ValueError("O arquivo JSON deve conter um array de receitas.")
+        return dados
+
+
+def nome_arquivo_receita(indice, receita):
+    paciente = re.sub(r'[^\w\s-]', '', receita.get("paciente", "")).strip().replace(' ', '_') or "receita"
+    cpf = re.sub(r'\D', '', receita.get("cpf", ""))
+    return f"{indice:05d} - {paciente} - {cpf}.pdf"
+
+
+def _texto(valor, descricao):
+    if valor is None or isinstance(valor, str):
+        return valor
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return str(valor)
+    raise ValueError(f"{descricao} deve ser texto.")
+
+
+def validar_receita(receita):
+    """
+    Confere uma receita do lote antes de desenhar e retorna só os parâmetros de
+    gerar_pdf_receita (sem nome_pdf). Levanta ValueError com o motivo se for inválida.
+    """
+    if not isinstance(receita, dict):
+        raise ValueError("Receita inválida: esperado um objeto com os campos da receita.")
+    desconhecidos = set(receita) - set(CAMPOS_RECEITA) - {"nome_pdf"}
+    if desconhecidos:
+        raise ValueError(f"Campos desconhecidos: {', '.join(sorted(desconhecidos))}")
+    parametros = {k: v for k, v in receita.items() if k in CAMPOS_RECEITA}
+    for campo in CAMPOS_TEXTO:
+        if campo in parametros:
+            parametros[campo] = _texto(parametros[campo], f"O campo '{campo}'")
+    medicamentos = parametros.get("lista_medicamentos")
+    if medicamentos is not None:
+        if not isinstance(medicamentos, list) or not all(isinstance(m, dict) for m in medicamentos):
+            raise ValueError("lista_medicamentos deve ser uma lista de objetos.")
+        parametros["lista_medicamentos"] = [
+            {k: _texto(v, f"O campo '{k}' do medicamento {i}") or "" for k, v in med.items() if k in CAMPOS_MEDICAMENTO}
+            for i, med in enumerate(medicamentos, start=1)
+        ]
+    return parametros
+
+
+def nome_pdf_informado(nome):
+    """
+    nome_pdf vindo do arquivo do lote: aceita só o nome do arquivo, que fica
+    sempre dentro da pasta de saída. Pastas, '..' ou caminho absoluto levantam ValueError.
+    """
+    nome = str(nome).strip()
+    if os.path.isabs(nome) or "/" in nome or "\\" in nome or ".." in nome:
+        raise ValueError(f"nome_pdf inválido: {nome!r} (informe só o nome do arquivo, sem pastas).")
+    nome = re.sub(r'[^\w\s.-]', '', os.path.basename(nome)).strip()
+    if not nome or nome.startswith("."):
+        raise ValueError("nome_pdf inválido: informe o nome do arquivo.")
+    if not nome.lower().endswith(".pdf"):
+        nome += ".pdf"
+    return nome
+
+
+def _renderizar_item(tarefa):
+    indice, receita, pasta_saida, perfil = tarefa
+    inicio = time.perf_counter()
+    try:
+        parametros = dict(perfil)
+        parametros.update(validar_receita(receita))
+        if receita.get("nome_pdf"):
+            nome_pdf = os.path.join(pasta_saida, nome_pdf_informado(receita["nome_pdf"]))
+        else:
+            nome_pdf = os.path.join(pasta_saida, nome_arquivo_receita(indice, receita))
+        _gerar_pdf_receita(nome_pdf=nome_pdf, usar_timbrado=True, **parametros)
+        return {"indice": indice, "ok": True, "arquivo": nome_pdf,
+                "segundos": round(time.perf_counter() - inicio, 4)}
+    except Exception as e:
+        return {"indice": indice, "ok": False, "erro": f"{type(e).__name__}: {e}",
+                "segundos": round(time.perf_counter() - inicio, 4)}
+
+
+def carregar_perfil(login):
+    """Dados do(a) veterinário(a) usados como padrão em todas as receitas do lote."""
+    import usuarios
+    dados = usuarios.obter(USERS_FILE, login)
+    if dados is None:
+        raise ValueError(f"Usuário '{login}' não encontrado.")
+    return {
+        "imagem_fundo": dados.get("background_image"),
+        "imagem_assinatura": dados.get("signature_image"),
+        "nome_vet": dados.get("nome_vet"),
+        "crmv": dados.get("crmv"),
+        "sipeagro": dados.get("sipeagro")
+    }
+
+
+def renderizar_lote(receitas, pasta_saida, perfil=None, workers=None):
+    """
+    Renderiza as receitas em paralelo em um ProcessPoolExecutor.
+    Retorna a lista de resultados por item, na mesma ordem da entrada.
+    """
+    os.makedirs(pasta_saida, exist_ok=True)
+    perfil = perfil or {}
+    workers = workers or os.cpu_count() or 1
+    tarefas = [(i, receita, pasta_saida, perfil) for i, receita in enumerate(receitas, start=1)]
+    if not tarefas:
+        return []
+    # Importa o renderizador antes de criar o pool: com fork os workers já nascem com ele carregado.
+    _inicializar_worker()
+    # Lotes grandes vão em blocos para diluir o custo de comunicação entre processos.
+    chunksize = max(1, len(tarefas) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_inicializar_worker) as executor:
+        return list(executor.map(_renderizar_item, tarefas, chunksize=chunksize))
+
+
+def renderizar_pdf_unico(receitas, nome_pdf, perfil=None):
+    """
+    Todas as receitas válidas como páginas de um único PDF (gerar_pdf_receitas).
+    Cada item é conferido antes de desenhar: os inválidos ficam fora do PDF e
+    voltam com o erro. Retorna os resultados por item, na ordem da entrada.
+    """
+    from receita_pdf import gerar_pdf_receitas
+    resultados = []
+    validas = []
+    for indice, receita in enumerate(receitas, start=1):
+        try:
+            validas.append(validar_receita(receita))
+        except ValueError as e:
+            resultados.append({"indice": indice, "ok": False, "erro": f"ValueError: {e}"})
+            continue
+        resultados.append({"indice": indice, "ok": True, "arquivo": nome_pdf})
+    if not validas:
+        return resultados
+    pasta = os.path.dirname(nome_pdf)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    try:
+        gerar_pdf_receitas(nome_pdf=nome_pdf, receitas=validas, **(perfil or {}))
+    except Exception as e:
+        # Falha ao montar o arquivo (ex.: disco cheio): nenhuma receita saiu
+        erro = f"{type(e).__name__}: {e}"
+        return [r if not r["ok"] else {"indice": r["indice"], "ok": False, "erro": erro} for r in resultados]
+    return resultados
+
+
+def _gravar_relatorio(caminho, resultados):
+    with open(caminho, "w", encoding="utf-8") as f:
+        for resultado in resultados:
+            f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Emissão de receitas em lote.")
+    parser.add_argument("entrada", help="Arquivo .csv, .jsonl ou .json com as receitas")
+    parser.add_argument("--saida", default=os.path.join("Receitas", "lote"), help="Pasta de destino dos PDFs")
+    parser.add_argument("--login", help="Usuário cujo perfil (fundo, assinatura, nome, CRMV) será usado")
+    parser.add_argument("--workers", type=int, default=None, help="Número de processos (padrão: núcleos da máquina)")
+    parser.add_argument("--relatorio", help="Grava o resultado de cada item neste arquivo JSON Lines")
+    parser.add_argument("--pdf-unico", help="Gera todas as receitas como páginas deste único PDF (impressão no balcão)")
+    args = parser.parse_args(argv)
+
+    receitas = carregar_receitas(args.entrada)
+    perfil = carregar_perfil(args.login) if args.login else {}
+
+    inicio = time.perf_counter()
+    if args.pdf_unico:
+        resultados = renderizar_pdf_unico(receitas, args.pdf_unico, perfil=perfil)
+    else:
+        resultados = renderizar_lote(receitas, args.saida, perfil=perfil, workers=args.workers)
+    duracao = time.perf_counter() - inicio
+
+    if args.relatorio:
+        _gravar_relatorio(args.relatorio, resultados)
+
+    falhas = [r for r in resultados if not r["ok"]]
+    for r in falhas:
+        print(f"[Erro] Receita {r['indice']}: {r['erro']}")
+    print(f"{len(resultados) - len(falhas)} de {len(resultados)} receitas geradas em {duracao:.2f}s "
+          f"({len(resultados) / duracao if duracao else 0:.1f} receitas/s).")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
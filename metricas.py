@@ -0,0 +1,344 @@
+import os
+import copy
+import json
+import time
+import atexit
+import threading
+
+import cep
+import cache_pdf
+import etapas_pdf
+import fila_receitas
+from historico_log import contar_registros
+from armazenamento import gravar_bytes_atomico, trava_arquivo
+
+# ----------------------------------------------
+# MÉTRICAS DA API NO FORMATO DO PROMETHEUS (GET /metrics)
+# ----------------------------------------------
+# Cada processo acumula os próprios contadores: requisições e latência por
+# rota, renderização dos PDFs (etapas_pdf.contadores), consulta de CEP
+# (cep.metricas_cep) e cache de PDFs (cache_pdf.metricas_cache_pdf).
+#
+# Com vários workers do gunicorn, o /metrics de um worker não enxerga a memória
+# dos outros. Por isso cada processo grava uma foto dos seus contadores em
+# METRICAS_PASTA/<pid>.json (no máximo a cada METRICAS_INTERVALO segundos, e ao
+# sair), e o /metrics soma todas as fotos. Quando um worker termina, o processo
+# mestre soma a foto dele em mortos.json, para os contadores não voltarem atrás
+# quando o gunicorn recicla workers. A pasta é esvaziada na subida do gunicorn.
+# Um worker morto à força (ex.: timeout) perde só o que não chegou a gravar.
+# METRICAS_PASTA vazia deixa as métricas só no processo atual.
+#
+# Valores do momento (tamanho do histórico, pedidos na fila) são lidos na hora
+# pelo processo que atende o /metrics.
+
+METRICAS_PASTA = os.environ.get("METRICAS_PASTA", "metricas")
+METRICAS_INTERVALO = float(os.environ.get("METRICAS_INTERVALO", "2"))  # segundos entre gravações da foto
+PREFIXO = "receituario"
+
+# Limites (em segundos) dos baldes do histograma de latência das requisições
+BALDES_REQUISICAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_ARQUIVO_MORTOS = "mortos.json"
+
+_lock = threading.Lock()
+_pid = None
+_ultima_foto = None   # bytes da última foto gravada (não regrava se nada mudou)
+_requisicoes = {}     # rota -> método -> código -> quantidade
+_duracoes = {}        # rota -> método -> {"soma", "baldes"}
+
+
+def iniciar():
+    """
+    Liga as métricas neste processo (uma vez por processo, como fila_receitas.iniciar):
+    a medição das etapas da renderização e a thread que grava a foto dos contadores.
+    """
+    global _pid, _ultima_foto
+    if _pid == os.getpid():
+        return
+    with _lock:
+        if _pid == os.getpid():
+            return
+        # Depois de um fork, o filho começa do zero: os contadores do pai estão na foto do pai.
+        _requisicoes.clear()
+        _duracoes.clear()
+        _ultima_foto = None
+        _pid = os.getpid()
+    etapas_pdf.registrar(etapas_pdf.contadores)
+    if METRICAS_PASTA:
+        threading.Thread(target=_gravar_periodicamente, name="metricas", daemon=True).start()
+
+
+def registrar_requisicao(rota, metodo, codigo, duracao):
+    balde = len(BALDES_REQUISICAO)
+    for i, limite in enumerate(BALDES_REQUISICAO):
+        if duracao <= limite:
+            balde = i
+            break
+    with _lock:
+        por_codigo = _requisicoes.setdefault(rota, {}).setdefault(metodo, {})
+        por_codigo[str(codigo)] = por_codigo.get(str(codigo), 0) + 1
+        duracao_rota = _duracoes.setdefault(rota, {}).setdefault(
+            metodo, {"soma": 0.0, "baldes": [0] * (len(BALDES_REQUISICAO) + 1)}
+        )
+        duracao_rota["soma"] += duracao
+        duracao_rota["baldes"][balde] += 1
+
+
+# ----------------------------------------------
+# FOTOS DOS PROCESSOS
+# ----------------------------------------------
+
+def _foto():
+    """Contadores acumulados deste processo (sem os limites dos baldes, que são fixos no código)."""
+    with _lock:
+        requisicoes = copy.deepcopy(_requisicoes)
+        duracoes = copy.deepcopy(_duracoes)
+    metricas_cep = cep.metricas_cep()
+    metricas_cache = cache_pdf.metricas_cache_pdf()
+    renderizacao = etapas_pdf.contadores.metricas()
+    for metricas, fora in ((metricas_cep, ("baldes_latencia", "circuito_aberto")),
+                           (metricas_cache, ("bytes", "arquivos")),
+                           (renderizacao, ("baldes_duracao",))):
+        for chave in fora:
+            metricas.pop(chave, None)
+    return {
+        "requisicoes": requisicoes,
+        "duracoes": duracoes,
+        "cep": metricas_cep,
+        "cache_pdf": metricas_cache,
+        "renderizacao": renderizacao,
+    }
+
+
+def gravar():
+    """Grava a foto deste processo em METRICAS_PASTA/<pid>.json, se mudou desde a última."""
+    global _ultima_foto
+    if not METRICAS_PASTA or _pid != os.getpid():
+        return
+    dados = json.dumps(_foto(), sort_keys=True, separators=(",", ":")).encode("utf-8")
+    if dados == _ultima_foto:
+        return
+    gravar_bytes_atomico(os.path.join(METRICAS_PASTA, f"{os.getpid()}.json"), dados)
+    _ultima_foto = dados
+
+
+def _gravar_periodicamente():
+    while True:
+        time.sleep(METRICAS_INTERVALO)
+        try:
+            gravar()
+        except OSError as e:
+            print(f"[Aviso] Não foi possível gravar as métricas: {e}")
+
+
+atexit.register(gravar)
+
+
+def _ler(caminho):
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _somar(total, parcial):
+    """Soma parcial em total: números somados, listas (baldes) posição a posição, dicts por chave."""
+    for chave, valor in parcial.items():
+        if isinstance(valor, bool) or valor is None:
+            continue
+        if isinstance(valor, dict):
+            _somar(total.setdefault(chave, {}), valor)
+        elif isinstance(valor, list):
+            atual = total.setdefault(chave, [0] * len(valor))
+            for i, v in enumerate(valor):
+                atual[i] += v
+        else:
+            total[chave] = total.get(chave, 0) + valor
+    return total
+
+
+def recolher(pid):
+    """
+    Soma a foto do processo pid (que terminou) em mortos.json e apaga a dele.
+    Chamado pelo processo mestre do gunicorn (child_exit).
+    """
+    if not METRICAS_PASTA:
+        return
+    caminho = os.path.join(METRICAS_PASTA, f"{pid}.json")
+    mortos = os.path.join(METRICAS_PASTA, _ARQUIVO_MORTOS)
+    with trava_arquivo(mortos):
+        foto = _ler(caminho)
+        if foto is None:
+            return
+        total = _somar(_ler(mortos) or {}, foto)
+        gravar_bytes_atomico(mortos, json.dumps(total, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+        os.remove(caminho)
+
+
+def limpar():
+    """Apaga as fotos de execuções anteriores (subida do gunicorn ou do servidor de desenvolvimento)."""
+    if not METRICAS_PASTA or not os.path.isdir(METRICAS_PASTA):
+        return
+    for nome in os.listdir(METRICAS_PASTA):
+        if nome.endswith(".json"):
+            try:
+                os.remove(os.path.join(METRICAS_PASTA, nome))
+            except FileNotFoundError:
+                pass
+
+
+def agregar():
+    """
+    Soma das fotos de todos os processos (vivos e mortos). Retorna (total, processos vivos).
+    Este processo entra pela foto em memória; se a pasta não puder ser gravada ou lida
+    (disco cheio, somente leitura), o /metrics sai só com o que foi possível ler.
+    """
+    atual = _foto()
+    if not METRICAS_PASTA:
+        return atual, 1
+    try:
+        gravar()  # para os outros workers enxergarem este processo
+    except OSError as e:
+        print(f"[Aviso] Não foi possível gravar as métricas: {e}")
+    proprio = f"{os.getpid()}.json"
+    fotos = []
+    try:
+        with trava_arquivo(os.path.join(METRICAS_PASTA, _ARQUIVO_MORTOS)):
+            for nome in os.listdir(METRICAS_PASTA):
+                if not nome.endswith(".json") or nome == proprio:
+                    continue
+                foto = _ler(os.path.join(METRICAS_PASTA, nome))
+                if foto is not None:
+                    fotos.append((nome, foto))
+    except OSError as e:
+        print(f"[Aviso] Não foi possível ler as métricas dos outros processos: {e}")
+    total = _somar({}, atual)
+    processos = 1
+    for nome, foto in fotos:
+        if nome != _ARQUIVO_MORTOS:
+            processos += 1
+        _somar(total, foto)
+    return total, processos
+
+
+# ----------------------------------------------
+# FORMATO DE EXPOSIÇÃO DO PROMETHEUS
+# ----------------------------------------------
+
+def _rotulos(rotulos):
+    if not rotulos:
+        return ""
+    partes = []
+    for nome, valor in rotulos.items():
+        valor = str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        partes.append(f'{nome}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Texto:
+    def __init__(self):
+        self.linhas = []
+
+    def metrica(self, nome, tipo, ajuda, amostras):
+        """amostras: lista de (rótulos, valor)."""
+        nome = f"{PREFIXO}_{nome}"
+        self.linhas.append(f"# HELP {nome} {ajuda}")
+        self.linhas.append(f"# TYPE {nome} {tipo}")
+        for rotulos, valor in amostras:
+            self.linhas.append(f"{nome}{_rotulos(rotulos)} {_numero(valor)}")
+
+    def histograma(self, nome, ajuda, limites, series):
+        """series: lista de (rótulos, baldes não cumulativos, soma); o último balde é o acima do maior limite."""
+        nome = f"{PREFIXO}_{nome}"
+        self.linhas.append(f"# HELP {nome} {ajuda}")
+        self.linhas.append(f"# TYPE {nome} histogram")
+        for rotulos, baldes, soma in series:
+            acumulado = 0
+            for limite, quantidade in zip(limites, baldes):
+                acumulado += quantidade
+                self.linhas.append(f"{nome}_bucket{_rotulos(dict(rotulos, le=repr(float(limite))))} {acumulado}")
+            acumulado = sum(baldes)
+            self.linhas.append(f"{nome}_bucket{_rotulos(dict(rotulos, le='+Inf'))} {acumulado}")
+            self.linhas.append(f"{nome}_sum{_rotulos(rotulos)} {_numero(float(soma))}")
+            self.linhas.append(f"{nome}_count{_rotulos(rotulos)} {acumulado}")
+
+    def __str__(self):
+        return "\n".join(self.linhas) + "\n"
+
+
+def _taxa(acertos, total):
+    return acertos / total if total else 0.0
+
+
+def exposicao(historico=None):
+    """Texto do /metrics (formato 0.0.4). historico: caminho do log do histórico da API."""
+    total, processos = agregar()
+    texto = _Texto()
+    texto.metrica("processos", "gauge", "Processos da API com métricas ativas.", [({}, processos)])
+
+    # Requisições HTTP
+    requisicoes = total.get("requisicoes", {})
+    texto.metrica("http_requisicoes_total", "counter", "Requisições atendidas por rota, método e código.", [
+        ({"rota": rota, "metodo": metodo, "codigo": codigo}, quantidade)
+        for rota, metodos in sorted(requisicoes.items())
+        for metodo, codigos in sorted(metodos.items())
+        for codigo, quantidade in sorted(codigos.items())
+    ])
+    duracoes = total.get("duracoes", {})
+    texto.histograma("http_duracao_segundos", "Tempo de resposta por rota e método.", BALDES_REQUISICAO, [
+        ({"rota": rota, "metodo": metodo}, medida["baldes"], medida["soma"])
+        for rota, metodos in sorted(duracoes.items())
+        for metodo, medida in sorted(metodos.items())
+    ])
+
+    # Renderização dos PDFs
+    renderizacao = total.get("renderizacao", {})
+    if renderizacao:
+        texto.histograma("pdf_renderizacao_segundos", "Duração da renderização de cada receita.",
+                         etapas_pdf.contadores.baldes,
+                         [({}, renderizacao["duracao_baldes"], renderizacao["segundos"])])
+        texto.metrica("pdf_etapa_segundos_total", "counter", "Tempo de renderização por etapa (etapas_pdf.py).", [
+            ({"etapa": etapa}, segundos) for etapa, segundos in renderizacao["segundos_etapa"].items()
+        ])
+        texto.metrica("pdf_bytes_total", "counter", "Bytes dos PDFs renderizados.", [({}, renderizacao["bytes"])])
+        texto.metrica("pdf_paginas_total", "counter", "Páginas dos PDFs renderizados.", [({}, renderizacao["paginas"])])
+
+    # Cache de PDFs
+    cache = total.get("cache_pdf", {})
+    if cache:
+        for nome in ("acertos", "faltas", "gravados", "removidos", "erros_gravacao"):
+            texto.metrica(f"cache_pdf_{nome}_total", "counter", f"Cache de PDFs: {nome}.", [({}, cache.get(nome, 0))])
+        texto.metrica("cache_pdf_taxa_acerto", "gauge", "Acertos / consultas ao cache de PDFs desde a subida.",
+                      [({}, _taxa(cache["acertos"], cache["acertos"] + cache["faltas"]))])
+
+    # Consulta de CEP
+    metricas_cep = total.get("cep", {})
+    if metricas_cep:
+        for nome in ("consultas", "acertos_memoria", "acertos_base", "acertos_disco", "consultas_rede",
+                     "tentativas_rede", "timeouts", "erros_rede", "rejeitadas_circuito", "aberturas_circuito"):
+            texto.metrica(f"cep_{nome}_total", "counter", f"Consulta de CEP: {nome.replace('_', ' ')}.",
+                          [({}, metricas_cep[nome])])
+        acertos = metricas_cep["acertos_memoria"] + metricas_cep["acertos_base"] + metricas_cep["acertos_disco"]
+        texto.metrica("cep_taxa_acerto", "gauge", "CEPs respondidos sem ir ao ViaCEP / consultas, desde a subida.",
+                      [({}, _taxa(acertos, metricas_cep["consultas"]))])
+        texto.histograma("cep_rede_segundos", "Latência das consultas ao ViaCEP (com retentativas).",
+                         cep.BALDES_LATENCIA,
+                         [({}, metricas_cep["latencia_baldes"], metricas_cep["latencia_soma"])])
+
+    # Valores do momento
+    if historico:
+        texto.metrica("historico_registros", "gauge", "Registros no log do histórico.",
+                      [({}, contar_registros(historico))])
+        tamanho = os.path.getsize(historico) if os.path.exists(historico) else 0
+        texto.metrica("historico_bytes", "gauge", "Tamanho do log do histórico em bytes.", [({}, tamanho)])
+    situacoes = fila_receitas.estatisticas()
+    limite = situacoes.pop("limite")
+    texto.metrica("fila_pedidos", "gauge", "Pedidos na fila de receitas por situação.",
+                  [({"status": status}, quantidade) for status, quantidade in situacoes.items()])
+    texto.metrica("fila_limite", "gauge", "Pedidos em aberto aceitos antes de recusar com 503.", [({}, limite)])
+    return str(texto)
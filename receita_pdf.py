@@ -0,0 +1,561 @@
+import os
+import io
+import re
+import datetime
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfmetrics
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.lib import colors
+import cache_pdf
+import etapas_pdf
+from cache_imagens import obter_imagem
+from texto import quebrar_texto
+from timbrado import CONFIG_POSICOES, desenhar_fundo, desenhar_rodape_fixo, obter_timbrado, carimbar_timbrado
+
+# ----------------------------------------------
+# NÚCLEO DE RENDERIZAÇÃO DA RECEITA
+# ----------------------------------------------
+# Única implementação do PDF da receita, compartilhada pela API Flask (app.py),
+# pelo Streamlit (vetrxx.py, deep.py) e pelas linhas de comando (Back.py, lote.py).
+# Não depende do Streamlit: avisos (ex.: imagem que não abriu) vão para a função
+# `avisar` recebida, que por padrão é print. Fontes, imagens decodificadas
+# (cache_imagens), timbrados (timbrado) e quebras de linha (texto) ficam em
+# cache no processo, e aquecer() os deixa prontos antes da primeira receita.
+# Receitas idênticas reaproveitam o PDF já gerado (cache_pdf, em disco).
+# O tempo de cada etapa do desenho pode ser medido (etapas_pdf, desligado por padrão).
+
+FONTES = ("Helvetica", "Helvetica-Bold")
+# Entra na chave do cache de PDFs (cache_pdf.py): aumente ao mudar o desenho da
+# receita, para que PDFs guardados com o layout antigo não sejam reaproveitados.
+VERSAO_LAYOUT = 1
+NOME_VET_PADRAO = "NOME NÃO DEFINIDO"
+CRMV_PADRAO = "00000"
+
+# ----------------------------------------------
+# FUNÇÕES DE APOIO
+# ----------------------------------------------
+
+def formatar_cpf(cpf_str: str) -> str:
+    digits = re.sub(r'\D', '', cpf_str)
+    if len(digits) == 11:
+        return f"{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}"
+    return cpf_str
+
+def formatar_cep(cep_str: str) -> str:
+    digits = re.sub(r'\D', '', cep_str)
+    if len(digits) == 8:
+        return f"{digits[:5]}-{digits[5:]}"
+    return cep_str
+
+def wrap_text(text, font_name, font_size, available_width, c=None):
+    # Mesmas quebras do cálculo linha a linha com c.stringWidth, mas com as
+    # larguras das palavras e o resultado em cache (ver texto.py).
+    return list(quebrar_texto(text, font_name, font_size, available_width))
+
+# ----------------------------------------------
+# DESENHO DA RECEITA
+# ----------------------------------------------
+
+# Limite inferior do conteúdo: abaixo dele ficam a curva, a assinatura e o rodapé.
+Y_LIMITE_CONTEUDO = 8.5 * cm
+
+def _desenhar_cabecalho_receita(c, tipo_farmacia, paciente, tutor, cpf, rg, endereco_formatado,
+                                especie_raca, pelagem, peso, idade, sexo, chip):
+    """Desenha título e as duas colunas de dados. Retorna o y logo abaixo dos campos."""
+    largura, altura = A4
+    font_label = "Helvetica-Bold"
+    font_value = "Helvetica"
+    font_label_size = 9
+    font_value_size = 9
+    font_title_size = 13
+
+    margem_esquerda = 2 * cm
+    margem_direita = 2 * cm
+    largura_util = largura - margem_esquerda - margem_direita
+
+    # Título (Tipo de Farmácia)
+    c.setFont(font_label, font_title_size)
+    c.drawCentredString(largura / 2, altura - 4 * cm, tipo_farmacia.upper())
+
+    col_width = largura_util / 2
+    col_left_x = margem_esquerda
+    col_right_x = margem_esquerda + col_width
+    y_left = altura - 5 * cm
+    y_right = altura - 5 * cm
+    esp_line = 0.7 * cm
+
+    # Coluna da esquerda (paciente, espécie, etc.)
+    left_fields = [
+        ("PACIENTE: ", paciente),
+        ("ESPÉCIE - RAÇA: ", especie_raca),
+        ("PELAGEM: ", pelagem),
+        ("SEXO: ", sexo),
+        ("IDADE: ", idade),
+        ("PESO: ", peso),
+        ("CHIP: ", chip)
+    ]
+
+    c.setFont(font_label, font_label_size)
+    for label, valor in left_fields:
+        c.drawString(col_left_x, y_left, label)
+        offset = c.stringWidth(label, font_label, font_label_size)
+        c.setFont(font_value, font_value_size)
+        c.drawString(col_left_x + offset, y_left, valor)
+        c.setFont(font_label, font_label_size)
+        y_left -= esp_line
+
+    # Coluna da direita (tutor, CPF, RG, endereço)
+    right_fields = [
+        ("TUTOR(A): ", tutor),
+        ("CPF: ", formatar_cpf(cpf))
+    ]
+    if rg:
+        right_fields.append(("RG: ", rg))
+    if endereco_formatado:
+        # Formatação de CEP se existir
+        cep_match = re.search(r'CEP:\s*(\d{5}-\d{3})', endereco_formatado)
+        if cep_match:
+            cep_raw = cep_match.group(1)
+            cep_formatado = formatar_cep(cep_raw)
+            endereco_formatado = re.sub(r'CEP:\s*\d{5}-\d{3}', f'CEP: {cep_formatado}', endereco_formatado)
+        right_fields.append(("ENDEREÇO: ", endereco_formatado))
+
+    c.setFont(font_label, font_label_size)
+    for label, valor in right_fields:
+        c.drawString(col_right_x, y_right, label)
+        offset = c.stringWidth(label, font_label, font_label_size)
+        c.setFont(font_value, font_value_size)
+        if label.strip(": ") == "ENDEREÇO":
+            available_width = col_width - offset
+            if c.stringWidth(valor, font_value, font_value_size) <= available_width:
+                c.drawString(col_right_x + offset, y_right, valor)
+            else:
+                lines = wrap_text(valor, font_value, font_value_size, available_width, c)
+                if lines:
+                    c.drawString(col_right_x + offset, y_right, lines[0])
+                    for linha in lines[1:]:
+                        y_right -= esp_line
+                        c.drawString(col_right_x, y_right, linha)
+        else:
+            c.drawString(col_right_x + offset, y_right, valor)
+        c.setFont(font_label, font_label_size)
+        y_right -= esp_line
+
+    return min(y_left, y_right) - 0.5 * cm
+
+def _desenhar_conteudo_receita(
+    c,
+    tipo_farmacia="FARMÁCIA VETERINÁRIA",
+    paciente="",
+    tutor="",
+    cpf="",
+    rg="",
+    endereco_formatado="",
+    especie_raca="",
+    pelagem="",
+    peso="",
+    idade="",
+    sexo="",
+    chip="",
+    lista_medicamentos=None,
+    instrucoes_uso="",
+    data_receita=None,
+    desenhar_fixos=None,
+    medicao=None
+):
+    """
+    Desenha a parte variável da receita (título, dados, medicamentos, instruções, curva e data).
+    O conteúdo é medido antes de desenhar: se não couber acima do rodapé, continua em
+    novas páginas, repetindo o cabeçalho. desenhar_fixos(c), se informado, é chamado no
+    início de cada página para desenhar o timbrado. A última página fica aberta (sem showPage).
+    medicao (etapas_pdf.Medicao), se informada, recebe o tempo de cada etapa.
+    """
+    if lista_medicamentos is None:
+        lista_medicamentos = []
+    if not data_receita:
+        data_receita = datetime.datetime.now().strftime("%d/%m/%Y")
+    largura, altura = A4
+    marcar = medicao.trocar if medicao else _nao_medir
+
+    font_value = "Helvetica"
+    font_value_size = 9
+    font_med_title = 10
+    font_footer = 10
+
+    margem_esquerda = 2 * cm
+    margem_direita = 2 * cm
+    largura_util = largura - margem_esquerda - margem_direita
+
+    cabecalho = dict(
+        tipo_farmacia=tipo_farmacia, paciente=paciente, tutor=tutor, cpf=cpf, rg=rg,
+        endereco_formatado=endereco_formatado, especie_raca=especie_raca, pelagem=pelagem,
+        peso=peso, idade=idade, sexo=sexo, chip=chip
+    )
+
+    # ---- Medição: blocos com a altura que cada um consome ----
+    marcar("medicamentos")
+    blocos = []
+    for i, med in enumerate(lista_medicamentos, start=1):
+        qtd = med.get("quantidade", "").upper()
+        nome_med = med.get("nome", "").upper()
+        conc = med.get("concentracao", "")
+        texto_med = f"{i}) QTD: {qtd} - MEDICAMENTO: {nome_med}"
+        texto_conc = f"   CONCENTRAÇÃO: {conc}" if conc else ""
+        altura_bloco = (1.2 * cm if conc else 0.6 * cm) + 0.4 * cm
+        blocos.append(("medicamento", altura_bloco, (texto_med, texto_conc)))
+
+    marcar("instrucoes")
+    linhas_instrucoes = []
+    for linha in instrucoes_uso.split("\n"):
+        linhas_instrucoes.extend(wrap_text(linha.upper(), "Helvetica", font_value_size, largura_util, c))
+    # O título das instruções vai junto com a primeira linha, para não ficar sozinho no pé da página
+    primeira = linhas_instrucoes[:1]
+    blocos.append(("instrucoes", 2.5 * cm + 0.6 * cm * len(primeira), primeira))
+    for linha in linhas_instrucoes[1:]:
+        blocos.append(("linha", 0.6 * cm, linha))
+
+    # Primeira página: timbrado e cabeçalho. O cabeçalho se repete igual nas
+    # páginas seguintes, então o y em que a lista começa vale para todas.
+    if desenhar_fixos:
+        desenhar_fixos(c)
+    marcar("cabecalho")
+    y_inicial = _desenhar_cabecalho_receita(c, **cabecalho) - 1.2 * cm
+
+    # ---- Paginação: distribui os blocos antes de desenhar qualquer um ----
+    marcar("preparacao")
+    paginas = [[]]
+    y = y_inicial
+    for bloco in blocos:
+        if y - bloco[1] < Y_LIMITE_CONTEUDO and paginas[-1]:
+            paginas.append([])
+            y = y_inicial
+        paginas[-1].append((bloco, y))
+        y -= bloco[1]
+    y_texto = y
+
+    # ---- Desenho ----
+    total_paginas = len(paginas)
+    for numero, pagina in enumerate(paginas, start=1):
+        if numero > 1:
+            marcar("serializacao")
+            c.showPage()
+            if desenhar_fixos:
+                desenhar_fixos(c)
+            marcar("cabecalho")
+            _desenhar_cabecalho_receita(c, **cabecalho)
+
+        for (tipo, _, dados), y_bloco in pagina:
+            marcar("medicamentos" if tipo == "medicamento" else "instrucoes")
+            if tipo == "medicamento":
+                texto_med, texto_conc = dados
+                c.setFont("Helvetica-Bold", font_med_title)
+                c.drawString(margem_esquerda, y_bloco, texto_med)
+                y_atual = y_bloco - 0.6 * cm
+                if texto_conc:
+                    c.setFont(font_value, font_value_size)
+                    c.drawString(margem_esquerda, y_atual, texto_conc)
+                    y_atual -= 0.6 * cm
+                c.setLineWidth(0.5)
+                c.setStrokeColor(colors.black)
+                c.line(margem_esquerda, y_atual + 0.3 * cm, largura - margem_direita, y_atual + 0.3 * cm)
+            elif tipo == "instrucoes":
+                # Instruções de uso
+                y_inst = y_bloco - 1.5 * cm
+                c.setFont("Helvetica-Bold", font_med_title)
+                c.drawString(margem_esquerda, y_inst, "INSTRUÇÕES DE USO: ")
+                c.setFont("Helvetica", font_value_size)
+                for l in dados:
+                    c.drawString(margem_esquerda, y_inst - 1 * cm, l)
+            else:
+                c.setFont("Helvetica", font_value_size)
+                c.drawString(margem_esquerda, y_bloco, dados)
+
+        marcar("rodape")
+        if numero == total_paginas:
+            # Curva ilustrativa
+            y_curva_inicial = y_texto - 1.5 * cm
+            if y_curva_inicial < 0:
+                y_curva_inicial = 0
+            y_curva_final = 8 * cm
+            c.setLineWidth(2)
+            c.setStrokeColor(colors.grey)
+            c.bezier(margem_esquerda, y_curva_inicial,
+                     largura / 2, y_curva_inicial + 2 * cm,
+                     largura / 2, y_curva_final - 2 * cm,
+                     largura - margem_direita, y_curva_final)
+            c.setStrokeColor(colors.black)
+
+        # Data (o restante do rodapé é fixo do perfil)
+        c.setFont("Helvetica", font_footer)
+        c.drawCentredString(CONFIG_POSICOES["assinatura_x"], CONFIG_POSICOES["data_y"], f"CURITIBA, PR, {data_receita}")
+        if total_paginas > 1:
+            c.setFont("Helvetica", 8)
+            c.drawRightString(largura - margem_direita, 2 * cm, f"PÁGINA {numero}/{total_paginas}")
+
+def _nao_medir(etapa):
+    pass
+
+def gerar_pdf_receita(
+    nome_pdf="receita_veterinaria.pdf",
+    tipo_farmacia="FARMÁCIA VETERINÁRIA",
+    paciente="",
+    tutor="",
+    cpf="",
+    rg="",
+    endereco_formatado="",
+    especie_raca="",
+    pelagem="",
+    peso="",
+    idade="",
+    sexo="",
+    chip="",
+    lista_medicamentos=None,
+    instrucoes_uso="",
+    data_receita=None,
+    imagem_fundo=None,
+    imagem_assinatura=None,
+    nome_vet=None,
+    crmv=None,
+    sipeagro=None,            # Recebe sipeagro
+    mostrar_sipeagro=False,  # Controla exibição do Sipeagro na receita
+    usar_timbrado=False,     # Reaproveita o timbrado do perfil (fundo, assinatura e rodapé fixo)
+    em_memoria=False,        # Retorna os bytes do PDF em vez de gravar em nome_pdf
+    avisar=print,            # Recebe os avisos (ex.: st.warning no Streamlit)
+    usar_cache=True          # Reaproveita o PDF de uma receita idêntica já gerada (cache_pdf.py)
+):
+    """
+    Gera o PDF de receita veterinária.
+    Se mostrar_sipeagro for True e sipeagro estiver preenchido, exibe o número abaixo do CRMV.
+    Com usar_timbrado=True, fundo, assinatura e rodapé fixo vêm do timbrado em cache
+    do perfil e apenas o conteúdo variável é desenhado.
+    Com em_memoria=True nada é gravado em disco e a função retorna os bytes do PDF;
+    nome_pdf também pode ser um objeto de arquivo (ex.: BytesIO) aberto para escrita.
+    Receitas idênticas (mesmos dados, perfil e conteúdo das imagens) saem do cache
+    de PDFs sem desenhar de novo; usar_cache=False força a renderização.
+    Com coletores registrados em etapas_pdf, cada renderização envia o tempo por etapa.
+    """
+    if not nome_vet:
+        nome_vet = NOME_VET_PADRAO
+    if not crmv:
+        crmv = CRMV_PADRAO
+    nome_vet_up = nome_vet.upper()
+
+    if usar_cache and cache_pdf.ativo():
+        if not data_receita:
+            data_receita = datetime.datetime.now().strftime("%d/%m/%Y")
+        conteudo_receita = dict(
+            tipo_farmacia=tipo_farmacia,
+            paciente=paciente,
+            tutor=tutor,
+            cpf=cpf,
+            rg=rg,
+            endereco_formatado=endereco_formatado,
+            especie_raca=especie_raca,
+            pelagem=pelagem,
+            peso=peso,
+            idade=idade,
+            sexo=sexo,
+            chip=chip,
+            lista_medicamentos=lista_medicamentos or [],
+            instrucoes_uso=instrucoes_uso,
+            data_receita=data_receita,
+            nome_vet=nome_vet,
+            crmv=crmv,
+            sipeagro=sipeagro,
+            mostrar_sipeagro=mostrar_sipeagro
+        )
+        # As imagens entram na chave pelo conteúdo (digest), não pelo caminho.
+        chave_pdf = cache_pdf.chave(
+            dict(conteudo_receita, versao_layout=VERSAO_LAYOUT, usar_timbrado=usar_timbrado),
+            (imagem_fundo, imagem_assinatura)
+        )
+        pdf = cache_pdf.obter(chave_pdf)
+        if pdf is None:
+            avisos = []
+            pdf = gerar_pdf_receita(
+                imagem_fundo=imagem_fundo,
+                imagem_assinatura=imagem_assinatura,
+                usar_timbrado=usar_timbrado,
+                em_memoria=True,
+                avisar=avisos.append,
+                usar_cache=False,
+                **conteudo_receita
+            )
+            for aviso in avisos:
+                avisar(aviso)
+            # PDF com falha de imagem não entra no cache, para tentar de novo na próxima receita.
+            if not avisos:
+                cache_pdf.guardar(chave_pdf, pdf)
+        return _entregar_pdf(pdf, nome_pdf, em_memoria)
+
+    medicao = etapas_pdf.iniciar()
+    destino = io.BytesIO() if em_memoria else nome_pdf
+    if usar_timbrado:
+        if medicao:
+            medicao.trocar("fundo")
+        timbrado_pdf, avisos = obter_timbrado(
+            imagem_fundo, imagem_assinatura, nome_vet_up, crmv, sipeagro, mostrar_sipeagro
+        )
+        for aviso in avisos:
+            avisar(aviso)
+        if medicao:
+            medicao.trocar("preparacao")
+        conteudo = io.BytesIO()
+        c = canvas.Canvas(conteudo, pagesize=A4)
+    else:
+        c = canvas.Canvas(destino, pagesize=A4)
+
+    # Fundo, assinatura e rodapé fixo em cada página (no modo timbrado vêm do carimbo)
+    desenhar_fixos = None
+    if not usar_timbrado:
+        avisos_exibidos = set()
+
+        def desenhar_fixos(c):
+            if medicao:
+                medicao.trocar("fundo")
+            avisos = desenhar_fundo(c, imagem_fundo)
+            if medicao:
+                medicao.trocar("rodape")
+            avisos += desenhar_rodape_fixo(c, imagem_assinatura, nome_vet_up, crmv, sipeagro, mostrar_sipeagro)
+            for aviso in avisos:
+                if aviso not in avisos_exibidos:
+                    avisos_exibidos.add(aviso)
+                    avisar(aviso)
+
+    _desenhar_conteudo_receita(
+        c,
+        tipo_farmacia=tipo_farmacia,
+        paciente=paciente,
+        tutor=tutor,
+        cpf=cpf,
+        rg=rg,
+        endereco_formatado=endereco_formatado,
+        especie_raca=especie_raca,
+        pelagem=pelagem,
+        peso=peso,
+        idade=idade,
+        sexo=sexo,
+        chip=chip,
+        lista_medicamentos=lista_medicamentos,
+        instrucoes_uso=instrucoes_uso,
+        data_receita=data_receita,
+        desenhar_fixos=desenhar_fixos,
+        medicao=medicao
+    )
+
+    if medicao:
+        medicao.trocar("serializacao")
+    c.showPage()
+    c.save()
+    if usar_timbrado:
+        carimbar_timbrado(timbrado_pdf, conteudo.getvalue(), destino)
+    if medicao:
+        _encerrar_medicao(medicao, c, destino, usar_timbrado)
+    if em_memoria:
+        return destino.getvalue()
+    return nome_pdf
+
+def _encerrar_medicao(medicao, c, destino, usar_timbrado):
+    if isinstance(destino, io.BytesIO):
+        tamanho = destino.getbuffer().nbytes
+    elif isinstance(destino, str):
+        tamanho = os.path.getsize(destino)
+    else:
+        tamanho = None  # objeto de arquivo do chamador
+    medicao.encerrar(paginas=c.getPageNumber() - 1, bytes=tamanho, timbrado=usar_timbrado)
+
+def _entregar_pdf(pdf, nome_pdf, em_memoria):
+    if em_memoria:
+        return pdf
+    if hasattr(nome_pdf, "write"):
+        nome_pdf.write(pdf)
+    else:
+        with open(nome_pdf, "wb") as f:
+            f.write(pdf)
+    return nome_pdf
+
+_OPCOES_ARQUIVO = ("nome_pdf", "em_memoria", "usar_timbrado", "usar_cache", "avisar")
+
+def gerar_pdf_receitas(nome_pdf="receitas.pdf", receitas=None, em_memoria=False, avisar=print, **padrao):
+    """
+    Gera várias receitas como páginas de um único PDF (impressão em lote).
+    Cada item de receitas aceita os mesmos campos de gerar_pdf_receita; os argumentos
+    extras (ex.: imagem_fundo, nome_vet, crmv) valem como padrão para todas as receitas.
+    Opções de um arquivo isolado (nome_pdf, em_memoria, usar_timbrado, usar_cache,
+    avisar) não se aplicam às páginas de um lote e são ignoradas nos itens.
+    O timbrado de cada perfil vira um form XObject definido uma vez e reaproveitado em
+    todas as páginas, assim como fontes e imagens, que entram uma única vez no arquivo.
+    """
+    destino = io.BytesIO() if em_memoria else nome_pdf
+    c = canvas.Canvas(destino, pagesize=A4)
+    timbrados = {}  # perfil -> nome do form XObject
+
+    for receita in receitas or []:
+        dados = dict(padrao)
+        dados.update(receita)
+        for opcao in _OPCOES_ARQUIVO:
+            dados.pop(opcao, None)
+        imagem_fundo = dados.pop("imagem_fundo", None)
+        imagem_assinatura = dados.pop("imagem_assinatura", None)
+        nome_vet_up = (dados.pop("nome_vet", None) or NOME_VET_PADRAO).upper()
+        crmv = dados.pop("crmv", None) or CRMV_PADRAO
+        sipeagro = dados.pop("sipeagro", None)
+        mostrar_sipeagro = dados.pop("mostrar_sipeagro", False)
+
+        chave = (imagem_fundo, imagem_assinatura, nome_vet_up, crmv, sipeagro if mostrar_sipeagro else None)
+        nome_forma = timbrados.get(chave)
+        if nome_forma is None:
+            nome_forma = f"timbrado{len(timbrados)}"
+            c.beginForm(nome_forma)
+            avisos = desenhar_fundo(c, imagem_fundo)
+            avisos += desenhar_rodape_fixo(c, imagem_assinatura, nome_vet_up, crmv, sipeagro, mostrar_sipeagro)
+            c.endForm()
+            for aviso in avisos:
+                avisar(aviso)
+            timbrados[chave] = nome_forma
+
+        _desenhar_conteudo_receita(c, desenhar_fixos=lambda c, forma=nome_forma: c.doForm(forma), **dados)
+        c.showPage()
+
+    c.save()
+    if em_memoria:
+        return destino.getvalue()
+    return nome_pdf
+
+# ----------------------------------------------
+# AQUECIMENTO DOS CACHES
+# ----------------------------------------------
+
+def aquecer(perfis=()):
+    """
+    Deixa o caminho quente pronto antes da primeira receita: métricas das fontes,
+    imagens decodificadas e timbrado de cada perfil, e uma receita de exemplo
+    renderizada em memória (carrega o restante do ReportLab e do pypdf).
+    perfis é uma lista de dicts com imagem_fundo, imagem_assinatura, nome_vet,
+    crmv, sipeagro e mostrar_sipeagro. Retorna os avisos encontrados.
+    """
+    avisos = []
+    for fonte in FONTES:
+        pdfmetrics.getFont(fonte)
+    for perfil in perfis or [{}]:
+        perfil = dict(perfil)
+        for chave in ("imagem_fundo", "imagem_assinatura"):
+            caminho = perfil.get(chave)
+            if caminho and os.path.exists(caminho):
+                try:
+                    obter_imagem(caminho)
+                except Exception as e:
+                    avisos.append(f"[Aviso] Não foi possível carregar {caminho}: {e}")
+        gerar_pdf_receita(
+            tipo_farmacia="FARMÁCIA VETERINÁRIA",
+            paciente="AQUECIMENTO",
+            lista_medicamentos=[{"quantidade": "1", "nome": "AQUECIMENTO", "concentracao": "1 MG"}],
+            instrucoes_uso="USO CONFORME ORIENTAÇÃO",
+            usar_timbrado=True,
+            em_memoria=True,
+            avisar=avisos.append,
+            usar_cache=False,
+            **perfil
+        )
+    return avisos
@@ -0,0 +1,17 @@
+import cep
+
+
+def test_busca_em_segundo_plano_conta_uma_consulta(tmp_path, monkeypatch):
+    monkeypatch.setattr(cep, "CEP_CACHE_ARQUIVO", str(tmp_path / "cep_cache.db"))
+    monkeypatch.setattr(cep.cep_base, "buscar", lambda cep_limpo: None)
+    endereco = {"logradouro": "Rua A", "bairro": "Centro", "localidade": "Curitiba", "uf": "PR"}
+    monkeypatch.setattr(cep, "_consultar_viacep", lambda cep_limpo: dict(endereco))
+    cep.invalidar_cep()
+
+    antes = cep.metricas_cep()["consultas"]
+    assert cep.iniciar_busca_cep("80010-000").result(timeout=5) == endereco
+    assert cep.metricas_cep()["consultas"] == antes + 1
+
+    # O resultado foi para o cache: a próxima busca é local e também conta uma vez
+    assert cep.iniciar_busca_cep("80010000").result(timeout=5) == endereco
+    assert cep.metricas_cep()["consultas"] == antes + 2
@@ -0,0 +1,22 @@
+import metricas
+from app import app
+
+
+def test_metrics_responde_com_pasta_sem_escrita(tmp_path, monkeypatch, capsys):
+    # Um arquivo no lugar da pasta pai: nem o root consegue criar METRICAS_PASTA
+    (tmp_path / "arquivo").write_text("")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(metricas, "METRICAS_PASTA", str(tmp_path / "arquivo" / "metricas"))
+    monkeypatch.setattr(metricas, "_ultima_foto", None)
+    # Volta a None no fim do teste: a thread e o atexit deixam de gravar na pasta padrão
+    monkeypatch.setattr(metricas, "_pid", None)
+
+    cliente = app.test_client()
+    cliente.get("/ver_historico")
+    resposta = cliente.get("/metrics")
+
+    assert resposta.status_code == 200
+    texto = resposta.get_data(as_text=True)
+    assert "receituario_processos 1" in texto
+    assert 'rota="/ver_historico"' in texto
+    assert "[Aviso] Não foi possível gravar as métricas" in capsys.readouterr().out
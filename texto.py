@@ -0,0 +1,52 @@
+import os
+from functools import lru_cache
+
+from reportlab.pdfbase import pdfmetrics
+
+# ----------------------------------------------
+# QUEBRA DE TEXTO COM MÉTRICAS EM CACHE
+# ----------------------------------------------
+# Mesma quebra gulosa do antigo wrap_text, mas a largura de cada palavra é
+# calculada uma vez (em unidades de glifo, 1/1000 do tamanho da fonte) e as
+# linhas são montadas somando larguras, em vez de medir a linha inteira a cada
+# palavra. O resultado de cada (texto, fonte, tamanho, largura) também fica em
+# um LRU, já que endereços e instruções se repetem muito entre receitas.
+
+LIMITE_PALAVRAS = int(os.environ.get("CACHE_PALAVRAS_LIMITE", "65536"))
+LIMITE_QUEBRAS = int(os.environ.get("CACHE_QUEBRAS_LIMITE", "4096"))
+
+
+@lru_cache(maxsize=LIMITE_PALAVRAS)
+def largura_em_unidades(palavra, fonte):
+    """Largura da palavra em unidades de glifo (a largura em pontos é unidades * 0.001 * tamanho)."""
+    # As fontes padrão têm larguras inteiras; o round desfaz o ruído de ponto
+    # flutuante de (unidades * 0.001 * 1000) para a soma ser exata.
+    return round(pdfmetrics.stringWidth(palavra, fonte, 1000), 6)
+
+
+@lru_cache(maxsize=LIMITE_QUEBRAS)
+def quebrar_texto(texto, fonte, tamanho, largura_disponivel):
+    """Quebra o texto em linhas que cabem na largura. Retorna uma tupla de linhas."""
+    espaco = largura_em_unidades(" ", fonte)
+    fator = 0.001 * tamanho
+    linhas = []
+    palavras_linha = []
+    unidades_linha = 0
+    for palavra in texto.split():
+        unidades = largura_em_unidades(palavra, fonte)
+        if palavras_linha:
+            teste = unidades_linha + espaco + unidades
+        else:
+            teste = unidades
+        # Mesma conta do ReportLab: soma das larguras dos glifos * 0.001 * tamanho
+        if teste * fator <= largura_disponivel:
+            palavras_linha.append(palavra)
+            unidades_linha = teste
+        else:
+            if palavras_linha:
+                linhas.append(" ".join(palavras_linha))
+            palavras_linha = [palavra]
+            unidades_linha = unidades
+    if palavras_linha:
+        linhas.append(" ".join(palavras_linha))
+    return tuple(linhas)
@@ -0,0 +1,163 @@
+import os
+import io
+import threading
+from collections import OrderedDict
+
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from pypdf import PdfReader, PdfWriter
+
+from cache_imagens import desenhar_imagem
+
+# ----------------------------------------------
+# TIMBRADO (PARTE FIXA DA RECEITA DE CADA VETERINÁRIO)
+# ----------------------------------------------
+# Imagem de fundo, assinatura e as linhas "M. V.", CRMV e SIPEAGRO não mudam
+# entre as receitas de um mesmo perfil. O timbrado é renderizado uma vez por
+# perfil (PDF de uma página guardado em um LRU) e carimbado por baixo do
+# conteúdo variável de cada receita.
+
+LARGURA, ALTURA = A4
+FONTE_RODAPE = "Helvetica"
+TAMANHO_FONTE_RODAPE = 10
+
+CONFIG_POSICOES = {
+    "assinatura_x": (LARGURA / 2) - 4 * cm,
+    "assinatura_y": 6.3 * cm,
+    "assinatura_width": 4 * cm,
+    "assinatura_height": 1.5 * cm,
+    "data_y": 5.8 * cm,
+    "mv_y": 5.3 * cm,
+    "crmv_y": 4.8 * cm,
+    "sipeagro_y": 4.3 * cm
+}
+
+LIMITE_TIMBRADOS = int(os.environ.get("CACHE_TIMBRADOS_LIMITE", "16"))  # perfis no LRU
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # chave do perfil -> bytes do PDF do timbrado
+
+
+def desenhar_fundo(c, imagem_fundo):
+    """Desenha a imagem de fundo em página inteira. Retorna a lista de avisos."""
+    if not imagem_fundo or not os.path.exists(imagem_fundo):
+        return []
+    try:
+        desenhar_imagem(
+            c,
+            imagem_fundo,
+            0, 0,
+            width=LARGURA,
+            height=ALTURA,
+            preserveAspectRatio=True,
+            mask='auto'
+        )
+    except Exception as e:
+        return [f"[Aviso] Não foi possível inserir a imagem de fundo: {e}"]
+    return []
+
+
+def desenhar_rodape_fixo(c, imagem_assinatura, nome_vet_up, crmv, sipeagro=None, mostrar_sipeagro=False):
+    """Desenha assinatura, nome do(a) veterinário(a), CRMV e SIPEAGRO. Retorna a lista de avisos."""
+    avisos = []
+    x_assinatura = CONFIG_POSICOES["assinatura_x"]
+    assinatura_width = CONFIG_POSICOES["assinatura_width"]
+    assinatura_height = CONFIG_POSICOES["assinatura_height"]
+
+    if imagem_assinatura and os.path.exists(imagem_assinatura):
+        try:
+            desenhar_imagem(
+                c,
+                imagem_assinatura,
+                x_assinatura - (assinatura_width / 2),
+                CONFIG_POSICOES["assinatura_y"],
+                width=assinatura_width,
+                height=assinatura_height,
+                preserveAspectRatio=True,
+                mask='auto'
+            )
+        except Exception as e:
+            avisos.append(f"[Aviso] Não foi possível inserir a assinatura: {e}")
+
+    c.setFont(FONTE_RODAPE, TAMANHO_FONTE_RODAPE)
+    c.drawCentredString(x_assinatura, CONFIG_POSICOES["mv_y"], f"M. V. {nome_vet_up}")
+    c.drawCentredString(x_assinatura, CONFIG_POSICOES["crmv_y"], f"CRMV-PR: {crmv}")
+    if mostrar_sipeagro and sipeagro:
+        c.drawCentredString(
+            x_assinatura,
+            CONFIG_POSICOES["sipeagro_y"],
+            f"Reg. SIPEAGRO nº: {sipeagro}"
+        )
+    return avisos
+
+
+def _assinatura_arquivo(caminho):
+    if not caminho or not os.path.exists(caminho):
+        return None
+    info = os.stat(caminho)
+    return (os.path.abspath(caminho), info.st_mtime_ns, info.st_size)
+
+
+def obter_timbrado(imagem_fundo, imagem_assinatura, nome_vet_up, crmv, sipeagro=None, mostrar_sipeagro=False):
+    """
+    Retorna (bytes do PDF do timbrado, avisos). O timbrado fica em cache por
+    perfil; trocar a imagem (mtime/tamanho) ou os dados do rodapé gera outro.
+    """
+    chave = (
+        _assinatura_arquivo(imagem_fundo),
+        _assinatura_arquivo(imagem_assinatura),
+        nome_vet_up,
+        crmv,
+        sipeagro if mostrar_sipeagro else None
+    )
+    with _lock:
+        pdf = _cache.get(chave)
+        if pdf is not None:
+            _cache.move_to_end(chave)
+            return pdf, []
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    avisos = desenhar_fundo(c, imagem_fundo)
+    avisos += desenhar_rodape_fixo(c, imagem_assinatura, nome_vet_up, crmv, sipeagro, mostrar_sipeagro)
+    c.showPage()
+    c.save()
+    pdf = buffer.getvalue()
+
+    # Timbrado com falha de imagem não entra no cache, para tentar de novo na próxima receita.
+    if not avisos:
+        with _lock:
+            _cache[chave] = pdf
+            _cache.move_to_end(chave)
+            while len(_cache) > LIMITE_TIMBRADOS:
+                _cache.popitem(last=False)
+    return pdf, avisos
+
+
+def invalidar_timbrados():
+    with _lock:
+        _cache.clear()
+
+
+def carimbar_timbrado(timbrado_pdf, conteudo_pdf, destino):
+    """
+    Sobrepõe cada página de conteudo_pdf ao timbrado e grava em destino
+    (caminho ou objeto de arquivo). Os streams do timbrado (inclusive a
+    imagem de fundo já comprimida) são copiados sem re-renderizar.
+    """
+    base = PdfReader(io.BytesIO(timbrado_pdf)).pages[0]
+    writer = PdfWriter()
+    for pagina in PdfReader(io.BytesIO(conteudo_pdf)).pages:
+        # Página nova para cada página de conteúdo: o timbrado é mesclado por baixo e
+        # seus recursos (imagem, fontes) são clonados uma única vez para o arquivo.
+        nova = writer.add_blank_page(float(base.mediabox.width), float(base.mediabox.height))
+        nova.merge_page(base)
+        nova.merge_page(pagina)
+        # Junta os pedaços de conteúdo da mescla em um único stream comprimido
+        nova.replace_contents(nova.get_contents())
+        nova.compress_content_streams()
+    # A mescla deixa para trás os streams de conteúdo substituídos; não vão para o arquivo.
+    writer.compress_identical_objects(remove_identicals=False, remove_orphans=True)
+    writer.write(destino)
+    return destino
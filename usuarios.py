@@ -0,0 +1,276 @@
+import os
+import sys
+import copy
+import hmac
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+
+from armazenamento import trava_arquivo, gravar_json_atomico, ler_json
+
+# ----------------------------------------------
+# DIRETÓRIO DE USUÁRIOS (users.json)
+# ----------------------------------------------
+# Mantém em memória o conteúdo do users.json, recarregado só quando o arquivo
+# muda (mtime/tamanho). Login vira uma consulta a um dicionário em vez de ler
+# e interpretar o arquivo inteiro. Alterações são feitas com leitura-alteração-
+# gravação sob trava de arquivo e gravadas de forma atômica (ver armazenamento.py).
+#
+# Senhas são guardadas como hash lento com sal (scrypt; PBKDF2 onde o Python
+# não tiver scrypt). Senhas antigas em texto puro continuam aceitas e são
+# convertidas para hash no primeiro login (ou com "python usuarios.py migrar").
+# Logins repetidos com a mesma senha não recalculam o hash: o resultado fica
+# em um cache em memória, indexado por um HMAC com chave aleatória do processo.
+
+SCRYPT_N = int(os.environ.get("SENHA_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.environ.get("SENHA_SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("SENHA_SCRYPT_P", "1"))
+PBKDF2_ITERACOES = int(os.environ.get("SENHA_PBKDF2_ITERACOES", "600000"))
+LIMITE_VERIFICACOES = int(os.environ.get("CACHE_LOGINS_LIMITE", "256"))  # entradas no cache de senhas
+
+_lock = threading.Lock()  # protege só o _indice; as gravações se alinham pela trava_arquivo do caminho
+_indice = {}  # caminho absoluto -> (mtime_ns, tamanho, usuarios)
+
+_lock_verificacoes = threading.Lock()
+_verificacoes = OrderedDict()  # HMAC(senha + hash) -> True
+_CHAVE_PROCESSO = os.urandom(32)
+
+
+# ----------------------------------------------
+# HASH DE SENHAS
+# ----------------------------------------------
+
+def _b64(dados):
+    return base64.b64encode(dados).decode("ascii")
+
+
+def gerar_hash_senha(senha):
+    """Hash com sal no formato 'algoritmo$parâmetros$sal$hash'."""
+    sal = os.urandom(16)
+    if hasattr(hashlib, "scrypt"):
+        derivada = hashlib.scrypt(senha.encode("utf-8"), salt=sal, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=32)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(sal)}${_b64(derivada)}"
+    derivada = hashlib.pbkdf2_hmac("sha256", senha.encode("utf-8"), sal, PBKDF2_ITERACOES)
+    return f"pbkdf2_sha256${PBKDF2_ITERACOES}${_b64(sal)}${_b64(derivada)}"
+
+
+def eh_hash(valor):
+    return isinstance(valor, str) and valor.startswith(("scrypt$", "pbkdf2_sha256$"))
+
+
+def precisa_rehash(armazenado):
+    """True para senha em texto puro ou hash com parâmetros mais fracos que os atuais."""
+    if not eh_hash(armazenado):
+        return True
+    partes = armazenado.split("$")
+    try:
+        if partes[0] == "scrypt":
+            return hasattr(hashlib, "scrypt") and tuple(map(int, partes[1:4])) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return hasattr(hashlib, "scrypt") or int(partes[1]) < PBKDF2_ITERACOES
+    except (ValueError, IndexError):
+        return True
+
+
+def _conferir(senha, armazenado):
+    if not eh_hash(armazenado):
+        # Senha antiga, ainda em texto puro
+        return hmac.compare_digest(senha.encode("utf-8"), armazenado.encode("utf-8"))
+    partes = armazenado.split("$")
+    try:
+        if partes[0] == "scrypt":
+            n, r, p = map(int, partes[1:4])
+            sal, esperado = base64.b64decode(partes[4]), base64.b64decode(partes[5])
+            derivada = hashlib.scrypt(senha.encode("utf-8"), salt=sal, n=n, r=r, p=p,
+                                      dklen=len(esperado), maxmem=2 * 128 * n * r * p)
+        else:
+            iteracoes = int(partes[1])
+            sal, esperado = base64.b64decode(partes[2]), base64.b64decode(partes[3])
+            derivada = hashlib.pbkdf2_hmac("sha256", senha.encode("utf-8"), sal, iteracoes, len(esperado))
+    except (ValueError, IndexError):
+        return False
+    return hmac.compare_digest(derivada, esperado)
+
+
+def _chave_verificacao(senha, armazenado):
+    return hmac.new(_CHAVE_PROCESSO, f"{armazenado}\0{senha}".encode("utf-8"), hashlib.sha256).digest()
+
+
+def _memorizar(senha, armazenado):
+    with _lock_verificacoes:
+        _verificacoes[_chave_verificacao(senha, armazenado)] = True
+        while len(_verificacoes) > LIMITE_VERIFICACOES:
+            _verificacoes.popitem(last=False)
+
+
+def verificar_senha(senha, armazenado):
+    """Confere a senha com o valor guardado (hash ou texto puro antigo), usando o cache de verificações."""
+    if not senha or not armazenado or not isinstance(armazenado, str):
+        return False
+    chave = _chave_verificacao(senha, armazenado)
+    with _lock_verificacoes:
+        if chave in _verificacoes:
+            _verificacoes.move_to_end(chave)
+            return True
+    if not _conferir(senha, armazenado):
+        return False
+    # Só acertos entram no cache; senha errada sempre paga o custo do hash.
+    _memorizar(senha, armazenado)
+    return True
+
+
+# ----------------------------------------------
+# ÍNDICE EM MEMÓRIA E GRAVAÇÃO ATÔMICA
+# ----------------------------------------------
+
+def _indice_atual(caminho):
+    """Dicionário de usuários em cache, recarregado se o arquivo mudou. Não deve ser alterado."""
+    caminho = os.path.abspath(caminho)
+    try:
+        info = os.stat(caminho)
+    except OSError:
+        _indice.pop(caminho, None)
+        return {}
+    entrada = _indice.get(caminho)
+    if entrada and entrada[0] == info.st_mtime_ns and entrada[1] == info.st_size:
+        return entrada[2]
+    with _lock:
+        # Arquivo corrompido levanta ValueError: melhor falhar do que tratar como vazio.
+        usuarios = ler_json(caminho, {})
+        if not isinstance(usuarios, dict):
+            raise ValueError(f"Arquivo {caminho} não contém um dicionário de usuários.")
+        _indice[caminho] = (info.st_mtime_ns, info.st_size, usuarios)
+    return usuarios
+
+
+def _gravar(caminho, usuarios):
+    caminho = os.path.abspath(caminho)
+    gravar_json_atomico(caminho, usuarios, indent=4)
+    info = os.stat(caminho)
+    with _lock:
+        _indice[caminho] = (info.st_mtime_ns, info.st_size, usuarios)
+
+
+def carregar(caminho):
+    """Cópia do dicionário de usuários (login -> dados)."""
+    return copy.deepcopy(_indice_atual(caminho))
+
+
+def obter(caminho, login):
+    """Cópia dos dados de um usuário, ou None."""
+    dados = _indice_atual(caminho).get(login)
+    return dict(dados) if dados is not None else None
+
+
+def salvar(caminho, usuarios):
+    """Substitui o arquivo inteiro (gravação atômica)."""
+    # Sem o _lock enquanto espera a trava de outro processo: os logins que
+    # recarregam o índice (_indice_atual) não ficam presos atrás da gravação.
+    with trava_arquivo(caminho):
+        _gravar(caminho, copy.deepcopy(usuarios))
+
+
+def atualizar(caminho, funcao):
+    """
+    Leitura-alteração-gravação sob a trava do arquivo (vale entre threads e
+    entre processos): funcao recebe uma cópia do dicionário de usuários e o
+    altera no lugar. Retorna o que funcao retornar.
+    """
+    with trava_arquivo(caminho):
+        # Dentro da trava o arquivo é relido do disco: outro processo pode tê-lo
+        # alterado no mesmo instante (mtime igual) da última leitura.
+        usuarios = ler_json(caminho, {})
+        if not isinstance(usuarios, dict):
+            raise ValueError(f"Arquivo {caminho} não contém um dicionário de usuários.")
+        resultado = funcao(usuarios)
+        _gravar(caminho, usuarios)
+        return resultado
+
+
+# ----------------------------------------------
+# OPERAÇÕES DE USUÁRIO
+# ----------------------------------------------
+
+def autenticar(caminho, login, senha):
+    """Retorna os dados do usuário se login e senha conferem, senão None. Converte senhas antigas para hash."""
+    dados = obter(caminho, login)
+    if not dados or not verificar_senha(senha, dados.get("password")):
+        return None
+    if precisa_rehash(dados.get("password")):
+        novo_hash = gerar_hash_senha(senha)
+        _memorizar(senha, novo_hash)
+
+        def _trocar_hash(usuarios):
+            # Só troca se a senha não mudou entre a leitura e agora
+            if login in usuarios and usuarios[login].get("password") == dados.get("password"):
+                usuarios[login]["password"] = novo_hash
+
+        atualizar(caminho, _trocar_hash)
+    return dados
+
+
+def cadastrar(caminho, login, senha, **campos):
+    """Cadastra (ou atualiza) o usuário, guardando o hash da senha."""
+    novo_hash = gerar_hash_senha(senha)
+
+    def _cadastrar(usuarios):
+        usuario = usuarios.setdefault(login, {})
+        usuario["password"] = novo_hash
+        usuario.update(campos)
+        usuario.setdefault("background_image", None)
+        usuario.setdefault("signature_image", None)
+
+    atualizar(caminho, _cadastrar)
+
+
+def alterar(caminho, login, **campos):
+    """Altera campos de um usuário existente. Retorna False se o usuário não existe."""
+    def _alterar(usuarios):
+        if login not in usuarios:
+            return False
+        usuarios[login].update(campos)
+        return True
+
+    return atualizar(caminho, _alterar)
+
+
+def remover(caminho, login):
+    """Remove o usuário. Retorna False se ele não existia."""
+    return atualizar(caminho, lambda usuarios: usuarios.pop(login, None) is not None)
+
+
+def migrar_senhas(caminho):
+    """Converte todas as senhas em texto puro para hash. Retorna quantas foram convertidas."""
+    pendentes = {
+        login: dados["password"]
+        for login, dados in _indice_atual(caminho).items()
+        if dados.get("password") and not eh_hash(dados["password"])
+    }
+    if not pendentes:
+        return 0
+    # Os hashes são calculados fora da trava; a gravação só troca os que não mudaram.
+    novos = {login: gerar_hash_senha(senha) for login, senha in pendentes.items()}
+
+    def _trocar(usuarios):
+        total = 0
+        for login, novo_hash in novos.items():
+            if login in usuarios and usuarios[login].get("password") == pendentes[login]:
+                usuarios[login]["password"] = novo_hash
+                total += 1
+        return total
+
+    return atualizar(caminho, _trocar)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != "migrar":
+        print("Uso: python usuarios.py migrar [users.json]")
+        return 2
+    caminho = argv[1] if len(argv) > 1 else "users.json"
+    print(f"{migrar_senhas(caminho)} senha(s) convertida(s) para hash em {caminho}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
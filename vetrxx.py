@@ -1,20 +1,26 @@
 import os
-import json
 import datetime
 import re
-import requests
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.lib import colors
 import streamlit as st
 import pandas as pd  # Importação adicionada
+from historico_log import anexar_registro, ler_registros, reescrever_log, migrar_historico_json
+import historico_db
+import usuarios as usuarios_dir
+from armazenamento import gravar_bytes_atomico
+from cache_imagens import invalidar_imagem
+from cep import iniciar_busca_cep
+# Renderização compartilhada com a API Flask e as linhas de comando (reexportada
+# aqui para quem já importava de vetrxx, como o lote.py)
+from receita_pdf import formatar_cpf, formatar_cep, wrap_text, gerar_pdf_receita, gerar_pdf_receitas, aquecer
 
 # ----------------------------------------------
 # CONSTANTES E CONFIGURAÇÕES
 # ----------------------------------------------
 USERS_FILE = "users.json"         # Arquivo para armazenar usuários
 USER_FILES_DIR = "user_files"     # Pasta base para armazenar arquivos de cada usuário
+# "sqlite" ou "jsonl". A troca pode ser feita nos dois sentidos: o banco é montado a partir do
+# log na primeira vez que o sqlite é usado, e volta para o log quando o jsonl é usado de novo.
+HISTORICO_BACKEND = os.environ.get("HISTORICO_BACKEND", "sqlite")
 
 ADMIN_LOGIN = "larsen"
 ADMIN_SENHA = "31415962Isa@"
@@ -24,17 +30,10 @@ ADMIN_SENHA = "31415962Isa@"
 # ----------------------------------------------
 
 def carregar_usuarios():
-    if not os.path.exists(USERS_FILE):
-        return {}
-    with open(USERS_FILE, "r", encoding="utf-8") as f:
-        try:
-            return json.load(f)
-        except:
-            return {}
+    return usuarios_dir.carregar(USERS_FILE)
 
 def salvar_usuarios(usuarios):
-    with open(USERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(usuarios, f, indent=4, ensure_ascii=False)
+    usuarios_dir.salvar(USERS_FILE, usuarios)
 
 def verificar_login(login, senha):
     if login == ADMIN_LOGIN and senha == ADMIN_SENHA:
@@ -47,9 +46,8 @@ def verificar_login(login, senha):
             "crmv": None,
             "sipeagro": None  # Adicionado para manter a consistência no caso do admin
         }
-    usuarios = carregar_usuarios()
-    user_data = usuarios.get(login)
-    if user_data and user_data.get("password") == senha:
+    user_data = usuarios_dir.autenticar(USERS_FILE, login, senha)
+    if user_data:
         return {
             "login": login,
             "is_admin": user_data.get("is_admin", False),
@@ -62,7 +60,7 @@ def verificar_login(login, senha):
     return None
 
 def cadastrar_usuario(novo_login, nova_senha, nome_vet=None, crmv=None, sipeagro=None, is_admin=False):
-    """Cadastra (ou atualiza) um usuário no sistema.
+    """Cadastra (ou atualiza) um usuário no sistema. A senha é guardada como hash.
 
     :param novo_login: str
     :param nova_senha: str
@@ -71,353 +69,116 @@ def cadastrar_usuario(novo_login, nova_senha, nome_vet=None, crmv=None, sipeagro
     :param sipeagro: str ou None
     :param is_admin: bool
     """
-    usuarios = carregar_usuarios()
-    if novo_login not in usuarios:
-        usuarios[novo_login] = {}
-    usuarios[novo_login]["password"] = nova_senha
-    usuarios[novo_login]["is_admin"] = is_admin
-    usuarios[novo_login]["nome_vet"] = nome_vet
-    usuarios[novo_login]["crmv"] = crmv
-    usuarios[novo_login]["sipeagro"] = sipeagro  # Salvando Sipeagro
-    if "background_image" not in usuarios[novo_login]:
-        usuarios[novo_login]["background_image"] = None
-    if "signature_image" not in usuarios[novo_login]:
-        usuarios[novo_login]["signature_image"] = None
-    salvar_usuarios(usuarios)
+    usuarios_dir.cadastrar(
+        USERS_FILE,
+        novo_login,
+        nova_senha,
+        is_admin=is_admin,
+        nome_vet=nome_vet,
+        crmv=crmv,
+        sipeagro=sipeagro  # Salvando Sipeagro
+    )
 
 def remover_usuario(login):
-    usuarios = carregar_usuarios()
-    if login in usuarios:
-        del usuarios[login]
-        salvar_usuarios(usuarios)
+    if usuarios_dir.remover(USERS_FILE, login):
         user_folder = os.path.join(USER_FILES_DIR, login)
         if os.path.exists(user_folder):
             import shutil
             shutil.rmtree(user_folder)
 
 def atualizar_imagem_usuario(login, image_path, tipo="fundo"):
-    usuarios = carregar_usuarios()
-    if login not in usuarios:
-        return
     if tipo == "fundo":
-        usuarios[login]["background_image"] = image_path
+        usuarios_dir.alterar(USERS_FILE, login, background_image=image_path)
     else:
-        usuarios[login]["signature_image"] = image_path
-    salvar_usuarios(usuarios)
-
-# ----------------------------------------------
-# FUNÇÕES DE APOIO GERAIS
-# ----------------------------------------------
-
-def formatar_cpf(cpf_str: str) -> str:
-    digits = re.sub(r'\D', '', cpf_str)
-    if len(digits) == 11:
-        return f"{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}"
-    return cpf_str
-
-def formatar_cep(cep_str: str) -> str:
-    digits = re.sub(r'\D', '', cep_str)
-    if len(digits) == 8:
-        return f"{digits[:5]}-{digits[5:]}"
-    return cep_str
-
-def buscar_endereco_via_cep(cep: str) -> dict:
-    cep_limpo = re.sub(r'\D', '', cep)
-    if not cep_limpo:
-        return {}
-    try:
-        url = f"https://viacep.com.br/ws/{cep_limpo}/json/"
-        r = requests.get(url, timeout=10)
-        r.raise_for_status()
-        dados = r.json()
-        if "erro" in dados:
-            return {}
-        return {
-            "logradouro": dados.get("logradouro", ""),
-            "bairro": dados.get("bairro", ""),
-            "localidade": dados.get("localidade", ""),
-            "uf": dados.get("uf", "")
-        }
-    except:
-        return {}
-
-def wrap_text(text, font_name, font_size, available_width, c):
-    words = text.split()
-    lines = []
-    current_line = ""
-    c.setFont(font_name, font_size)
-    for word in words:
-        test_line = word if current_line == "" else current_line + " " + word
-        if c.stringWidth(test_line, font_name, font_size) <= available_width:
-            current_line = test_line
-        else:
-            if current_line:
-                lines.append(current_line)
-            current_line = word
-    if current_line:
-        lines.append(current_line)
-    return lines
+        usuarios_dir.alterar(USERS_FILE, login, signature_image=image_path)
 
 # ----------------------------------------------
 # FUNÇÕES DE HISTÓRICO
 # ----------------------------------------------
 
+def _caminho_historico(login):
+    """Garante a migração do historico.json antigo e retorna o caminho do log."""
+    user_folder = os.path.join(USER_FILES_DIR, login)
+    historico_path = os.path.join(user_folder, "historico.jsonl")
+    migrar_historico_json(os.path.join(user_folder, "historico.json"), historico_path)
+    return historico_path
+
+def _caminho_historico_log(login):
+    """Caminho do log para o histórico jsonl, trazendo os registros de um banco usado antes."""
+    historico_path = _caminho_historico(login)
+    db_path = os.path.join(USER_FILES_DIR, login, "historico.db")
+    if os.path.exists(db_path):
+        historico_db.exportar_log(db_path, historico_path)
+    return historico_path
+
+def _caminho_historico_db(login):
+    """Garante a importação do histórico em arquivo e retorna o caminho do banco."""
+    db_path = os.path.join(USER_FILES_DIR, login, "historico.db")
+    if not os.path.exists(db_path):
+        historico_db.importar_log(db_path, _caminho_historico(login))
+    return db_path
+
 def carregar_historico(login):
-    historico_path = os.path.join(USER_FILES_DIR, login, "historico.json")
-    if not os.path.exists(historico_path):
-        return []
-    with open(historico_path, "r", encoding="utf-8") as f:
-        try:
-            return json.load(f)
-        except:
-            return []
+    if HISTORICO_BACKEND == "sqlite":
+        return historico_db.carregar_todos(_caminho_historico_db(login))
+    return ler_registros(_caminho_historico_log(login))
 
 def salvar_historico(login, historico):
-    user_folder = os.path.join(USER_FILES_DIR, login)
-    if not os.path.exists(user_folder):
-        os.makedirs(user_folder)
-    historico_path = os.path.join(user_folder, "historico.json")
-    with open(historico_path, "w", encoding="utf-8") as f:
-        json.dump(historico, f, indent=4, ensure_ascii=False)
+    if HISTORICO_BACKEND == "sqlite":
+        historico_db.substituir_todos(_caminho_historico_db(login), historico)
+    else:
+        reescrever_log(_caminho_historico_log(login), historico)
 
-# ----------------------------------------------
-# FUNÇÃO PRINCIPAL PARA GERAR O PDF
-# ----------------------------------------------
+def registrar_no_historico(login, registro):
+    if HISTORICO_BACKEND == "sqlite":
+        historico_db.inserir_registro(_caminho_historico_db(login), registro)
+    else:
+        anexar_registro(_caminho_historico_log(login), registro)
 
-def gerar_pdf_receita(
-    nome_pdf="receita_veterinaria.pdf",
-    tipo_farmacia="FARMÁCIA VETERINÁRIA",
-    paciente="",
-    tutor="",
-    cpf="",
-    rg="",
-    endereco_formatado="",
-    especie_raca="",
-    pelagem="",
-    peso="",
-    idade="",
-    sexo="",
-    chip="",
-    lista_medicamentos=None,
-    instrucoes_uso="",
-    data_receita=None,
-    imagem_fundo=None,
-    imagem_assinatura=None,
-    nome_vet=None,
-    crmv=None,
-    sipeagro=None,            # Recebe sipeagro
-    mostrar_sipeagro=False   # Controla exibição do Sipeagro na receita
-):
+def consultar_historico(login, paciente=None, tutor=None, cpf=None, controlado=None,
+                        data_inicio=None, data_fim=None, pagina=1, tamanho_pagina=20):
     """
-    Gera o PDF de receita veterinária.
-    Se mostrar_sipeagro for True e sipeagro estiver preenchido, exibe o número abaixo do CRMV.
+    Consulta paginada e filtrada do histórico.
+    Retorna (lista de (id, registro) da página, total de registros do filtro).
     """
-    if lista_medicamentos is None:
-        lista_medicamentos = []
-    if not data_receita:
-        data_receita = datetime.datetime.now().strftime("%d/%m/%Y")
-    if not nome_vet:
-        nome_vet = "NOME NÃO DEFINIDO"
-    if not crmv:
-        crmv = "00000"
-    nome_vet_up = nome_vet.upper()
-
-    largura, altura = A4
-    c = canvas.Canvas(nome_pdf, pagesize=A4)
-
-    font_label = "Helvetica-Bold"
-    font_value = "Helvetica"
-    font_label_size = 9
-    font_value_size = 9
-    font_title_size = 13
-    font_med_title = 10
-    font_footer = 10
-
-    margem_esquerda = 2 * cm
-    margem_direita = 2 * cm
-    largura_util = largura - margem_esquerda - margem_direita
-
-    config_posicoes = {
-        "assinatura_x": (largura / 2) - 4 * cm,
-        "assinatura_y": 6.3 * cm,
-        "assinatura_width": 4 * cm,
-        "assinatura_height": 1.5 * cm,
-        "data_y": 5.8 * cm,
-        "mv_y": 5.3 * cm,
-        "crmv_y": 4.8 * cm,
-        "sipeagro_y": 4.3 * cm  # Nova posição para Sipeagro
-    }
-
-    # Inserção de imagem de fundo
-    if imagem_fundo and os.path.exists(imagem_fundo):
-        try:
-            c.drawImage(
-                imagem_fundo,
-                0, 0,
-                width=largura,
-                height=altura,
-                preserveAspectRatio=True,
-                mask='auto'
-            )
-        except Exception as e:
-            st.warning(f"[Aviso] Não foi possível inserir a imagem de fundo: {e}")
-
-    # Título (Tipo de Farmácia)
-    c.setFont(font_label, font_title_size)
-    c.drawCentredString(largura / 2, altura - 4 * cm, tipo_farmacia.upper())
-
-    col_width = largura_util / 2
-    col_left_x = margem_esquerda
-    col_right_x = margem_esquerda + col_width
-    y_left = altura - 5 * cm
-    y_right = altura - 5 * cm
-    esp_line = 0.7 * cm
-
-    # Coluna da esquerda (paciente, espécie, etc.)
-    left_fields = [
-        ("PACIENTE: ", paciente),
-        ("ESPÉCIE - RAÇA: ", especie_raca),
-        ("PELAGEM: ", pelagem),
-        ("SEXO: ", sexo),
-        ("IDADE: ", idade),
-        ("PESO: ", peso),
-        ("CHIP: ", chip)
-    ]
-
-    c.setFont(font_label, font_label_size)
-    for label, valor in left_fields:
-        c.drawString(col_left_x, y_left, label)
-        offset = c.stringWidth(label, font_label, font_label_size)
-        c.setFont(font_value, font_value_size)
-        c.drawString(col_left_x + offset, y_left, valor)
-        c.setFont(font_label, font_label_size)
-        y_left -= esp_line
-
-    # Coluna da direita (tutor, CPF, RG, endereço)
-    right_fields = [
-        ("TUTOR(A): ", tutor),
-        ("CPF: ", formatar_cpf(cpf))
-    ]
-    if rg:
-        right_fields.append(("RG: ", rg))
-    if endereco_formatado:
-        # Formatação de CEP se existir
-        cep_match = re.search(r'CEP:\s*(\d{5}-\d{3})', endereco_formatado)
-        if cep_match:
-            cep_raw = cep_match.group(1)
-            cep_formatado = formatar_cep(cep_raw)
-            endereco_formatado = re.sub(r'CEP:\s*\d{5}-\d{3}', f'CEP: {cep_formatado}', endereco_formatado)
-        right_fields.append(("ENDEREÇO: ", endereco_formatado))
-
-    c.setFont(font_label, font_label_size)
-    for label, valor in right_fields:
-        c.drawString(col_right_x, y_right, label)
-        offset = c.stringWidth(label, font_label, font_label_size)
-        c.setFont(font_value, font_value_size)
-        if label.strip(": ") == "ENDEREÇO":
-            available_width = col_width - offset
-            if c.stringWidth(valor, font_value, font_value_size) <= available_width:
-                c.drawString(col_right_x + offset, y_right, valor)
-            else:
-                lines = wrap_text(valor, font_value, font_value_size, available_width, c)
-                if lines:
-                    c.drawString(col_right_x + offset, y_right, lines[0])
-                    for linha in lines[1:]:
-                        y_right -= esp_line
-                        c.drawString(col_right_x, y_right, linha)
-        else:
-            c.drawString(col_right_x + offset, y_right, valor)
-        c.setFont(font_label, font_label_size)
-        y_right -= esp_line
-
-    y_campos = min(y_left, y_right) - 0.5 * cm
-
-    # Lista de medicamentos
-    y_inicial = y_campos - 1.2 * cm
-    c.setFont("Helvetica-Bold", font_med_title)
-    y_atual = y_inicial
-    for i, med in enumerate(lista_medicamentos, start=1):
-        qtd = med.get("quantidade", "").upper()
-        nome_med = med.get("nome", "").upper()
-        conc = med.get("concentracao", "")
-        texto_med = f"{i}) QTD: {qtd} - MEDICAMENTO: {nome_med}"
-        c.drawString(margem_esquerda, y_atual, texto_med)
-        y_atual -= 0.6 * cm
-
-        if conc:
-            texto_conc = f"   CONCENTRAÇÃO: {conc}"
-            c.setFont(font_value, font_value_size)
-            c.drawString(margem_esquerda, y_atual, texto_conc)
-            c.setFont("Helvetica-Bold", font_med_title)
-            y_atual -= 0.6 * cm
-
-        c.setLineWidth(0.5)
-        c.setStrokeColor(colors.black)
-        c.line(margem_esquerda, y_atual + 0.3 * cm, largura - margem_direita, y_atual + 0.3 * cm)
-        y_atual -= 0.4 * cm
-
-    # Instruções de uso
-    y_inst = y_atual - 1.5 * cm
-    c.setFont("Helvetica-Bold", font_med_title)
-    c.drawString(margem_esquerda, y_inst, "INSTRUÇÕES DE USO: ")
-    y_texto = y_inst - 1 * cm
-    c.setFont("Helvetica", font_value_size)
-    for linha in instrucoes_uso.split("\n"):
-        lines = wrap_text(linha.upper(), "Helvetica", font_value_size, largura_util, c)
-        for l in lines:
-            c.drawString(margem_esquerda, y_texto, l)
-            y_texto -= 0.6 * cm
-
-    # Curva ilustrativa
-    y_curva_inicial = y_texto - 1.5 * cm
-    if y_curva_inicial < 0:
-        y_curva_inicial = 0
-    y_curva_final = 8 * cm
-    c.setLineWidth(2)
-    c.setStrokeColor(colors.grey)
-    c.bezier(margem_esquerda, y_curva_inicial,
-             largura / 2, y_curva_inicial + 2 * cm,
-             largura / 2, y_curva_final - 2 * cm,
-             largura - margem_direita, y_curva_final)
-    c.setStrokeColor(colors.black)
-
-    # Assinatura e rodapé
-    x_assinatura = config_posicoes["assinatura_x"]
-    y_assinatura = config_posicoes["assinatura_y"]
-    assinatura_width = config_posicoes["assinatura_width"]
-    assinatura_height = config_posicoes["assinatura_height"]
-
-    if imagem_assinatura and os.path.exists(imagem_assinatura):
-        try:
-            c.drawImage(
-                imagem_assinatura,
-                x_assinatura - (assinatura_width / 2),
-                y_assinatura,
-                width=assinatura_width,
-                height=assinatura_height,
-                preserveAspectRatio=True,
-                mask='auto'
-            )
-            y_assinatura -= assinatura_height + 0.2 * cm
-        except Exception as e:
-            st.warning(f"[Aviso] Não foi possível inserir a assinatura: {e}")
-
-    c.setFont("Helvetica", font_footer)
-    c.drawCentredString(x_assinatura, config_posicoes["data_y"], f"CURITIBA, PR, {data_receita}")
-    c.drawCentredString(x_assinatura, config_posicoes["mv_y"], f"M. V. {nome_vet_up}")
-    c.drawCentredString(x_assinatura, config_posicoes["crmv_y"], f"CRMV-PR: {crmv}")
-
-    # >>> ALTERAÇÃO AQUI: Exibe "Reg. SIPEAGRO nº:" abaixo do CRMV <<<
-    if mostrar_sipeagro and sipeagro:
-        c.drawCentredString(
-            x_assinatura,
-            config_posicoes["sipeagro_y"],
-            f"Reg. SIPEAGRO nº: {sipeagro}"
+    if HISTORICO_BACKEND == "sqlite":
+        return historico_db.consultar(
+            _caminho_historico_db(login),
+            paciente=paciente,
+            tutor=tutor,
+            cpf=cpf,
+            controlado=controlado,
+            data_inicio=data_inicio,
+            data_fim=data_fim,
+            pagina=pagina,
+            tamanho_pagina=tamanho_pagina
         )
 
-    c.showPage()
-    c.save()
-    return nome_pdf
+    # Backend em log: filtra em memória (a renderização continua limitada à página)
+    paciente = historico_db.normalizar_chave(paciente)
+    tutor = historico_db.normalizar_chave(tutor)
+    cpf = re.sub(r'\D', '', cpf or "")
+    inicio = historico_db.data_iso(data_inicio) if data_inicio else ""
+    fim = historico_db.data_iso(data_fim) if data_fim else ""
+    filtrados = []
+    for idx, registro in enumerate(carregar_historico(login)):
+        if paciente and not historico_db.normalizar_chave(registro.get("Nome do Paciente", "")).startswith(paciente):
+            continue
+        if tutor and not historico_db.normalizar_chave(registro.get("Nome do Tutor", "")).startswith(tutor):
+            continue
+        if cpf and not re.sub(r'\D', '', registro.get("CPF do Tutor", "")).startswith(cpf):
+            continue
+        if controlado is not None and (registro.get("Medicamento Controlado", "Não") == "Sim") != controlado:
+            continue
+        data = historico_db.data_iso(registro.get("Data Emitida", ""))
+        if (inicio and data < inicio) or (fim and data > fim):
+            continue
+        filtrados.append((data, idx, registro))
+    filtrados.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    pagina = max(1, int(pagina))
+    inicio_pagina = (pagina - 1) * tamanho_pagina
+    pagina_atual = filtrados[inicio_pagina:inicio_pagina + tamanho_pagina]
+    return [(idx, registro) for _, idx, registro in pagina_atual], len(filtrados)
 
 # ----------------------------------------------
 # FUNÇÕES DE TELA
@@ -488,8 +249,8 @@ def tela_perfil():
     fundo_file = st.file_uploader("Upload da Imagem de Fundo (opcional)", type=["png", "jpg", "jpeg"], key="fundo_file")
     if fundo_file is not None:
         fundo_path = os.path.join(user_folder, "fundo_" + fundo_file.name)
-        with open(fundo_path, "wb") as f:
-            f.write(fundo_file.getvalue())
+        gravar_bytes_atomico(fundo_path, fundo_file.getvalue())
+        invalidar_imagem(fundo_path)
         atualizar_imagem_usuario(st.session_state.usuario_logado["login"], fundo_path, tipo="fundo")
         st.success("Imagem de fundo atualizada com sucesso!")
         st.session_state.usuario_logado["fundo"] = fundo_path
@@ -497,8 +258,8 @@ def tela_perfil():
     assinatura_file = st.file_uploader("Upload da Assinatura (opcional)", type=["png", "jpg", "jpeg"], key="assinatura_file")
     if assinatura_file is not None:
         assinatura_path = os.path.join(user_folder, "assinatura_" + assinatura_file.name)
-        with open(assinatura_path, "wb") as f:
-            f.write(assinatura_file.getvalue())
+        gravar_bytes_atomico(assinatura_path, assinatura_file.getvalue())
+        invalidar_imagem(assinatura_path)
         atualizar_imagem_usuario(st.session_state.usuario_logado["login"], assinatura_path, tipo="assinatura")
         st.success("Assinatura atualizada com sucesso!")
         st.session_state.usuario_logado["assinatura"] = assinatura_path
@@ -512,6 +273,15 @@ def tela_perfil():
     sipeagro_logado = st.session_state.usuario_logado.get("sipeagro") or "Não definido"
     st.write("**Sipeagro:**", sipeagro_logado)
 
+@st.fragment(run_every=0.5)
+def _aguardar_busca_cep():
+    # Reexecuta só este trecho a cada meio segundo enquanto a busca do CEP roda
+    # em segundo plano; quando termina, reexecuta a página para usar o endereço.
+    futuro = st.session_state.get("cep_futuro")
+    if futuro is None or futuro.done():
+        st.rerun()
+    st.info("Buscando o endereço do CEP... Você pode continuar preenchendo a receita.")
+
 def tela_receita():
     st.subheader("Criar Receituário")
     if "lista_medicamentos" not in st.session_state:
@@ -540,15 +310,25 @@ def tela_receita():
             cep_digitado = st.text_input("CEP do Tutor(a):", value=st.session_state.cep_tutor, help="Digite o CEP sem hífen, por exemplo: 12345678", key="cep_tutor_input")
             if cep_digitado != st.session_state.cep_tutor:
                 st.session_state.cep_tutor = cep_digitado
+                st.session_state.cep_futuro = None
                 if re.fullmatch(r'\d{8}', cep_digitado):
-                    dados_end = buscar_endereco_via_cep(cep_digitado)
+                    # A busca roda em segundo plano; o resultado é conferido abaixo a cada execução
+                    st.session_state.end_busca = {}
+                    st.session_state.cep_futuro = iniciar_busca_cep(cep_digitado)
+                elif cep_digitado.strip():
+                    st.warning("CEP inválido. Deve conter exatamente 8 dígitos.")
+            futuro_cep = st.session_state.get("cep_futuro")
+            if futuro_cep is not None:
+                if futuro_cep.done():
+                    st.session_state.cep_futuro = None
+                    dados_end = futuro_cep.result()
                     st.session_state.end_busca = dados_end
                     if dados_end:
                         st.success(f"Endereço encontrado: {dados_end.get('logradouro')}, {dados_end.get('bairro')}, {dados_end.get('localidade')}-{dados_end.get('uf')}")
                     else:
                         st.warning("CEP não encontrado. Por favor, preencha o endereço manualmente ou verifique o CEP.")
-                elif cep_digitado.strip():
-                    st.warning("CEP inválido. Deve conter exatamente 8 dígitos.")
+                else:
+                    _aguardar_busca_cep()
             dados_cep = st.session_state.end_busca if st.session_state.end_busca else {}
             if dados_cep:
                 logradouro = dados_cep.get("logradouro", "")
@@ -663,7 +443,7 @@ def tela_receita():
         # Controlar se exibe ou não o Sipeagro
         mostrar_sipeagro = (eh_controlado == "Sim")
 
-        nome_pdf = gerar_pdf_receita(
+        pdf_bytes = gerar_pdf_receita(
             nome_pdf=nome_pdf,
             tipo_farmacia=tipo_farmacia,
             paciente=paciente,
@@ -685,15 +465,16 @@ def tela_receita():
             crmv=crmv,
             sipeagro=sipeagro,
             mostrar_sipeagro=mostrar_sipeagro,
-            data_receita=data_receita_str
+            data_receita=data_receita_str,
+            usar_timbrado=True,
+            em_memoria=True,
+            avisar=st.warning
         )
 
-        # Download do PDF
-        with open(nome_pdf, "rb") as f:
-            st.download_button(label="Baixar Receita", data=f, file_name=nome_pdf, mime="application/pdf")
+        # Download do PDF (gerado em memória, sem arquivo no diretório de trabalho)
+        st.download_button(label="Baixar Receita", data=pdf_bytes, file_name=nome_pdf, mime="application/pdf")
 
         # Salvando no histórico
-        historico = carregar_historico(st.session_state.usuario_logado["login"])
         registro = {
             "Nome do Paciente": paciente,
             "CPF do Tutor": cpf_formatado,
@@ -711,8 +492,7 @@ def tela_receita():
         }
         if eh_controlado == "Sim":
             registro["Endereço"] = endereco_formatado
-        historico.append(registro)
-        salvar_historico(st.session_state.usuario_logado["login"], historico)
+        registrar_no_historico(st.session_state.usuario_logado["login"], registro)
 
         st.success("Prescrição gerada e adicionada ao histórico com sucesso!")
 
@@ -722,11 +502,42 @@ def tela_receita():
 def tela_historico():
     st.subheader("Histórico de Prescrições")
     login = st.session_state.usuario_logado["login"]
-    historico = carregar_historico(login)
-    if not historico:
+    if "historico_pagina" not in st.session_state:
+        st.session_state.historico_pagina = 1
+
+    # Filtros aplicados no backend: só a página atual é carregada e renderizada
+    with st.form(key="form_filtros_historico"):
+        f1, f2, f3 = st.columns(3)
+        filtro_paciente = f1.text_input("Paciente (início do nome):", key="filtro_paciente")
+        filtro_tutor = f2.text_input("Tutor (início do nome):", key="filtro_tutor")
+        filtro_cpf = f3.text_input("CPF do Tutor (início):", key="filtro_cpf")
+        f4, f5, f6, f7 = st.columns(4)
+        filtro_controlado = f4.selectbox("Medicamento Controlado?", ("Todos", "Sim", "Não"), key="filtro_controlado")
+        filtro_data_inicio = f5.date_input("Data inicial:", value=None, format="DD/MM/YYYY", key="filtro_data_inicio")
+        filtro_data_fim = f6.date_input("Data final:", value=None, format="DD/MM/YYYY", key="filtro_data_fim")
+        tamanho_pagina = f7.selectbox("Itens por página:", (10, 20, 50, 100), index=1, key="historico_tamanho_pagina")
+        if st.form_submit_button("Filtrar"):
+            st.session_state.historico_pagina = 1
+
+    filtros = {
+        "paciente": filtro_paciente,
+        "tutor": filtro_tutor,
+        "cpf": filtro_cpf,
+        "controlado": None if filtro_controlado == "Todos" else (filtro_controlado == "Sim"),
+        "data_inicio": filtro_data_inicio,
+        "data_fim": filtro_data_fim
+    }
+    pagina = st.session_state.historico_pagina
+    registros, total = consultar_historico(login, pagina=pagina, tamanho_pagina=tamanho_pagina, **filtros)
+    if not total:
         st.info("Nenhuma prescrição encontrada no histórico.")
         return
 
+    total_paginas = (total + tamanho_pagina - 1) // tamanho_pagina
+    if pagina > total_paginas:
+        st.session_state.historico_pagina = pagina = total_paginas
+        registros, total = consultar_historico(login, pagina=pagina, tamanho_pagina=tamanho_pagina, **filtros)
+
     col1, col2, col3, col4, col5, col6 = st.columns([2, 2, 2, 2, 2, 1])
     col1.markdown("**Paciente**")
     col2.markdown("**CPF Tutor**")
@@ -735,17 +546,27 @@ def tela_historico():
     col5.markdown("**Data**")
     col6.markdown("**Detalhes**")
 
-    for idx, registro in enumerate(historico):
+    for id_registro, registro in registros:
         col1, col2, col3, col4, col5, col6 = st.columns([2, 2, 2, 2, 2, 1])
         col1.write(registro.get("Nome do Paciente", ""))
         col2.write(registro.get("CPF do Tutor", ""))
         col3.write(registro.get("Nome do Tutor", ""))
         col4.write(registro.get("Medicamento Controlado", ""))
         col5.write(registro.get("Data Emitida", ""))
-        if col6.button("Ver", key=f"ver_{idx}"):
+        if col6.button("Ver", key=f"ver_{id_registro}"):
             st.session_state.detalhe = registro
             st.session_state.current_page = "Detalhes"
 
+    # Navegação entre páginas
+    nav1, nav2, nav3 = st.columns([1, 3, 1])
+    if nav1.button("Anterior", disabled=pagina <= 1):
+        st.session_state.historico_pagina = pagina - 1
+        st.rerun()
+    nav2.write(f"Página {pagina} de {total_paginas} ({total} prescrições)")
+    if nav3.button("Próxima", disabled=pagina >= total_paginas):
+        st.session_state.historico_pagina = pagina + 1
+        st.rerun()
+
 def tela_detalhes():
     st.subheader("Detalhes da Prescrição")
     registro = st.session_state.get("detalhe", None)
@@ -785,9 +606,15 @@ def tela_detalhes():
     if st.button("Voltar"):
         st.session_state.current_page = "Histórico"
 
+@st.cache_resource(show_spinner=False)
+def _aquecer_renderizacao():
+    # Uma vez por processo do Streamlit (e não a cada rerun do script).
+    return aquecer()
+
 def main():
     st.set_page_config(layout="wide")
     st.title("VetyRx - Receituário Veterinário")
+    _aquecer_renderizacao()
 
     if "autenticado" not in st.session_state:
         st.session_state.autenticado = False